@@ -0,0 +1,261 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from mangadex import Chapter
+
+# At-home server leases of the chapters being downloaded
+
+# The at-home urls are valid for 15 minutes,
+# a lease is renewed a minute early so no request races the expiry
+LEASE_SECONDS = 15 * 60
+LEASE_MARGIN = 60
+
+# The MangaDex origin, serves every page when the at-home nodes can't
+ORIGIN_URL = "https://uploads.mangadex.org"
+
+
+class ChapterLease:
+    """
+    The at-home server handed out for a chapter and the page urls built from it.
+    obtained records when the server was handed out, the urls stop working after
+    LEASE_SECONDS and the lease has to be renewed. Every renewal bumps the generation,
+    so the tasks that hit the same expired lease only renew it once.
+    """
+
+    def __init__(
+        self, chapter, data_saver=False, lease_seconds=LEASE_SECONDS - LEASE_MARGIN
+    ):
+        self.chapter = chapter
+        # the compressed (/data-saver) images instead of the originals (/data)
+        self.data_saver = data_saver
+        self.lease_seconds = lease_seconds
+        self.urls = []
+        self.obtained = None
+        self.generation = 0
+        self.renewals = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Requests an at-home server for the chapter (/at-home/server/{chapter_id})
+        """
+        urls = Chapter.fetch_chapter_images(self.chapter, data_saver=self.data_saver)
+        with self._lock:
+            self.urls = urls
+            self.obtained = time.monotonic()
+        return self
+
+    @property
+    def age(self):
+        return time.monotonic() - self.obtained if self.obtained else 0
+
+    @property
+    def expired(self):
+        return self.obtained is not None and self.age >= self.lease_seconds
+
+    def renew(self, generation):
+        """
+        Requests a new at-home server, unless the lease was already renewed
+        since the given generation. Returns the current generation
+        """
+        with self._lock:
+            if generation != self.generation:
+                return self.generation
+            self.urls = Chapter.fetch_chapter_images(
+                self.chapter, data_saver=self.data_saver
+            )
+            self.obtained = time.monotonic()
+            self.generation += 1
+            self.renewals += 1
+            return self.generation
+
+    def fail_over(self, generation, bad_host):
+        """
+        Moves the lease away from a failing node: requests a new at-home server,
+        and if that fails or hands out the same node, falls back to the origin.
+        Does nothing if the lease already moved since the given generation.
+        Returns the current generation
+        """
+        with self._lock:
+            if generation != self.generation:
+                return self.generation
+            try:
+                urls = Chapter.fetch_chapter_images(
+                    self.chapter, data_saver=self.data_saver
+                )
+            except Exception:
+                urls = None
+            origin_host = urlparse(ORIGIN_URL).netloc
+            if not urls or (
+                urlparse(urls[0]).netloc == bad_host and bad_host != origin_host
+            ):
+                urls = self.origin_urls()
+            self.urls = urls
+            self.obtained = time.monotonic()
+            self.generation += 1
+            self.failovers += 1
+            return self.generation
+
+    def origin_urls(self):
+        """
+        Returns the page urls of the chapter on the origin
+        """
+        if self.data_saver:
+            return [
+                f"{ORIGIN_URL}/data-saver/{self.chapter.hash}/{filename}"
+                for filename in self.chapter.dataSaver
+            ]
+        return [
+            f"{ORIGIN_URL}/data/{self.chapter.hash}/{filename}"
+            for filename in self.chapter.data
+        ]
+
+    @property
+    def host(self):
+        return urlparse(self.urls[0]).netloc if self.urls else None
+
+    def url_for(self, index):
+        return self.urls[index]
+
+
+class NodeHealth:
+    """
+    Latency, throughput and error rate of every image node seen by the downloader.
+    A node is degraded when, over its last window requests, more than max_error_rate
+    of them failed, or the pages came in slower than min_speed bytes per second.
+    """
+
+    def __init__(self, window=20, min_samples=5, max_error_rate=0.3, min_speed=0):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.min_speed = min_speed
+        self._samples = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds, size, ok):
+        """
+        Records a request to a node: how long it took, the bytes received and
+        whether it succeeded
+        """
+        with self._lock:
+            if host not in self._samples:
+                self._samples[host] = deque(maxlen=self.window)
+                self._totals[host] = {
+                    "requests": 0,
+                    "errors": 0,
+                    "bytes": 0,
+                    "seconds": 0.0,
+                }
+            self._samples[host].append((ok, seconds, size))
+            totals = self._totals[host]
+            totals["requests"] += 1
+            totals["errors"] += 0 if ok else 1
+            totals["bytes"] += size
+            totals["seconds"] += seconds
+
+    def is_degraded(self, host):
+        with self._lock:
+            samples = list(self._samples.get(host, ()))
+        if len(samples) < self.min_samples:
+            return False
+        errors = len([sample for sample in samples if not sample[0]])
+        if errors / len(samples) > self.max_error_rate:
+            return True
+        seconds = sum(sample[1] for sample in samples if sample[0])
+        size = sum(sample[2] for sample in samples if sample[0])
+        return bool(self.min_speed) and seconds > 0 and size / seconds < self.min_speed
+
+    def stats(self):
+        """
+        Returns the requests, error rate, average latency and throughput of every node
+        """
+        with self._lock:
+            totals = {host: dict(values) for host, values in self._totals.items()}
+        stats = {}
+        for host, values in totals.items():
+            requests = values["requests"]
+            stats[host] = {
+                "requests": requests,
+                "errors": values["errors"],
+                "error_rate": values["errors"] / requests if requests else 0,
+                "average_latency": values["seconds"] / requests if requests else 0,
+                "throughput": values["bytes"] / values["seconds"]
+                if values["seconds"]
+                else 0,
+                "degraded": self.is_degraded(host),
+            }
+        return stats
+
+
+class LeasePrefetcher:
+    """
+    Gets the at-home leases of the upcoming chapters in the background,
+    so the downloads don't wait for an /at-home/server request at every chapter.
+    A single worker requests them in order, within the at-home rate limit.
+    """
+
+    def __init__(self, lookahead=2, data_saver=False):
+        self.lookahead = lookahead
+        self.data_saver = data_saver
+        self.prefetched = 0
+        self.waited = 0.0
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _submit(self, chapter):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="lease"
+            )
+        self._futures[chapter.chapter_id] = self._executor.submit(
+            ChapterLease(chapter, data_saver=self.data_saver).acquire
+        )
+
+    def prefetch(self, chapters):
+        """
+        Queues the leases of the first chapter and of the lookahead chapters after it
+        """
+        with self._lock:
+            for chapter in chapters[: self.lookahead + 1]:
+                if chapter.chapter_id not in self._futures:
+                    self._submit(chapter)
+
+    def get(self, chapter):
+        """
+        Returns the lease of a chapter, waiting for it if it's still being requested.
+        Raises the error of the request if it failed
+        """
+        with self._lock:
+            future = self._futures.pop(chapter.chapter_id, None)
+            if future is None:
+                self._submit(chapter)
+                future = self._futures.pop(chapter.chapter_id)
+            elif future.done():
+                self.prefetched += 1
+        start = time.perf_counter()
+        lease = future.result()
+        self.waited += time.perf_counter() - start
+        return lease
+
+    def discard(self):
+        """
+        Drops the leases that weren't used, the ones not requested yet are cancelled
+        """
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures = {}
+
+    def close(self):
+        self.discard()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
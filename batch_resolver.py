@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import mangadex
+
+import mangadex_volume_packer as packer
+from title_matcher import TitleMatcher, get_manga_titles, normalize_title
+
+# Resolves a file of series titles (one per line) to their manga ids,
+# so the packer can run unattended afterwards.
+# Every title is looked up in the title index first, then searched on MangaDex
+# under the shared rate limit, the searches go through the response cache.
+# EX: python batch_resolver.py titles.txt --output series_mapping.json
+
+
+def read_titles(titles_path):
+    """
+    Returns the titles of the file without the duplicates, the first spelling of
+    every normalized title is kept. Empty lines and # comments are skipped
+    """
+    titles = {}
+    with open(titles_path, "r", encoding="utf-8") as f:
+        for line in f:
+            title = line.strip()
+            if not title or title.startswith("#"):
+                continue
+            key = normalize_title(title.replace(":", " - "))
+            if key and key not in titles:
+                titles[key] = title
+    return list(titles.values())
+
+
+def resolve_title(api, title, required_score, language):
+    """
+    Resolves a title to the series best matching it.
+    Returns a dict with the manga_id (None when nothing matched), the matched title,
+    the score and the source of the match ("index" or "search")
+    """
+    compare_title = title.replace(":", " - ")
+    resolution = {
+        "search": title,
+        "manga_id": None,
+        "title": None,
+        "score": 0.0,
+        "source": None,
+        "candidates": 0,
+    }
+
+    if packer.title_index is not None:
+        match = packer.title_index.lookup(
+            compare_title, required_score, original_language=language
+        )
+        if match:
+            manga, score = match
+            resolution.update(
+                manga_id=manga.manga_id,
+                title=get_manga_titles(manga)[0],
+                score=score,
+                source="index",
+                candidates=1,
+            )
+            return resolution
+
+    series = api.get_manga_list(
+        title=title, limit=packer.limit, offset=0, originalLanguage=[language]
+    )
+    resolution["source"] = "search"
+    if packer.title_index is not None:
+        packer.title_index.add_series(series)
+
+    matches = TitleMatcher(compare_title, required_score).rank(series)
+    resolution["candidates"] = len(matches)
+    if matches:
+        manga, score, matched_title = matches[0]
+        resolution.update(manga_id=manga.manga_id, title=matched_title, score=score)
+    return resolution
+
+
+def write_mapping(mapping_path, resolutions):
+    """
+    Writes the mapping file atomically (temp file + rename)
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(mapping_path)), exist_ok=True)
+    temp_path = f"{mapping_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(resolutions, f, indent=1, ensure_ascii=False)
+    os.replace(temp_path, mapping_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resolves a file of series titles to their MangaDex ids."
+    )
+    parser.add_argument("titles", help="A text file with one series title per line")
+    parser.add_argument("--output", default="series_mapping.json")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--min-score", type=float, default=packer.requried_similarity_score
+    )
+    parser.add_argument(
+        "--language",
+        default=packer.language,
+        help="The original language of the series",
+    )
+    args = parser.parse_args()
+    packer.setup_api()
+
+    titles = read_titles(args.titles)
+    print(f"Resolving {len(titles)} titles with {args.workers} workers...")
+
+    start = time.perf_counter()
+    api = mangadex.Api()
+    resolutions = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(
+                resolve_title, api, title, args.min_score, args.language
+            ): title
+            for title in titles
+        }
+        for future in as_completed(futures):
+            title = futures[future]
+            try:
+                resolution = future.result()
+            except Exception as e:
+                resolution = {"search": title, "manga_id": None, "error": str(e)}
+            resolutions[title] = resolution
+            if resolution.get("error"):
+                print(f"\t{title}: ERROR: {resolution['error']}")
+            elif resolution["manga_id"] is None:
+                print(f"\t{title}: no match")
+            else:
+                print(
+                    f"\t{title}: {resolution['title']} ({resolution['score']:.4f}, "
+                    f"{resolution['source']})"
+                )
+
+    if packer.title_index is not None:
+        packer.title_index.save()
+
+    # in the order of the titles file
+    write_mapping(args.output, [resolutions[title] for title in titles])
+
+    resolved = len([r for r in resolutions.values() if r["manga_id"]])
+    print(
+        f"\nResolved {resolved}/{len(titles)} titles "
+        f"in {time.perf_counter() - start:.2f}s, mapping written to {args.output}"
+    )
+    packer.print_rate_limit_stats()
+    packer.print_cache_stats()
+    packer.print_title_index_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import os
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# CBZ writers used by the volume packer
+
+# Formats that are already compressed, deflating them burns CPU for ~0% gain
+COMPRESSED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".avif", ".jxl"}
+
+
+class PackingPolicy:
+    """
+    Chooses the compression of every CBZ entry:
+    stored for already compressed images, deflated for everything else (metadata, text).
+    """
+
+    def __init__(self, compress_level=6, stored_extensions=COMPRESSED_EXTENSIONS):
+        self.compress_level = compress_level
+        self.stored_extensions = {extension.lower() for extension in stored_extensions}
+
+    def compression_for(self, name):
+        """
+        Returns the compress_type and compresslevel for an entry name
+        """
+        _, extension = os.path.splitext(name)
+        if extension.lower() in self.stored_extensions:
+            return zipfile.ZIP_STORED, None
+        return zipfile.ZIP_DEFLATED, self.compress_level
+
+
+class PackReport:
+    """
+    Bytes saved and CPU spent while packing a volume
+    """
+
+    def __init__(self):
+        self.stored = 0
+        self.deflated = 0
+        self.raw_bytes = 0
+        self.packed_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def add(self, info, cpu_seconds):
+        if info.compress_type == zipfile.ZIP_STORED:
+            self.stored += 1
+        else:
+            self.deflated += 1
+        self.raw_bytes += info.file_size
+        self.packed_bytes += info.compress_size
+        self.cpu_seconds += cpu_seconds
+
+    @property
+    def entries(self):
+        return self.stored + self.deflated
+
+    @property
+    def saved_bytes(self):
+        return self.raw_bytes - self.packed_bytes
+
+    def summary(self):
+        return (
+            f"{self.entries} files ({self.stored} stored, {self.deflated} deflated), "
+            f"{self.raw_bytes} -> {self.packed_bytes} bytes, "
+            f"saved {self.saved_bytes} bytes using {self.cpu_seconds:.3f}s of CPU"
+        )
+
+
+def write_entry(cbz, name, data, policy, report):
+    """
+    Writes bytes into an open CBZ following the packing policy
+    """
+    compress_type, compress_level = policy.compression_for(name)
+    start = time.thread_time()
+    cbz.writestr(name, data, compress_type=compress_type, compresslevel=compress_level)
+    report.add(cbz.getinfo(name), time.thread_time() - start)
+
+
+def pack_folder(folder_path, file_list, cbz_path, policy, comment=None):
+    """
+    Packs the files of a volume folder into a CBZ, in the given order.
+    Returns the PackReport of the volume
+    """
+    report = PackReport()
+    with zipfile.ZipFile(cbz_path, "w") as cbz:
+        if comment:
+            cbz.comment = comment.encode("utf-8")
+        for file in file_list:
+            compress_type, compress_level = policy.compression_for(file)
+            start = time.thread_time()
+            cbz.write(
+                os.path.join(folder_path, file),
+                file,
+                compress_type=compress_type,
+                compresslevel=compress_level,
+            )
+            report.add(cbz.getinfo(file), time.thread_time() - start)
+    return report
+
+
+class StreamingCBZWriter:
+    """
+    Writes pages straight into a CBZ, without a temporary volume folder.
+    Pages can be added in any order, they are held in a reorder buffer
+    until every page before them has been written, so the entries always
+    end up in page order. The CBZ is written to a .part file and renamed
+    once closed, so a partial CBZ never looks finished.
+    """
+
+    def __init__(self, cbz_path, first_index=0, policy=None, comment=None):
+        self.cbz_path = cbz_path
+        self.part_path = f"{cbz_path}.part"
+        self.next_index = first_index
+        self.policy = policy or PackingPolicy()
+        self.report = PackReport()
+        self.written = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._zip = zipfile.ZipFile(self.part_path, "w")
+        if comment:
+            self._zip.comment = comment.encode("utf-8")
+
+    def add(self, index, name, data):
+        """
+        Adds the page at position index, writing it and any buffered pages that follow it
+        """
+        with self._lock:
+            self._pending[index] = (name, data)
+            while self.next_index in self._pending:
+                name, data = self._pending.pop(self.next_index)
+                write_entry(self._zip, name, data, self.policy, self.report)
+                self.written += 1
+                self.next_index += 1
+
+    @property
+    def buffered(self):
+        return len(self._pending)
+
+    def close(self):
+        """
+        Finishes the CBZ and moves it into place,
+        fails if pages are still waiting for a missing page
+        """
+        with self._lock:
+            if self._pending:
+                missing = self.next_index
+                self._abort()
+                raise ValueError(f"Page {missing} was never added to {self.cbz_path}")
+            self._zip.close()
+            os.replace(self.part_path, self.cbz_path)
+
+    def abort(self):
+        """
+        Discards the partial CBZ
+        """
+        with self._lock:
+            self._abort()
+
+    def _abort(self):
+        self._pending = {}
+        self._zip.close()
+        if os.path.isfile(self.part_path):
+            os.remove(self.part_path)
+
+
+class PackResult:
+    """
+    Outcome and per stage timing of a volume packed by the PackingPipeline
+    """
+
+    def __init__(self, cbz_path):
+        self.cbz_path = cbz_path
+        self.report = None
+        self.pack_seconds = 0.0
+        self.verify_seconds = 0.0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def pack_and_verify_folder(folder_path, file_list, cbz_path, policy, comment=None):
+    """
+    Packs a volume folder into a .part CBZ, verifies it and moves it into place,
+    then deletes the folder. Runs inside the PackingPipeline workers.
+    Returns a PackResult
+    """
+    result = PackResult(cbz_path)
+    part_path = f"{cbz_path}.part"
+    try:
+        start = time.perf_counter()
+        result.report = pack_folder(
+            folder_path, file_list, part_path, policy, comment=comment
+        )
+        result.pack_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with zipfile.ZipFile(part_path) as cbz:
+            bad_file = cbz.testzip()
+            names = cbz.namelist()
+        result.verify_seconds = time.perf_counter() - start
+        if bad_file is not None:
+            raise ValueError(f"Bad CRC for {bad_file}")
+        if names != list(file_list):
+            raise ValueError(f"{len(names)} of {len(file_list)} files were packed")
+
+        os.replace(part_path, cbz_path)
+        shutil.rmtree(folder_path)
+    except Exception as e:
+        result.error = str(e)
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+    return result
+
+
+class PackingPipeline:
+    """
+    Packs finished volume folders in a pool of worker processes (or threads),
+    so the download of the next volume doesn't wait for the packing of the previous one.
+    """
+
+    def __init__(self, workers=2, use_processes=True, policy=None):
+        self.policy = policy or PackingPolicy()
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self._executor = executor_class(max_workers=workers)
+        self._futures = {}
+
+    def submit(self, label, folder_path, file_list, cbz_path, comment=None):
+        """
+        Queues a volume folder for packing, label identifies it in the results
+        """
+        future = self._executor.submit(
+            pack_and_verify_folder,
+            folder_path,
+            file_list,
+            cbz_path,
+            self.policy,
+            comment,
+        )
+        self._futures[future] = label
+        return future
+
+    def results(self):
+        """
+        Waits for the queued volumes, yields (label, PackResult) as they finish
+        """
+        futures, self._futures = self._futures, {}
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                yield label, future.result()
+            except Exception as e:
+                result = PackResult(None)
+                result.error = str(e)
+                yield label, result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -14,9 +14,18 @@ from .errors import (
     CoverArtError,
 )
 
+from .session import SessionPool
+
+from .rate_limit import RateLimiter, TokenBucket
+
+from .retry import RetryPolicy
+
+from .cache import ResponseCache
+
 from .url_models import URLRequest
 
 from .models import (
+    PaginatedList,
     Manga,
     Tag,
     Chapter,
@@ -29,6 +38,8 @@ from .models import (
 
 from .api import Api
 
+from .async_api import AsyncApi
+
 __author__ = "Eduardo Ceja"
 __version__ = "2.6.1"
 __license__ = "MIT"
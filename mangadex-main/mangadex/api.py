@@ -2,9 +2,11 @@
 Wrapper for the mangadex API
 """
 from __future__ import absolute_import
-from typing import Dict, List, Union, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Union, Any
 
 from mangadex import (
+    PaginatedList,
     Manga,
     Tag,
     Chapter,
@@ -33,7 +35,14 @@ class Api:
         self.bearer = bearer
 
     @staticmethod
-    def __parse_manga_params(params: dict) -> dict:
+    def _parse_order(params: dict) -> dict:
+        if "order" in params:
+            for key, value in params.pop("order").items():
+                params[f"order[{key}]"] = value
+        return params
+
+    @staticmethod
+    def _parse_manga_params(params: dict) -> dict:
         if "authors" in params:
             temp = params.pop("authors")
             params["authors[]"] = temp
@@ -74,7 +83,58 @@ class Api:
             params["status[]"] = params.pop("status")
         if "contentRating" in params:
             params["contentRating[]"] = params.pop("contentRating")
-        return params
+        return Api._parse_order(params)
+
+    @staticmethod
+    def _parse_feed_params(params: dict) -> dict:
+        for key in (
+            "translatedLanguage",
+            "originalLanguage",
+            "excludedOriginalLanguage",
+            "contentRating",
+            "excludedGroups",
+            "excludedUploaders",
+            "includes",
+        ):
+            if key in params:
+                params[f"{key}[]"] = params.pop(key)
+        return Api._parse_order(params)
+
+    @staticmethod
+    def get_all_pages(
+        list_method: Callable[..., PaginatedList], max_workers: int = 4, **kwargs
+    ) -> PaginatedList:
+        """
+        Gets every page of a list method.
+        The first page gives the total, the remaining offsets are then requested
+        concurrently (within the rate limit) and no trailing empty page is requested
+
+        Parameters
+        -------------
+        list_method : A method returning a `PaginatedList`, like `Api.chapter_list`
+        max_workers : `int`. The number of pages requested at the same time
+        kwargs : The parameters of the list method
+
+        Returns
+        -------------
+        `PaginatedList`. The results of all the pages, in order
+        """
+        first_page = list_method(**dict(kwargs))
+        results = PaginatedList(
+            first_page,
+            total=first_page.total,
+            limit=first_page.limit,
+            offset=first_page.offset,
+        )
+        offsets = first_page.remaining_offsets()
+        if offsets:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pages = executor.map(
+                    lambda offset: list_method(**dict(kwargs, offset=offset)), offsets
+                )
+                for page in pages:
+                    results.extend(page)
+        return results
 
     def get_manga_list(self, **kwargs) -> List[Manga]:
         """
@@ -102,17 +162,18 @@ class Api:
         contentRating : `List[str]`. Items Enum : `"safe"` `"suggestive"` `"erotica"` `"pornographic"`
         createdAtSince : `str`. Datetime String with the following format YYYY-MM-DDTHH:MM:SS
         updatedAtSince : `str`. Datetime String with the following format YYYY-MM-DDTHH:MM:SS
+        order : `Dict[str, str]`. EX: `{"relevance": "desc"}`
 
         Returns
         -------------
-        `List[Manga]`. A list of Manga objects
+        `PaginatedList[Manga]`. A list of Manga objects with the `total`, `limit` and `offset` of the response
 
         Raises
         -------------
         `ApiError` `MangaError`
         """
         params = kwargs
-        params = Api.__parse_manga_params(params)
+        params = Api._parse_manga_params(params)
         url = f"{self.URL}/manga"
         resp = URLRequest.request_url(url, "GET", params=params, timeout=self.timeout)
         return Manga.create_manga_list(resp)
@@ -181,7 +242,7 @@ class Api:
         ------------
         `Manga`. A manga object if `ObjReturn` is set to `True`
         """
-        params = self.__parse_manga_params(kwargs)
+        params = self._parse_manga_params(kwargs)
         url = f"{self.URL}/manga"
         params["title"] = title
         resp = URLRequest.request_url(
@@ -242,7 +303,7 @@ class Api:
         ------------
         `Manga`. A manga object if `ObjReturn` is set to `True`
         """
-        kwargs = self.__parse_manga_params(kwargs)
+        kwargs = self._parse_manga_params(kwargs)
         url = f"{self.URL}/manga/{manga_id}"
         resp = URLRequest.request_url(
             url, "PUT", params=kwargs, headers=self.bearer, timeout=self.timeout
@@ -307,35 +368,45 @@ class Api:
 
         ### QueryParams:
 
-        limit : `int`
+        limit : `int`. Up to 500
         offset : `int`
         translatedLanguage : `List[str]`. The translated laguages to query
+        originalLanguage : `List[str]`
+        excludedOriginalLanguage : `List[str]`
+        contentRating : `List[str]`. Items Enum : `"safe"` `"suggestive"` `"erotica"` `"pornographic"`
+        excludedGroups : `List[str]`
+        excludedUploaders : `List[str]`
+        order : `Dict[str, str]`. EX: `{"volume": "asc", "chapter": "asc"}`
         createdAtSince : `str`. Datetime String with the following format YYYY-MM-DDTHH:MM:SS
         updatedAtSince : `str`. Datetime String with the following format YYYY-MM-DDTHH:MM:SS
 
         Returns
         -------------
-        `List[Chapter]` A list of Chapter Objects
+        `PaginatedList[Chapter]` A list of Chapter Objects with the `total`, `limit` and `offset` of the response
 
         Raises
         -------------
         `ApiError` `ChapterError`
         """
-        kwargs = self.__parse_manga_params(kwargs)
+        kwargs = self._parse_feed_params(kwargs)
         url = f"{self.URL}/manga/{manga_id}/feed"
         resp = URLRequest.request_url(url, "GET", timeout=self.timeout, params=kwargs)
         return Chapter.create_chapter_list(resp)
 
     @staticmethod
-    def __parse_chapter_list_args(params: Dict[str, str]) -> Dict[str, str]:
+    def _parse_chapter_list_args(params: Dict[str, str]) -> Dict[str, str]:
+        if "ids" in params:
+            params["ids[]"] = params.pop("ids")
         if "groups" in params:
             params["groups[]"] = params.pop("groups")
         if "volume" in params:
             params["volume[]"] = params.pop("volume")
         if "translatedLanguage" in params:
             params["translatedLanguage[]"] = params.pop("translatedLanguage")
+        if "contentRating" in params:
+            params["contentRating[]"] = params.pop("contentRating")
 
-        return params
+        return Api._parse_order(params)
 
     def chapter_list(self, **kwargs) -> List[Chapter]:
         """
@@ -348,6 +419,7 @@ class Api:
 
         limit : `int`
         offset : `int`
+        ids : `List[str]`. Chapter ids, limited to 100 per call
         title : `str`
         groups : `List[str]`
         uploader : `str`
@@ -355,19 +427,21 @@ class Api:
         volume : `str | List[str]`
         chapter : `str`
         translatedLanguage : `List[str]`
+        contentRating : `List[str]`. Items Enum : `"safe"` `"suggestive"` `"erotica"` `"pornographic"`
         createdAtSince : `str`. Datetime String with the following format YYYY-MM-DDTHH:MM:SS
         updatedAtSince : `str`. Datetime String with the following format YYYY-MM-DDTHH:MM:SS
         publishAtSince : `str`. Datetime String with the following format YYYY-MM-DDTHH:MM:SS
+        order : `Dict[str, str]`. EX: `{"volume": "asc", "chapter": "asc"}`
 
         Returns
         ----------
-        `List[Chpater]` A list of Chpater Objects
+        `PaginatedList[Chpater]` A list of Chpater Objects with the `total`, `limit` and `offset` of the response
 
         Raises
         -------------
         `ApiError` `ChapterError`
         """
-        params = Api.__parse_chapter_list_args(kwargs)
+        params = Api._parse_chapter_list_args(kwargs)
         url = f"{self.URL}/chapter"
         resp = URLRequest.request_url(url, "GET", timeout=self.timeout, params=params)
         return Chapter.create_chapter_list(resp)
@@ -895,7 +969,7 @@ class Api:
         return CustomList.create_customlist_list(resp)
 
     @staticmethod
-    def __parse_coverart_params(params: Dict[str, str]) -> Dict[str, str]:
+    def _parse_coverart_params(params: Dict[str, str]) -> Dict[str, str]:
         if "manga" in params:
             params["manga[]"] = params.pop("manga")
         if "ids" in params:
@@ -914,8 +988,12 @@ class Api:
         manga : List[str]. Manga ids
         ids : List[str]. Cover ids
         uploaders : List[str]. User ids
+
+        Returns
+        --------------
+        `PaginatedList[CoverArt]`. A list of CoverArt objects with the `total`, `limit` and `offset` of the response
         """
-        params = Api.__parse_coverart_params(kwargs)
+        params = Api._parse_coverart_params(kwargs)
         url = f"{self.URL}/cover"
         resp = URLRequest.request_url(url, "GET", params=params, timeout=self.timeout)
         return CoverArt.create_coverart_list(resp)
@@ -0,0 +1,276 @@
+"""
+Asynchronous wrapper for the mangadex API
+"""
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Union
+
+import requests
+
+from mangadex import (
+    ApiError,
+    PaginatedList,
+    Manga,
+    Chapter,
+    CoverArt,
+    URLRequest,
+)
+from mangadex.api import Api
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncApi:
+    """
+    Asynchronous version of the read only calls of `Api`, on top of aiohttp.
+    Many series can be resolved concurrently on one event loop.
+
+    The responses are parsed into the same models as `Api`, and the requests share
+    the `rate_limiter` and `retry_policy` of `URLRequest` with the synchronous calls.
+
+    Requires the `async` extra: `pip install mangadex[async]`
+
+    EX:
+    ```
+    async with AsyncApi() as api:
+        mangas = await api.get_manga_list(title="Gal Assistant")
+    ```
+
+    Parameters
+    -------------
+    timeout : `float`. Seconds allowed for each request
+    limit_per_host : `int`. The number of connections kept open per host
+    """
+
+    def __init__(self, timeout: float = 5, limit_per_host: int = 10) -> None:
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncApi requires aiohttp, install it with: pip install mangadex[async]"
+            )
+        self.URL = "https://api.mangadex.org"
+        self.timeout = timeout
+        self.limit_per_host = limit_per_host
+        self.session = None
+
+    async def __aenter__(self) -> "AsyncApi":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def __get_session(self) -> "aiohttp.ClientSession":
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.limit_per_host),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @staticmethod
+    def __as_request_error(error: Exception) -> Exception:
+        # the retry policy knows the requests exceptions
+        if isinstance(error, asyncio.TimeoutError):
+            return requests.Timeout(error)
+        if isinstance(error, aiohttp.ClientConnectionError):
+            return requests.ConnectionError(error)
+        return error
+
+    async def request(
+        self, url: str, params: Union[Dict[str, Any], None] = None
+    ) -> dict:
+        """
+        Sends a `GET` request and returns the parsed JSON
+
+        Raises
+        -------------
+        `ApiError`
+        """
+        url = URLRequest._build_url(url, params or {})
+        attempt = 0
+        while True:
+            rate_limiter = URLRequest.rate_limiter
+            retry_policy = URLRequest.retry_policy
+            if rate_limiter is not None:
+                wait = rate_limiter.reserve(url)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                async with self.__get_session().get(url) as resp:
+                    if rate_limiter is not None:
+                        rate_limiter.update(url, resp.status, resp.headers)
+                    if resp.status >= 400:
+                        if retry_policy is not None and retry_policy.should_retry(
+                            "GET", attempt, status_code=resp.status
+                        ):
+                            await asyncio.sleep(
+                                retry_policy.backoff(attempt, resp.headers)
+                            )
+                            attempt += 1
+                            continue
+                        raise ApiError({"status": resp.status, "reason": resp.reason})
+                    content = await resp.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = AsyncApi.__as_request_error(e)
+                if retry_policy is not None and retry_policy.should_retry(
+                    "GET", attempt, error=error
+                ):
+                    await asyncio.sleep(retry_policy.backoff(attempt))
+                    attempt += 1
+                    continue
+                raise
+            data = json.loads(content)
+            URLRequest._check_api_error(data)
+            return data
+
+    @staticmethod
+    async def get_all_pages(
+        list_method: Callable[..., Awaitable[PaginatedList]], **kwargs
+    ) -> PaginatedList:
+        """
+        Gets every page of a list method, like `Api.get_all_pages`.
+        The remaining offsets are requested concurrently
+
+        Returns
+        -------------
+        `PaginatedList`. The results of all the pages, in order
+        """
+        first_page = await list_method(**dict(kwargs))
+        results = PaginatedList(
+            first_page,
+            total=first_page.total,
+            limit=first_page.limit,
+            offset=first_page.offset,
+        )
+        pages = await asyncio.gather(
+            *[
+                list_method(**dict(kwargs, offset=offset))
+                for offset in first_page.remaining_offsets()
+            ]
+        )
+        for page in pages:
+            results.extend(page)
+        return results
+
+    async def get_manga_list(self, **kwargs) -> PaginatedList:
+        """
+        Search a List of Manga, takes the parameters of `Api.get_manga_list`
+
+        Returns
+        -------------
+        `PaginatedList[Manga]`
+        """
+        params = Api._parse_manga_params(kwargs)
+        resp = await self.request(f"{self.URL}/manga", params)
+        return Manga.create_manga_list(resp)
+
+    async def view_manga_by_id(self, manga_id: str) -> Manga:
+        """
+        Get a Manga by its id
+
+        Returns
+        -------------
+        `Manga`
+        """
+        resp = await self.request(f"{self.URL}/manga/{manga_id}")
+        return Manga.manga_from_dict(resp)
+
+    async def get_manga_volumes_and_chapters(
+        self, manga_id: str, **kwargs
+    ) -> Dict[str, str]:
+        """
+        Get a manga volumes and chapters, takes the parameters of
+        `Api.get_manga_volumes_and_chapters`
+
+        Returns
+        ------------
+        `Dict[str, str]`. A dictionary with the volumes and the chapter id's
+        """
+        params = None
+        if "translatedLanguage" in kwargs:
+            params = {"translatedLanguage[]": kwargs["translatedLanguage"]}
+        resp = await self.request(f"{self.URL}/manga/{manga_id}/aggregate", params)
+        return resp["volumes"]
+
+    async def manga_feed(self, manga_id: str, **kwargs) -> PaginatedList:
+        """
+        Get the manga feed, takes the parameters of `Api.manga_feed`
+
+        Returns
+        -------------
+        `PaginatedList[Chapter]`
+        """
+        params = Api._parse_feed_params(kwargs)
+        resp = await self.request(f"{self.URL}/manga/{manga_id}/feed", params)
+        return Chapter.create_chapter_list(resp)
+
+    async def chapter_list(self, **kwargs) -> PaginatedList:
+        """
+        The list of chapters, takes the parameters of `Api.chapter_list`
+
+        Returns
+        ----------
+        `PaginatedList[Chapter]`
+        """
+        params = Api._parse_chapter_list_args(kwargs)
+        resp = await self.request(f"{self.URL}/chapter", params)
+        return Chapter.create_chapter_list(resp)
+
+    async def get_chapter(self, chapter_id: str) -> Chapter:
+        """
+        Get a Chapter by its id
+
+        Returns
+        ------------
+        `Chapter`
+        """
+        resp = await self.request(f"{self.URL}/chapter/{chapter_id}")
+        return Chapter.chapter_from_dict(resp)
+
+    async def fetch_chapter_images(
+        self, chapter: Chapter, data_saver: bool = False
+    ) -> List[str]:
+        """
+        Get the image links of a chapter from its at-home server,
+        like `Chapter.fetch_chapter_images`
+
+        Parameters
+        -----------
+        data_saver : `bool`. Get the links of the compressed images (`/data-saver`)
+
+        Returns
+        -----------
+        `List[str]`. The links are valid for 15 minutes
+        """
+        resp = await self.request(f"{self.URL}/at-home/server/{chapter.chapter_id}")
+        return chapter.image_urls_from_server(resp, data_saver=data_saver)
+
+    async def get_coverart_list(self, **kwargs) -> PaginatedList:
+        """
+        Get the list of cover arts, takes the parameters of `Api.get_coverart_list`
+
+        Returns
+        --------------
+        `PaginatedList[CoverArt]`
+        """
+        params = Api._parse_coverart_params(kwargs)
+        resp = await self.request(f"{self.URL}/cover", params)
+        return CoverArt.create_coverart_list(resp)
+
+    async def get_cover(self, cover_id: str) -> CoverArt:
+        """
+        Gets a cover image
+
+        Returns
+        --------------
+        `CoverArt`
+        """
+        resp = await self.request(f"{self.URL}/cover/{cover_id}")
+        return CoverArt.cover_from_dict(resp)
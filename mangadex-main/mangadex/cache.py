@@ -0,0 +1,247 @@
+"""
+Response cache module
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Tuple, Union
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+
+# (path prefix, seconds a response is fresh), the longest matching prefix wins.
+# A ttl of 0 never stores the response: the at-home servers hand out short lived urls
+DEFAULT_CACHE_TTLS: List[Tuple[str, float]] = [
+    ("/at-home/server", 0),
+    ("/auth", 0),
+    ("/user", 0),
+    ("/manga", 10 * 60),
+    ("/chapter", 60 * 60),
+    ("/cover", 24 * 60 * 60),
+    ("/author", 24 * 60 * 60),
+    ("/group", 24 * 60 * 60),
+]
+
+
+class CacheEntry:
+    """
+    A cached response body and the validators used to revalidate it
+    """
+
+    def __init__(
+        self,
+        path: str,
+        url: str,
+        body: str,
+        stored: float,
+        ttl: float,
+        etag: Union[str, None] = None,
+        last_modified: Union[str, None] = None,
+    ) -> None:
+        self.path = path
+        self.url = url
+        self.body = body
+        self.stored = stored
+        self.ttl = ttl
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.stored < self.ttl
+
+    def validators(self) -> Dict[str, str]:
+        """
+        Returns the `If-None-Match` and `If-Modified-Since` headers of the entry
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    On disk cache of the `GET` responses, keyed by method and url (query included).
+
+    Fresh entries are returned without a request. Stale entries that have an `ETag`
+    or `Last-Modified` header are revalidated with a conditional request, a `304`
+    makes them fresh again. When the cache grows over `max_bytes` the least recently
+    used entries are deleted.
+
+    Parameters
+    -------------
+    path : `str`. The folder of the cache
+    ttls : `List[Tuple[str, float]]`. (path prefix, seconds) rules, defaults to `DEFAULT_CACHE_TTLS`
+    default_ttl : `float`. Seconds a response is fresh when no rule matches
+    max_bytes : `int`. Size cap of the cache folder
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttls: Union[List[Tuple[str, float]], None] = None,
+        default_ttl: float = 5 * 60,
+        max_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        self.path = path
+        self.ttls = sorted(
+            DEFAULT_CACHE_TTLS if ttls is None else ttls,
+            key=lambda rule: len(rule[0]),
+            reverse=True,
+        )
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._size = sum(size for _, size, _ in self.__files())
+
+    def ttl_for(self, url: str) -> float:
+        path = urlparse(url).path
+        for prefix, ttl in self.ttls:
+            if path.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    def __path_for(self, method: str, url: str) -> str:
+        key = hashlib.sha256(f"{method.upper()} {url}".encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{key}.json")
+
+    def __files(self):
+        for entry in os.scandir(self.path):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def lookup(self, method: str, url: str) -> Union[CacheEntry, None]:
+        """
+        Returns the cached entry of a request, fresh or not, and counts the miss
+        when there isn't one
+
+        Returns
+        -----------
+        `CacheEntry` or `None`
+        """
+        path = self.__path_for(method, url)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entry = CacheEntry(
+                path,
+                url,
+                data["body"],
+                data["stored"],
+                self.ttl_for(url),
+                data.get("etag"),
+                data.get("last_modified"),
+            )
+            # the mtime is the last use of the entry, the LRU order
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if entry.fresh:
+                self.hits += 1
+            elif not entry.validators():
+                self.misses += 1
+                return None
+        return entry
+
+    def store(self, method: str, url: str, body: str, headers=None) -> None:
+        """
+        Saves the body of a response, responses with a ttl of 0 aren't stored
+        """
+        if self.ttl_for(url) <= 0:
+            return
+        headers = headers or {}
+        if "no-store" in headers.get("Cache-Control", ""):
+            return
+        data = {
+            "url": url,
+            "stored": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "body": body,
+        }
+        self.__write(self.__path_for(method, url), data)
+        with self._lock:
+            self.stores += 1
+
+    def revalidate(self, entry: CacheEntry, headers=None) -> str:
+        """
+        Marks an entry as fresh after a `304` and returns its body
+        """
+        headers = headers or {}
+        data = {
+            "url": entry.url,
+            "stored": time.time(),
+            "etag": headers.get("ETag") or entry.etag,
+            "last_modified": headers.get("Last-Modified") or entry.last_modified,
+            "body": entry.body,
+        }
+        self.__write(entry.path, data)
+        with self._lock:
+            self.revalidated += 1
+        return entry.body
+
+    def __write(self, path: str, data: dict) -> None:
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        size = os.path.getsize(temp_path)
+        with self._lock:
+            if os.path.isfile(path):
+                self._size -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self._size += size
+            if self._size > self.max_bytes:
+                self.__evict()
+
+    def __evict(self) -> None:
+        # oldest use first, down to 90% of the cap so every store doesn't evict again
+        for path, size, _ in sorted(self.__files(), key=lambda file: file[2]):
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _, _ in list(self.__files()):
+                os.remove(path)
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit, miss and eviction counters
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "bytes": self._size,
+            }
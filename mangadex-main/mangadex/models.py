@@ -20,6 +20,62 @@ from mangadex import (
 
 MANGADEX_BASEURL = "https://mangadex.org/"
 
+# offset + limit can't go over this value in the list endpoints
+MAX_LIST_RESULTS = 10000
+
+
+class PaginatedList(list):
+    """
+    A page of a list endpoint. It is a regular list of the returned objects
+    that also keeps the `total`, `limit` and `offset` of the response
+    """
+
+    def __init__(
+        self,
+        items=(),
+        total: Union[int, None] = None,
+        limit: Union[int, None] = None,
+        offset: Union[int, None] = None,
+    ) -> None:
+        super().__init__(items)
+        self.total = total
+        self.limit = limit
+        self.offset = offset
+
+    @classmethod
+    def from_response(cls, resp: dict, items) -> "PaginatedList":
+        """
+        Creates a PaginatedList with the items and the paging fields of a JSON
+        """
+        return cls(
+            items,
+            total=resp.get("total"),
+            limit=resp.get("limit"),
+            offset=resp.get("offset"),
+        )
+
+    @property
+    def has_more(self) -> bool:
+        """
+        `True` if there are results after this page
+        """
+        if self.total is None or self.offset is None:
+            return False
+        return self.offset + len(self) < min(self.total, MAX_LIST_RESULTS)
+
+    def remaining_offsets(self) -> List[int]:
+        """
+        The offsets of every page after this one, using the same limit
+        """
+        if not self.has_more or not self.limit:
+            return []
+        end = min(self.total, MAX_LIST_RESULTS)
+        return [
+            offset
+            for offset in range(self.offset + self.limit, end, self.limit)
+            if offset + self.limit <= MAX_LIST_RESULTS
+        ]
+
 
 class Manga:
     """
@@ -98,13 +154,12 @@ class Manga:
         return manga
 
     @staticmethod
-    def create_manga_list(resp) -> List["Manga"]:
+    def create_manga_list(resp) -> PaginatedList:
         """
         Creates a manga list from a JSON
         """
-        resp = resp["data"]
-        manga_list = []
-        for elem in resp:
+        manga_list = PaginatedList.from_response(resp, [])
+        for elem in resp["data"]:
             manga_list.append(Manga.manga_from_dict(elem))
         return manga_list
 
@@ -213,6 +268,7 @@ class Chapter:
         self.translatedLanguage: str = ""
         self.hash: str = ""
         self.data: List[str] = []
+        self.dataSaver: List[str] = []
         self.uploader: str = ""
         self.createdAt: datetime.datetime
         self.updatedAt: datetime.datetime
@@ -255,15 +311,20 @@ class Chapter:
 
         return chapter
 
-    def fetch_chapter_images(self) -> List[str]:  # maybe make this an async function?
+    def fetch_chapter_images(self, data_saver: bool = False) -> List[str]:
         """
         Get the image links for the chapter
 
+        Parameters
+        -----------
+        data_saver : `bool`. Get the links of the compressed images (`/data-saver`)
+
         Returns
         -----------
         `List[str]`. A list with the links with the chapter images
 
-        NOTE: There links are valid for 15 minutes until you need to renew the token
+        NOTE: There links are valid for 15 minutes until you need to renew the token.
+        `AsyncApi.fetch_chapter_images` is the asynchronous version
 
         Raises
         -----------
@@ -271,24 +332,45 @@ class Chapter:
         """
         url = f"https://api.mangadex.org/at-home/server/{self.chapter_id}"
         image_server_url = URLRequest.request_url(url, "GET", timeout=5)
-        self.hash = image_server_url["chapter"]["hash"]
-        self.data = image_server_url["chapter"]["data"]
-        image_server_url = image_server_url["baseUrl"].replace("\\", "")
-        image_server_url = f"{image_server_url}/data"
+        return self.image_urls_from_server(image_server_url, data_saver=data_saver)
+
+    def image_urls_from_server(self, resp: dict, data_saver: bool = False) -> List[str]:
+        """
+        Builds the image links from an `/at-home/server/{chapter_id}` response,
+        sets the `hash`, `data` and `dataSaver` of the chapter
+
+        Parameters
+        -----------
+        resp : `dict`. The at-home server response
+        data_saver : `bool`. Build the links of the compressed images (`/data-saver`)
+
+        Returns
+        -----------
+        `List[str]`. A list with the links with the chapter images
+        """
+        self.hash = resp["chapter"]["hash"]
+        self.data = resp["chapter"]["data"]
+        self.dataSaver = resp["chapter"].get("dataSaver", [])
+        image_server_url = resp["baseUrl"].replace("\\", "")
+        if data_saver:
+            image_server_url = f"{image_server_url}/data-saver"
+            filenames = self.dataSaver
+        else:
+            image_server_url = f"{image_server_url}/data"
+            filenames = self.data
         image_urls = []
-        for filename in self.data:
+        for filename in filenames:
             image_urls.append(f"{image_server_url}/{self.hash}/{filename}")
 
         return image_urls
 
     @staticmethod
-    def create_chapter_list(resp) -> List["Chapter"]:
+    def create_chapter_list(resp) -> PaginatedList:
         """
         Creates a Chapter list from JSON
         """
-        resp = resp["data"]
-        chap_list = []
-        for elem in resp:
+        chap_list = PaginatedList.from_response(resp, [])
+        for elem in resp["data"]:
             chap_list.append(Chapter.chapter_from_dict(elem))
         return chap_list
 
@@ -638,13 +720,12 @@ class CoverArt:
         return url
 
     @staticmethod
-    def create_coverart_list(resp) -> List["CoverArt"]:
+    def create_coverart_list(resp) -> PaginatedList:
         """
         Creates a list of CoverArts form a JSON
         """
-        resp = resp["data"]
-        coverimage_list = []
-        for elem in resp:
+        coverimage_list = PaginatedList.from_response(resp, [])
+        for elem in resp["data"]:
             coverimage_list.append(CoverArt.cover_from_dict(elem))
         return coverimage_list
 
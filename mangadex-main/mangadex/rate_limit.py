@@ -0,0 +1,237 @@
+"""
+Rate limiting module
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Tuple, Union
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+
+# (host, path prefix, requests per second, burst)
+# https://api.mangadex.org/docs/2-limitations/#endpoint-specific-rate-limits
+DEFAULT_RATE_LIMITS: List[Tuple[str, str, float, float]] = [
+    ("api.mangadex.org", "", 5, 5),
+    ("api.mangadex.org", "/at-home/server", 40 / 60, 10),
+    ("uploads.mangadex.org", "", 10, 10),
+]
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.acquired = 0
+        self.waited = 0.0
+        self.pauses = 0
+        self._lock = threading.Lock()
+
+    def __refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes `tokens` from the bucket
+
+        Returns
+        -----------
+        `float`. The seconds the caller has to wait before sending the request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.__refill(now)
+            self.tokens -= tokens
+            wait = max(self.paused_until - now, 0.0)
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            self.acquired += 1
+            self.waited += wait
+            return wait
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out tokens for the next `seconds`
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.__refill(now)
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = min(self.tokens, 0)
+            self.pauses += 1
+
+    def limit_remaining(self, remaining: float) -> None:
+        """
+        Lowers the available tokens to the amount the server says is left
+        """
+        with self._lock:
+            self.__refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "acquired": self.acquired,
+                "waited": round(self.waited, 3),
+                "pauses": self.pauses,
+            }
+
+
+class RateLimiter:
+    """
+    Keeps one `TokenBucket` per host and endpoint.
+
+    A request takes a token from every rule matching its host and path, so a call to
+    `/at-home/server` counts for both the endpoint and the global api limit.
+    Hosts without any rule (the at-home image nodes) get their own bucket
+    with `default_rate` requests per second. With a `total_default_rate`, they also
+    share a single bucket (`*`), so the image nodes together stay within one budget.
+
+    Parameters
+    -------------
+    rules : `List[Tuple[str, str, float, float]]`. (host, path prefix, requests per second, burst)
+    default_rate : `float`. Requests per second for hosts without rules
+    default_capacity : `float`. Burst for hosts without rules
+    total_default_rate : `float`. Requests per second shared by all the hosts without rules,
+    no shared limit when `None`
+    total_default_capacity : `float`. Burst shared by all the hosts without rules,
+    defaults to `total_default_rate`
+    """
+
+    def __init__(
+        self,
+        rules: Union[List[Tuple[str, str, float, float]], None] = None,
+        default_rate: float = 20,
+        default_capacity: float = 20,
+        total_default_rate: Union[float, None] = None,
+        total_default_capacity: Union[float, None] = None,
+    ) -> None:
+        self.rules = list(DEFAULT_RATE_LIMITS if rules is None else rules)
+        self.default_rate = default_rate
+        self.default_capacity = default_capacity
+        self.total_default_rate = total_default_rate
+        self.total_default_capacity = total_default_capacity or total_default_rate
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def buckets_for(self, url: str) -> List[TokenBucket]:
+        """
+        Returns the buckets matching the url, the most specific one is last
+        """
+        parsed = urlparse(url)
+        host = parsed.netloc
+        matches = [
+            (path, rate, capacity)
+            for rule_host, path, rate, capacity in self.rules
+            if rule_host == host and parsed.path.startswith(path)
+        ]
+        shared = not matches and self.total_default_rate is not None
+        if not matches:
+            matches = [("", self.default_rate, self.default_capacity)]
+        matches.sort(key=lambda match: len(match[0]))
+        keys = [((host, path), rate, capacity) for path, rate, capacity in matches]
+        if shared:
+            keys.insert(
+                0, (("*", ""), self.total_default_rate, self.total_default_capacity)
+            )
+
+        buckets = []
+        with self._lock:
+            for key, rate, capacity in keys:
+                if key not in self._buckets:
+                    self._buckets[key] = TokenBucket(rate, capacity)
+                buckets.append(self._buckets[key])
+        return buckets
+
+    def reserve(self, url: str) -> float:
+        """
+        Takes a token for the url from every matching bucket
+
+        Returns
+        -----------
+        `float`. The seconds to wait before sending the request
+        """
+        return max(bucket.reserve() for bucket in self.buckets_for(url))
+
+    def acquire(self, url: str) -> float:
+        """
+        Blocks until the request to the url is allowed
+
+        Returns
+        -----------
+        `float`. The seconds spent waiting
+        """
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def update(self, url: str, status_code: int, headers) -> None:
+        """
+        Adapts the buckets of the url to the `X-RateLimit-*` and `Retry-After` headers
+        of the response
+        """
+        bucket = self.buckets_for(url)[-1]
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is not None:
+            try:
+                bucket.limit_remaining(float(remaining))
+            except ValueError:
+                pass
+
+        retry_after = None
+        if headers.get("X-RateLimit-Retry-After") and (
+            status_code == 429 or remaining in ("0", 0)
+        ):
+            try:
+                retry_after = float(headers["X-RateLimit-Retry-After"]) - time.time()
+            except ValueError:
+                pass
+        if status_code == 429 and retry_after is None:
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            if retry_after is None:
+                retry_after = 1 / bucket.rate
+
+        if retry_after is not None and retry_after > 0:
+            bucket.pause(retry_after)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the number of acquired tokens, seconds waited and pauses of every bucket
+        """
+        with self._lock:
+            buckets = list(self._buckets.items())
+        return {f"{host}{path}": bucket.stats() for (host, path), bucket in buckets}
+
+
+def parse_retry_after(value: Union[str, None]) -> Union[float, None]:
+    """
+    Parses a `Retry-After` header, either in seconds or as an HTTP date
+
+    Returns
+    -----------
+    `float`. The seconds to wait, `None` if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,123 @@
+"""
+Retry policy module
+"""
+import random
+import threading
+from typing import Dict, Iterable, Union
+
+import requests
+
+from mangadex.rate_limit import parse_retry_after
+
+
+class RetryPolicy:
+    """
+    Decides if a failed request is sent again and how long to wait before doing it.
+
+    Idempotent methods are retried on connection errors, timeouts and the statuses in
+    `status_forcelist`. Other methods (`POST`) are only retried when the server
+    didn't process the request: a connect timeout or a `429`.
+
+    Parameters
+    -------------
+    total : `int`. Maximum retries for a single request
+    backoff_factor : `float`. The first backoff in seconds, doubled on every retry
+    max_backoff : `float`. Upper bound of the backoff and of `Retry-After`
+    jitter : `bool`. Randomize the second half of every backoff
+    status_forcelist : `Iterable[int]`. Status codes that are retried
+    idempotent_methods : `Iterable[str]`. Methods that are safe to send twice
+    budget : `int`. Retries allowed for the lifetime of the policy, `None` for no limit
+    """
+
+    def __init__(
+        self,
+        total: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60,
+        jitter: bool = True,
+        status_forcelist: Iterable[int] = (429, 500, 502, 503, 504),
+        idempotent_methods: Iterable[str] = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS"),
+        budget: Union[int, None] = None,
+    ) -> None:
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.status_forcelist = set(status_forcelist)
+        self.idempotent_methods = {method.upper() for method in idempotent_methods}
+        self.budget = budget
+
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+        self.retries_by_reason: Dict[str, int] = {}
+
+    def __is_retryable(self, method: str, status_code=None, error=None) -> bool:
+        idempotent = method.upper() in self.idempotent_methods
+        if error is not None:
+            if isinstance(error, requests.ConnectTimeout):
+                return True
+            return idempotent and isinstance(
+                error,
+                (
+                    requests.ConnectionError,
+                    requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError,
+                ),
+            )
+        if status_code == 429:
+            return True
+        return idempotent and status_code in self.status_forcelist
+
+    def should_retry(
+        self, method: str, attempt: int, status_code=None, error=None
+    ) -> bool:
+        """
+        Checks if the request can be sent again and counts the retry
+
+        Parameters
+        -------------
+        method : `str`. The HTTP method
+        attempt : `int`. The number of retries already made for this request
+        status_code : `int`. The status of the failed response
+        error : `Exception`. The exception raised while sending the request
+        """
+        if not self.__is_retryable(method, status_code=status_code, error=error):
+            return False
+
+        reason = str(status_code) if error is None else type(error).__name__
+        with self._lock:
+            if attempt >= self.total or (
+                self.budget is not None and self.retries >= self.budget
+            ):
+                self.exhausted += 1
+                return False
+            self.retries += 1
+            self.retries_by_reason[reason] = self.retries_by_reason.get(reason, 0) + 1
+        return True
+
+    def backoff(self, attempt: int, headers=None) -> float:
+        """
+        Returns the seconds to wait before the retry number `attempt` (starting at 0).
+        The `Retry-After` header is used when present
+        """
+        if headers is not None:
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+
+        delay = min(self.backoff_factor * (2**attempt), self.max_backoff)
+        if self.jitter:
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+    def stats(self) -> Dict[str, Union[int, Dict[str, int]]]:
+        """
+        Returns the retry counters
+        """
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "exhausted": self.exhausted,
+                "reasons": dict(self.retries_by_reason),
+            }
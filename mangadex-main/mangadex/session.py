@@ -0,0 +1,145 @@
+"""
+Connection pool module
+"""
+import threading
+from typing import Dict, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+
+class SessionPool:
+    """
+    Thread-safe pool of keep-alive HTTP sessions.
+
+    Every thread gets its own `requests.Session`, but all of them share one
+    `HTTPAdapter` (and therefore one urllib3 connection pool) per host, so
+    TCP and TLS connections are reused across threads and across calls.
+
+    Parameters
+    -------------
+    pool_connections : `int`. Default number of connection pools to cache per adapter
+    pool_maxsize : `int`. Default number of connections kept alive per host
+    host_pool_sizes : `Dict[str, int]`. Per host override of `pool_maxsize`
+    keep_alive : `bool`. If `False` every request is sent with `Connection: close`
+    headers : `Dict[str, str]`. Headers added to every session
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        host_pool_sizes: Union[Dict[str, int], None] = None,
+        keep_alive: bool = True,
+        headers: Union[Dict[str, str], None] = None,
+    ) -> None:
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.host_pool_sizes = dict(host_pool_sizes or {})
+        self.keep_alive = keep_alive
+        self.headers = dict(headers or {})
+        if not keep_alive:
+            self.headers["Connection"] = "close"
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._sessions = []
+        self._requests: Dict[str, int] = {}
+
+    def __adapter_for(self, prefix: str, host: str) -> HTTPAdapter:
+        with self._lock:
+            adapter = self._adapters.get(prefix)
+            if adapter is None:
+                maxsize = self.host_pool_sizes.get(host, self.pool_maxsize)
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=maxsize,
+                    pool_block=False,
+                )
+                self._adapters[prefix] = adapter
+            self._requests[host] = self._requests.get(host, 0) + 1
+        return adapter
+
+    def session(self) -> requests.Session:
+        """
+        Returns the session bound to the calling thread
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request through the pooled session of the calling thread
+
+        Parameters
+        -------------
+        method : `str`. The HTTP method
+        url : `str`. The full url
+        kwargs : Any other argument accepted by `requests.Session.request`
+
+        Returns
+        -------------
+        `requests.Response`
+        """
+        parsed = urlparse(url)
+        prefix = f"{parsed.scheme}://{parsed.netloc}/"
+        adapter = self.__adapter_for(prefix, parsed.netloc)
+        session = self.session()
+        if session.adapters.get(prefix) is not adapter:
+            session.mount(prefix, adapter)
+        return session.request(method, url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Connection reuse statistics per host
+
+        Returns
+        -------------
+        `Dict[str, Dict[str, int]]`. For every host the number of `requests` sent,
+        the number of `connections` opened and how many requests `reused` a connection
+        """
+        with self._lock:
+            adapters = list(self._adapters.items())
+            requests_per_host = dict(self._requests)
+
+        stats = {}
+        for prefix, adapter in adapters:
+            host = urlparse(prefix).netloc
+            connections = 0
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+            sent = requests_per_host.get(host, 0)
+            stats[host] = {
+                "requests": sent,
+                "connections": connections,
+                "reused": max(sent - connections, 0),
+            }
+        return stats
+
+    def close(self) -> None:
+        """
+        Closes every session and drops the pooled connections
+        """
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            for adapter in self._adapters.values():
+                adapter.close()
+            self._sessions = []
+            self._adapters = {}
+            self._requests = {}
+        self._local = threading.local()
@@ -2,16 +2,12 @@
 Url handler module
 """
 import json
+import time
 from typing import Dict, Union, Any
 
 import requests
 
-from mangadex import ApiError
-
-try:
-    basestring
-except NameError:
-    from past.builtins import basestring
+from mangadex import ApiError, SessionPool, RateLimiter, RetryPolicy
 
 try:
     from urllib.parse import urlparse, urlencode
@@ -23,8 +19,25 @@ except ImportError:
 class URLRequest:
     """
     Handles the request to the server
+
+    Every request goes through `session_pool`, a `SessionPool` shared by the whole
+    process. Replace it to tune the per host pool sizes.
+
+    Before a request is sent a token is taken from `rate_limiter`, set it to `None`
+    to disable rate limiting.
+
+    Failed requests are sent again following `retry_policy`, set it to `None`
+    to raise on the first error.
+
+    Set `cache` to a `ResponseCache` to keep the anonymous `GET` responses on disk,
+    it's `None` by default.
     """
 
+    session_pool = SessionPool()
+    rate_limiter = RateLimiter()
+    retry_policy = RetryPolicy()
+    cache = None
+
     @staticmethod
     def request_url(
         url: str,
@@ -44,46 +57,100 @@ class URLRequest:
         }
 
         if method == "GET":
-            url = URLRequest.__build_url(url, params)
-            try:
-                resp = requests.get(url, headers=headers, timeout=timeout)
-            except requests.RequestException as e:
-                print(f"An error has occured: {e}")
-                raise
+            url = URLRequest._build_url(url, params)
+            kwargs = {}
         elif method == "POST":
-            try:
-                resp = requests.post(url, json=params, headers=headers, timeout=timeout)
-            except requests.RequestException as e:
-                print(f"An error has occured: {e}")
-                raise
+            kwargs = {"json": params}
         elif method == "DELETE":
-            try:
-                resp = requests.delete(url, headers=headers, timeout=timeout)
-            except requests.RequestException as e:
-                print(f"An error has occured: {e}")
-                raise
+            kwargs = {}
         elif method == "PUT":
-            try:
-                resp = requests.put(
-                    url, headers=headers, params=params, timeout=timeout
-                )
-            except requests.RequestException as e:
-                print(f"An error has occured: {e}")
-                raise
+            kwargs = {"params": params}
         else:
             raise ValueError(f"Method {method} is invalid")
 
+        cache = URLRequest.cache
+        if method != "GET" or (headers and "Authorization" in headers):
+            cache = None
+        entry = cache.lookup(method, url) if cache is not None else None
+        if entry is not None:
+            if entry.fresh:
+                return URLRequest.__parse_data(entry.body)
+            headers = {**(headers or {}), **entry.validators()}
+
+        resp = URLRequest.__send(
+            method, url, headers=headers, timeout=timeout, **kwargs
+        )
+
+        if entry is not None and resp.status_code == 304:
+            return URLRequest.__parse_data(cache.revalidate(entry, resp.headers))
+
         if not resp.ok:
             raise ApiError(resp)
 
         content = resp.content
-        data = URLRequest.__parse_data(
-            content if isinstance(content, basestring) else content.decode("utf-8")
-        )
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+        data = URLRequest.__parse_data(content)
+        if cache is not None:
+            cache.store(method, url, content, resp.headers)
         return data
 
     @staticmethod
-    def __build_url(url: str, params: dict) -> str:
+    def request_raw(
+        url: str,
+        timeout,
+        headers=None,
+        stream: bool = True,
+        method: str = "GET",
+    ) -> requests.Response:
+        """
+        Sends a request and returns the raw response, used for binary downloads
+        like the chapter pages and the cover images
+
+        Returns
+        -----------
+        `requests.Response`. The response is returned even if it's not ok
+        """
+        return URLRequest.__send(
+            method, url, headers=headers, timeout=timeout, stream=stream
+        )
+
+    @staticmethod
+    def __send(method: str, url: str, **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            rate_limiter = URLRequest.rate_limiter
+            retry_policy = URLRequest.retry_policy
+            if rate_limiter is not None:
+                rate_limiter.acquire(url)
+            try:
+                resp = URLRequest.session_pool.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                if retry_policy is not None and retry_policy.should_retry(
+                    method, attempt, error=e
+                ):
+                    time.sleep(retry_policy.backoff(attempt))
+                    attempt += 1
+                    continue
+                print(f"An error has occured: {e}")
+                raise
+            if rate_limiter is not None:
+                rate_limiter.update(url, resp.status_code, resp.headers)
+            if (
+                not resp.ok
+                and retry_policy is not None
+                and retry_policy.should_retry(
+                    method, attempt, status_code=resp.status_code
+                )
+            ):
+                resp.close()
+                time.sleep(retry_policy.backoff(attempt, resp.headers))
+                attempt += 1
+                continue
+            return resp
+
+    @staticmethod
+    def _build_url(url: str, params: dict) -> str:
         if params and len(params) > 0:
             url = url + "?" + URLRequest.__encode_parameters(params)
         return url
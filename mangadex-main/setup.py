@@ -24,6 +24,7 @@ setup(
         "pytest",
         "typing-extensions",
     ],
+    extras_require={"async": ["aiohttp"]},
     source="https://github.com/EMACC99/mangadex",
     download_url="https://github.com/EMACC99/mangadex/releases",
     documentation="https://github.com/EMACC99/mangadex/wiki",
@@ -1,8 +1,12 @@
 """
 Module for unit and intergration tests
 """
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
 from pathlib import Path
 import json
+import threading
+import time
 import pytest
 import mangadex as md
 
@@ -19,6 +23,58 @@ def read_json_files(filename: Path, mode: str = "r") -> dict:
 USER_DATA_DIR = Path("test/user_data.txt")
 
 
+class LocalHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive handler answering every GET with a small JSON body
+    """
+
+    protocol_version = "HTTP/1.1"
+    failures = {}
+    requests = {}
+
+    def do_GET(self):
+        self.requests[self.path] = self.requests.get(self.path, 0) + 1
+        if (
+            self.path.startswith("/etag")
+            and self.headers.get("If-None-Match") == '"v1"'
+        ):
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+        if self.path.startswith("/flaky") and self.failures.get(self.path, 0) > 0:
+            self.failures[self.path] -= 1
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"result": "ok", "path": self.path}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path.startswith("/etag"):
+            self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    """
+    Starts a local HTTP server and yields its base url
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
 class TestApi:
     """
     Class for testing the public API calls
@@ -204,6 +260,336 @@ class TestApi:
         self.api.get_customlist(customlist_id=custom_list_id)
 
 
+class TestSessionPool:
+    """
+    Class for testing the pooled sessions, runs against a local server
+    """
+
+    timeout = 5
+
+    def test_ConnectionReuse(self, local_server):
+        pool = md.SessionPool(pool_maxsize=2)
+        for _ in range(5):
+            assert pool.request("GET", local_server, timeout=self.timeout).ok
+
+        host = local_server.split("//")[1]
+        stats = pool.stats()[host]
+        assert stats["requests"] == 5
+        assert stats["connections"] == 1
+        assert stats["reused"] == 4
+        pool.close()
+
+    def test_RequestUrlUsesPool(self, local_server):
+        old_pool = md.URLRequest.session_pool
+        md.URLRequest.session_pool = md.SessionPool()
+        try:
+            resp = md.URLRequest.request_url(
+                f"{local_server}/manga",
+                "GET",
+                timeout=self.timeout,
+                params={"limit": 1},
+            )
+            assert resp["path"] == "/manga?limit=1"
+            assert len(md.URLRequest.session_pool.stats()) == 1
+        finally:
+            md.URLRequest.session_pool.close()
+            md.URLRequest.session_pool = old_pool
+
+
+class TestRateLimiter:
+    """
+    Class for testing the token buckets
+    """
+
+    def test_BucketWaitsWhenEmpty(self):
+        bucket = md.TokenBucket(rate=10, capacity=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert 0.05 < bucket.reserve() <= 0.1
+
+    def test_EndpointAndHostBuckets(self):
+        limiter = md.RateLimiter()
+        buckets = limiter.buckets_for("https://api.mangadex.org/at-home/server/abc")
+        assert [bucket.rate for bucket in buckets] == [5, 40 / 60]
+        assert limiter.buckets_for("https://api.mangadex.org/manga") == buckets[:1]
+        image_bucket = limiter.buckets_for("https://node.mangadex.network/data/a/b")
+        assert image_bucket[0].rate == limiter.default_rate
+
+    def test_ImageHostsShareTotalBucket(self):
+        limiter = md.RateLimiter(default_rate=10, total_default_rate=3)
+        first = limiter.buckets_for("https://a.mangadex.network/data/a/b")
+        second = limiter.buckets_for("https://b.mangadex.network/data/a/b")
+        assert [bucket.rate for bucket in first] == [3, 10]
+        assert first[0] is second[0] and first[1] is not second[1]
+        assert len(limiter.buckets_for("https://api.mangadex.org/manga")) == 1
+        for _ in range(3):
+            assert limiter.reserve("https://a.mangadex.network/data/a/b") == 0
+        assert limiter.reserve("https://b.mangadex.network/data/a/b") > 0.2
+
+    def test_RetryAfterPausesBucket(self):
+        limiter = md.RateLimiter()
+        url = "https://api.mangadex.org/manga"
+        limiter.update(url, 429, {"Retry-After": "2"})
+        assert 1.5 < limiter.reserve(url) <= 2
+
+    def test_RateLimitHeadersPauseBucket(self):
+        limiter = md.RateLimiter()
+        url = "https://api.mangadex.org/at-home/server/abc"
+        headers = {
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Retry-After": str(int(time.time()) + 30),
+        }
+        limiter.update(url, 200, headers)
+        assert limiter.reserve(url) > 25
+        assert limiter.reserve("https://api.mangadex.org/manga") < 1
+
+
+class TestRetryPolicy:
+    """
+    Class for testing the retries, runs against a local server
+    """
+
+    timeout = 5
+
+    def test_RetriesUntilOk(self, local_server):
+        old_policy = md.URLRequest.retry_policy
+        md.URLRequest.retry_policy = md.RetryPolicy(total=3)
+        LocalHandler.failures["/flaky/ok"] = 2
+        try:
+            resp = md.URLRequest.request_url(
+                f"{local_server}/flaky/ok", "GET", timeout=self.timeout
+            )
+            assert resp["path"] == "/flaky/ok"
+            assert md.URLRequest.retry_policy.stats()["retries"] == 2
+        finally:
+            md.URLRequest.retry_policy = old_policy
+
+    def test_RaisesWhenExhausted(self, local_server):
+        old_policy = md.URLRequest.retry_policy
+        md.URLRequest.retry_policy = md.RetryPolicy(total=1)
+        LocalHandler.failures["/flaky/exhausted"] = 5
+        try:
+            with pytest.raises(md.ApiError) as e:
+                md.URLRequest.request_url(
+                    f"{local_server}/flaky/exhausted", "GET", timeout=self.timeout
+                )
+            assert e.value.code == 503
+            assert md.URLRequest.retry_policy.stats()["exhausted"] == 1
+        finally:
+            md.URLRequest.retry_policy = old_policy
+
+    def test_PostOnlyRetriedOnTooManyRequests(self):
+        policy = md.RetryPolicy()
+        assert not policy.should_retry("POST", 0, status_code=503)
+        assert policy.should_retry("POST", 0, status_code=429)
+        assert policy.should_retry("GET", 0, status_code=503)
+
+    def test_BudgetAndBackoff(self):
+        policy = md.RetryPolicy(budget=1, backoff_factor=1, jitter=False)
+        assert policy.should_retry("GET", 0, status_code=500)
+        assert not policy.should_retry("GET", 0, status_code=500)
+        assert policy.backoff(2) == 4
+        assert policy.backoff(0, {"Retry-After": "7"}) == 7
+
+
+class TestResponseCache:
+    """
+    Class for testing the response cache, runs against a local server
+    """
+
+    timeout = 5
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        old_cache = md.URLRequest.cache
+        md.URLRequest.cache = md.ResponseCache(str(tmp_path))
+        yield md.URLRequest.cache
+        md.URLRequest.cache = old_cache
+
+    def test_FreshHit(self, local_server, cache):
+        url = f"{local_server}/cover/fresh"
+        first = md.URLRequest.request_url(url, "GET", timeout=self.timeout)
+        second = md.URLRequest.request_url(url, "GET", timeout=self.timeout)
+        assert first == second
+        assert LocalHandler.requests["/cover/fresh"] == 1
+        assert cache.stats()["hits"] == 1
+
+    def test_RevalidatesStaleEntry(self, local_server, cache):
+        url = f"{local_server}/etag/stale"
+        first = md.URLRequest.request_url(url, "GET", timeout=self.timeout)
+        cache.default_ttl = 0
+        second = md.URLRequest.request_url(url, "GET", timeout=self.timeout)
+        assert first == second
+        assert LocalHandler.requests["/etag/stale"] == 2
+        assert cache.stats()["revalidated"] == 1
+
+    def test_AtHomeNotStored(self, local_server, cache):
+        url = f"{local_server}/at-home/server/id"
+        md.URLRequest.request_url(url, "GET", timeout=self.timeout)
+        md.URLRequest.request_url(url, "GET", timeout=self.timeout)
+        assert LocalHandler.requests["/at-home/server/id"] == 2
+        assert cache.stats()["stores"] == 0
+
+    def test_EvictsLeastRecentlyUsed(self, tmp_path):
+        cache = md.ResponseCache(str(tmp_path), max_bytes=300)
+        for i in range(4):
+            cache.store("GET", f"http://host/cover/{i}", "x" * 100)
+        stats = cache.stats()
+        assert stats["evictions"] > 0
+        assert stats["bytes"] <= 300
+        assert cache.lookup("GET", "http://host/cover/3") is not None
+
+
+class TestAsyncApi:
+    """
+    Class for testing the async client, runs against a local server
+    """
+
+    def test_RetriesAndRateLimit(self, local_server):
+        pytest.importorskip("aiohttp")
+        old_policy = md.URLRequest.retry_policy
+        md.URLRequest.retry_policy = md.RetryPolicy(total=3, backoff_factor=0.01)
+        LocalHandler.failures["/flaky/async"] = 2
+
+        async def request():
+            async with md.AsyncApi() as api:
+                return await api.request(f"{local_server}/flaky/async")
+
+        try:
+            resp = asyncio.run(request())
+            assert resp["path"] == "/flaky/async"
+            assert md.URLRequest.retry_policy.stats()["retries"] == 2
+        finally:
+            md.URLRequest.retry_policy = old_policy
+
+    def test_ConcurrentRequests(self, local_server):
+        pytest.importorskip("aiohttp")
+
+        async def request_all():
+            async with md.AsyncApi() as api:
+                params = md.Api._parse_feed_params(
+                    {"translatedLanguage": ["en"], "order": {"volume": "asc"}}
+                )
+                return await asyncio.gather(
+                    *[
+                        api.request(f"{local_server}/feed/{i}", params)
+                        for i in range(10)
+                    ]
+                )
+
+        results = asyncio.run(request_all())
+        assert [resp["path"].split("?")[0] for resp in results] == [
+            f"/feed/{i}" for i in range(10)
+        ]
+        assert "order%5Bvolume%5D=asc" in results[0]["path"]
+
+
+class TestChapterImages:
+    """
+    Class for testing the image links built from an at-home response
+    """
+
+    resp = {
+        "baseUrl": "https://node.mangadex.network",
+        "chapter": {"hash": "abc", "data": ["1-a.png"], "dataSaver": ["1-b.jpg"]},
+    }
+
+    def test_DataLinks(self):
+        chapter = md.Chapter()
+        urls = chapter.image_urls_from_server(self.resp)
+        assert urls == ["https://node.mangadex.network/data/abc/1-a.png"]
+        assert chapter.dataSaver == ["1-b.jpg"]
+
+    def test_DataSaverLinks(self):
+        urls = md.Chapter().image_urls_from_server(self.resp, data_saver=True)
+        assert urls == ["https://node.mangadex.network/data-saver/abc/1-b.jpg"]
+
+
+class TestPagination:
+    """
+    Class for testing the paginated lists
+    """
+
+    @staticmethod
+    def fake_chapter_list(total: int, **kwargs) -> md.PaginatedList:
+        offset = kwargs.get("offset", 0)
+        limit = kwargs["limit"]
+        items = list(range(offset, min(offset + limit, total)))
+        return md.PaginatedList(items, total=total, limit=limit, offset=offset)
+
+    def test_ListKeepsPagingFields(self):
+        resp = {"data": [], "limit": 10, "offset": 0, "total": 35}
+        chapters = md.Chapter.create_chapter_list(resp)
+        assert chapters == []
+        assert (chapters.total, chapters.limit, chapters.offset) == (35, 10, 0)
+
+    def test_RemainingOffsets(self):
+        page = md.PaginatedList(range(100), total=250, limit=100, offset=0)
+        assert page.has_more
+        assert page.remaining_offsets() == [100, 200]
+        last_page = md.PaginatedList(range(50), total=250, limit=100, offset=200)
+        assert not last_page.has_more
+        assert last_page.remaining_offsets() == []
+
+    def test_GetAllPages(self):
+        calls = []
+
+        def list_method(**kwargs):
+            calls.append(kwargs.get("offset", 0))
+            return self.fake_chapter_list(250, **kwargs)
+
+        results = md.Api.get_all_pages(list_method, limit=100)
+        assert results == list(range(250))
+        assert sorted(calls) == [0, 100, 200]
+
+    def test_MangaFeedParams(self, monkeypatch):
+        sent = {}
+
+        def request_url(url, method, timeout=5, params=None, headers=None):
+            sent.update(url=url, params=params)
+            return {"data": [], "limit": 500, "offset": 0, "total": 0}
+
+        monkeypatch.setattr(md.URLRequest, "request_url", request_url)
+        md.Api().manga_feed(
+            manga_id="id",
+            limit=500,
+            translatedLanguage=["en"],
+            contentRating=["safe", "suggestive"],
+            order={"volume": "asc", "chapter": "asc"},
+        )
+        assert sent["url"].endswith("/manga/id/feed")
+        assert sent["params"] == {
+            "limit": 500,
+            "translatedLanguage[]": ["en"],
+            "contentRating[]": ["safe", "suggestive"],
+            "order[volume]": "asc",
+            "order[chapter]": "asc",
+        }
+
+    def test_ChapterListParams(self, monkeypatch):
+        sent = {}
+
+        def request_url(url, method, timeout=5, params=None, headers=None):
+            sent.update(url=url, params=params)
+            return {"data": [], "limit": 100, "offset": 0, "total": 0}
+
+        monkeypatch.setattr(md.URLRequest, "request_url", request_url)
+        md.Api().chapter_list(
+            limit=100,
+            ids=["a", "b"],
+            contentRating=["safe"],
+            order={"volume": "asc", "chapter": "asc"},
+        )
+        assert sent["url"].endswith("/chapter")
+        assert sent["params"] == {
+            "limit": 100,
+            "ids[]": ["a", "b"],
+            "contentRating[]": ["safe"],
+            "order[volume]": "asc",
+            "order[chapter]": "asc",
+        }
+
+
 CREDENTIALS = Path("test/credentials.txt")
 
 
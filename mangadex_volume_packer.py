@@ -1,16 +1,34 @@
+import argparse
+import hashlib
+import json
 import os
 import shutil
+import sys
 import time
-import zipfile
-import string
-from difflib import SequenceMatcher
 
 import mangadex
-import requests
 import regex as re
-from mangadex import Chapter, CoverArt, Manga
+from mangadex import (
+    Chapter,
+    CoverArt,
+    Manga,
+    RateLimiter,
+    ResponseCache,
+    RetryPolicy,
+    SessionPool,
+    URLRequest,
+)
 from unidecode import unidecode
 
+from at_home import LeasePrefetcher, NodeHealth
+from cbz_packer import PackingPipeline, PackingPolicy, StreamingCBZWriter
+from page_cache import PageStore, get_page_key
+from page_downloader import PageDownloader, PageTask, get_download_summary
+from title_index import TitleIndex
+from title_matcher import TitleMatcher, get_manga_titles
+from volume_journal import VolumeJournal
+from volume_records import VolumeRecord
+
 # Tested On: Python 3.9.12
 # Requires specific mangadex pypi version, until I get around to updating the code.
 
@@ -33,8 +51,103 @@ requried_similarity_score = 0.9790
 series_name = None
 source = "MangaDex"
 
-# time to sleep in-between page requests
-sleep_time = 5
+# The number of pages downloaded at the same time from a single image host
+max_page_workers_per_host = 8
+
+# The number of keep-alive connections kept open per host
+connections_per_host = 10
+
+# The number of pages downloaded at the same time, across every image host
+max_page_workers = connections_per_host * 2
+
+# The requests per second allowed for each image host (at-home nodes),
+# the api.mangadex.org endpoints use the limits published by MangaDex
+image_requests_per_second = 20
+
+# The requests per second allowed for all the image hosts together,
+# shared by every series packed at the same time
+image_total_requests_per_second = 40
+
+# The number of times a failed request or page is retried
+max_retries = 5
+
+# Whether to keep the API responses on disk, so repeated searches and re-runs
+# of a series don't request the same listings again
+use_response_cache = True
+response_cache_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "responses"
+)
+
+# Whether to keep the titles of every series seen in the searches in a local index,
+# a known title is then resolved without searching Mangadex
+use_title_index = True
+title_index_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "titles.json"
+)
+
+# Whether to keep every downloaded page and cover in a local store shared by all
+# the series, so packing a volume again doesn't download its images again
+use_page_cache = True
+page_cache_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "pages"
+)
+# The size of the page store, the least recently used images are deleted past it
+page_cache_max_bytes = 2 * 1024 * 1024 * 1024
+
+# Whether to check every page against its Content-Length and the sha256 in its
+# MangaDex file name, a truncated or corrupted page is downloaded again
+verify_page_digests = True
+
+# Where the records of the downloaded volumes are kept,
+# repack.py packs them again from the page store without the network
+volume_records_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "volumes"
+)
+
+# Whether to download the compressed data-saver images instead of the originals,
+# for smaller volumes on e-readers. The mode is recorded in the journal and the CBZ comment.
+# Also set with --data-saver or "data_saver" in a job
+data_saver = False
+# "data" or "data-saver", set from data_saver by setup()
+image_mode = "data"
+
+# The number of upcoming chapters whose at-home server is requested in the background
+# while the current chapter downloads
+lease_lookahead = 2
+
+# An image node is degraded when more than this share of its last requests failed,
+# or when it sends the pages slower than min_node_speed bytes per second.
+# The chapter then moves to another node, or to the uploads.mangadex.org origin
+max_node_error_rate = 0.3
+min_node_speed = 50 * 1024
+
+# Whether to resume interrupted volume downloads using the journal in the volume folder,
+# instead of deleting the folder and starting over
+resume_downloads = True
+
+# Whether to write the downloaded pages straight into the CBZ, without a volume folder.
+# Halves the disk I/O, but an interrupted volume can't be resumed
+stream_to_cbz = False
+
+# The deflate level (0-9) of the CBZ entries that aren't already compressed images,
+# the images are always stored as they are
+cbz_compress_level = 6
+packing_policy = PackingPolicy(compress_level=cbz_compress_level)
+
+# The number of volumes packed at the same time while the next volumes download,
+# in worker processes or, if pack_with_processes is False, in threads
+pack_workers = 2
+pack_with_processes = True
+
+# How the chapters of a series are found:
+# "aggregate" plans the volumes with a single /manga/{id}/aggregate request and
+# only gets the chapter details of the selected volumes,
+# "feed" pages through /manga/{id}/feed 500 chapters at a time, sorted by the server,
+# "chapter_list" pages through /chapter 100 chapters at a time
+chapter_discovery = "aggregate"
+
+# The language of the chapters to download
+translated_language = "en"
 
 volume_number = None
 sort = False
@@ -43,6 +156,71 @@ offset = None
 language = "ja"
 only_these_volumes = []
 
+# The shared clients, created from the settings by setup_api() and setup(),
+# so importing the packer (in repack.py and its worker processes) has no side effects
+api_ready = False
+title_index = None
+page_store = None
+lease_prefetcher = None
+node_health = None
+page_downloader = None
+
+
+def setup_api():
+    """
+    Sets the session pool, rate limiter, retry policy and response cache
+    shared by every request, and loads the title index. Does nothing the second time
+    """
+    global title_index, api_ready
+
+    if api_ready:
+        return
+    api_ready = True
+    # Shared connection pool used by every API call and page download
+    URLRequest.session_pool = SessionPool(
+        pool_maxsize=connections_per_host,
+        headers={"User-Agent": "Mozilla/5.0"},
+    )
+    # Shared rate limiter, adapts to the X-RateLimit-* and Retry-After headers
+    URLRequest.rate_limiter = RateLimiter(
+        default_rate=image_requests_per_second,
+        default_capacity=image_requests_per_second,
+        total_default_rate=image_total_requests_per_second,
+    )
+    # Shared retry policy, backs off exponentially and honors Retry-After
+    URLRequest.retry_policy = RetryPolicy(total=max_retries)
+    if use_response_cache:
+        URLRequest.cache = ResponseCache(response_cache_path)
+    if use_title_index:
+        title_index = TitleIndex(title_index_path)
+
+
+def setup():
+    """
+    Creates the shared clients from the settings, call it after changing them:
+    the request layer of setup_api, the image mode, the page store,
+    the lease prefetcher and the page downloader. Does nothing the second time
+    """
+    global image_mode, page_store, lease_prefetcher, node_health, page_downloader
+
+    setup_api()
+    if page_downloader is not None:
+        return
+    image_mode = "data-saver" if data_saver else "data"
+    if use_page_cache:
+        page_store = PageStore(page_cache_path, max_bytes=page_cache_max_bytes)
+    lease_prefetcher = LeasePrefetcher(lookahead=lease_lookahead, data_saver=data_saver)
+    node_health = NodeHealth(
+        max_error_rate=max_node_error_rate, min_speed=min_node_speed
+    )
+    page_downloader = PageDownloader(
+        max_workers_per_host=max_page_workers_per_host,
+        max_workers=max_page_workers,
+        page_store=page_store,
+        verify_digests=verify_page_digests,
+        node_health=node_health,
+    )
+
 
 # volume class
 class Volume:
@@ -52,14 +230,6 @@ class Volume:
         self.cover = cover
 
 
-# Checks the similarity of two strings
-def similar(a, b):
-    if a == "" or b == "":
-        return 0.0
-    else:
-        return SequenceMatcher(None, a.lower(), b.lower()).ratio()
-
-
 # convert each volume to a float
 def convert_volume_to_float(chapters):
     for chapter in chapters:
@@ -151,22 +321,17 @@ def get_input_from_user(prompt, acceptable_values=None, example=None):
 
 def filter_series_by_similarity_score(series, compare_title, required_similarity_score):
     """
-    Filters the series by using the similar function
-    and if the compare_title and title, or compare_title and alt_title are similar enough
-    then the series is added to the filtered_series list
+    Scores the title and alt_titles of every series against the compare_title
+    with a TitleMatcher, the series with a title similar enough are returned
+    best match first
     """
     global series_name
+    matcher = TitleMatcher(compare_title, required_similarity_score)
     filtered_series = []
-    found = False
 
     print(f"\t\tTotal Series: {len(series)}")
 
-    for manga in series:
-        index = series.index(manga) + 1
-
-        if found:
-            break
-
+    for index, manga in enumerate(series, start=1):
         print(f"\t\t\t[{index}/{len(series)}]  Series: {manga.url}")
 
         # Combine the title and altTitles into one list
@@ -176,40 +341,37 @@ def filter_series_by_similarity_score(series, compare_title, required_similarity
             print("\t\t\tERROR: manga.title is None")
             continue
 
+        best_score = 0.0
         print(f"\t\t\t\tTitles:")
         for title in titles:
             if not title:
                 print("\t\t\t\t\tERROR: title is None")
                 continue
 
-            if title:
-                title_key = next(iter(title.keys()))
-                title_value = next(iter(title.values()))
-                print(f"\t\t\t\t\t{title_key}: {title_value}")
-
-                # remove all punctuation
-                title_value = title_value.translate(
-                    str.maketrans("", "", string.punctuation)
-                ).strip()
-                compare_title_clean = compare_title.translate(
-                    str.maketrans("", "", string.punctuation)
-                ).strip()
-
-                # remove duplicate spaces
-                title_value = re.sub(" +", " ", title_value)
-                compare_title_clean = re.sub(" +", " ", compare_title_clean)
-
-                similarity_score = similar(title_value, compare_title_clean)
-                if similarity_score >= required_similarity_score:
-                    print(
-                        f"\t\t\t\t\t\tMatch: ({similarity_score} >= {required_similarity_score})"
-                    )
-                    filtered_series.append(manga)
-                    found = True
-                    series_name = compare_title
-                    break
+            title_key = next(iter(title.keys()))
+            title_value = next(iter(title.values()))
+            print(f"\t\t\t\t\t{title_key}: {title_value}")
+
+            similarity_score = matcher.score(title_value)
+            if similarity_score:
+                print(
+                    f"\t\t\t\t\t\tMatch: ({similarity_score} >= {required_similarity_score})"
+                )
+                best_score = max(best_score, similarity_score)
+
+        if best_score:
+            filtered_series.append((best_score, manga))
+
+    if filtered_series:
+        series_name = sanitize_series_name(compare_title)
+        print(
+            f"\t\t{len(filtered_series)} matches, "
+            f"{matcher.pruned}/{matcher.compared} titles pruned"
+        )
 
-    return filtered_series
+    # the best match first, the search order breaks the ties
+    filtered_series.sort(key=lambda match: match[0], reverse=True)
+    return [manga for _, manga in filtered_series]
 
 
 # gets the most frequent group_ids in the chapter list
@@ -278,6 +440,27 @@ def filter_covers_and_volumes(covers, volumes):
     return filtered_covers, filtered_volumes
 
 
+def list_page_files(folder_path):
+    """
+    Returns the files of a volume folder, ignoring hidden files like the journal
+    """
+    return [file for file in os.listdir(folder_path) if not file.startswith(".")]
+
+
+def remove_stray_files(folder_path, keep):
+    """
+    Removes the files of a volume folder that aren't in keep,
+    like partial pages or pages from a previous naming
+    """
+    keep = set(keep)
+    for file in os.listdir(folder_path):
+        if file == VolumeJournal.FILENAME or file in keep:
+            continue
+        file_path = os.path.join(folder_path, file)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+
 def get_chapter_info(chapter):
     """
     Returns a string with information about a chapter.
@@ -288,6 +471,18 @@ def get_chapter_info(chapter):
         return f"Chapter: {chapter.chapter} ({chapter.chapter_id})"
 
 
+def sanitize_series_name(name):
+    """
+    Returns a series name that can be used in the folder and CBZ names on every system,
+    EX: "Fate/Zero?" -> "Fate-Zero"
+    """
+    name = name.replace(":", " - ")
+    name = re.sub(r"[/\\]", "-", name)
+    name = re.sub(r'[?*<>|"\x00-\x1f]', "", name)
+    # Windows drops the trailing dots and spaces of a folder name
+    return name.strip(" .")
+
+
 def get_folder_name(series_name, volume_number, source):
     """
     Returns a string with the folder name for a volume.
@@ -360,93 +555,589 @@ def format_chapter_and_volume_numbers(chapter_number, volume_number):
     return f"c{chapter_str} (v{volume_str})"
 
 
-def main():
+def get_page_name(series_name, chapter, page_number, volume_number, extension):
+    """
+    Returns the file name of a page.
+    FORMAT: {series_name} - c{chapter_number} (v{volume_number}) - p{page_number} [{source}] [{title}].{extension}
+    EX: One Piece - c001 (v01) - p001 [MangaDex] [Romance Dawn].jpg
+    """
+    if page_number < 10:
+        page_number = f"00{page_number}"
+    elif page_number < 100:
+        page_number = f"0{page_number}"
+
+    chapter_number = format_chapter_and_volume_numbers(chapter.chapter, volume_number)
+
+    page_name = f"{series_name} - {chapter_number} - p{page_number} [{source}]"
+
+    if chapter.title:
+        clean_title = re.sub(r'"', "", unidecode(chapter.title))
+        # replace : with " - "
+        clean_title = re.sub(r":", " - ", clean_title).strip()
+        # remove /
+        clean_title = re.sub(r"/", " - ", clean_title).strip()
+        # remove any dual space
+        clean_title = re.sub(r"\s{2,}", " ", clean_title).strip()
+        page_name += f" [{clean_title}]"
+
+    return f"{page_name}.{extension}"
+
+
+def get_cover_name(series_name, volume, volume_number, image_link):
+    """
+    Returns the file name of a volume cover, named after the first chapter of the volume
+    """
+    first_chapter_number = volume.chapters[0].chapter
+
+    # format the chapter and volume numbers
+    chapter_and_volume_numbers = format_chapter_and_volume_numbers(
+        first_chapter_number,
+        volume_number,
+    )
+    # get the file extension
+    _, image_link_extension = os.path.splitext(image_link)
+    return f"{series_name} - {chapter_and_volume_numbers} - p000 [Cover] [{source}]{image_link_extension}"
+
+
+def download_cover(api, volume):
+    """
+    Downloads the cover of a volume.
+    Returns the cover link and its bytes, or None for both if it failed
+    """
     global number_of_api_hits
 
-    # Create the output path if it doesn't exist
-    if output_path and not os.path.exists(output_path):
-        try:
-            os.makedirs(output_path)
-        except OSError as e:
-            print(f"Error creating output path: {e}")
-            return
+    print("\n\tGetting volume cover link and downloading...")
+    image_link = CoverArt.fetch_cover_image(api.get_cover(cover_id=volume.cover))
+    number_of_api_hits += 2
+    if not image_link:
+        print("\t\t\tCover not found")
+        return None, None
+
+    print(f"\t\tGetting cover: {image_link}")
+    if page_store is not None:
+        data = page_store.read(get_page_key(image_link))
+        if data is not None:
+            print("\t\t\tCover found in the page store")
+            return image_link, data
+
+    # download the image through the shared session pool
+    try:
+        r = URLRequest.request_raw(image_link, timeout=10)
+    except Exception as e:
+        print(f"\t\tError downloading cover: {str(e)}")
+        return None, None
+    if r.status_code != 200:
+        print("\t\t\tCover not downloaded")
+        return None, None
+
+    print("\t\t\tCover downloaded")
+    if page_store is not None:
+        page_store.put(get_page_key(image_link), r.content)
+    return image_link, r.content
+
+
+def download_volume_pages(
+    series_name,
+    volume,
+    volume_number,
+    folder_path,
+    journal=None,
+    writer=None,
+    prefetcher=None,
+):
+    """
+    Downloads the pages of a volume chapter by chapter, each chapter concurrently.
+    The pages go into folder_path, or into the writer when one is given.
+    The at-home leases come from the prefetcher, the shared lease_prefetcher by default.
+    Returns the page tasks and whether a page failed
+    """
+    global number_of_api_hits
 
-    search = DEFAULT_SEARCH
+    prefetcher = prefetcher or lease_prefetcher
 
-    # Get the search string from the user
-    if get_user_input:
-        search = get_input_from_user("Enter manga name", [])
+    # Download the chapters
+    print("\n\t\tGetting chapters...")
+    count = 1
+    failed_on_page = False
+    volume_start = time.perf_counter()
+    volume_tasks = []
 
-    # Get the manga feed
-    api = mangadex.Api()
+    for chapter_index, chapter in enumerate(volume.chapters):
+        if failed_on_page:
+            break
+
+        # request the at-home servers of the next chapters while this one downloads
+        prefetcher.prefetch(volume.chapters[chapter_index:])
+
+        if chapter.title:
+            print(f"\t\t\tChapter: {chapter.chapter} - {chapter.title}")
+        else:
+            print(f"\t\t\tChapter: {chapter.chapter}")
+
+        # Get the chapter
+        chapter_url = chapter.url
+        number_of_api_hits += 1
+
+        if chapter_url:
+            # if there's a double slash after .org, then replace it with only one slash
+            if re.search(r"\.org//", chapter_url):
+                chapter_url = re.sub(r"\.org//", ".org/", chapter_url)
+
+            print("\t\t\tChapter URL: " + chapter_url)
+
+            # Get the chapter pages
+            try:
+                lease = prefetcher.get(chapter)
+                chapter_pages = lease.urls
+            except Exception as e:
+                print(f"\t\t\tError getting chapter pages: {str(e)}")
+                # keep the folder, the downloaded pages are resumed on the next run
+                failed_on_page = True
+                break
+
+            number_of_api_hits += 1
+
+            if chapter_pages:
+                print("\t\t\tPages:")
+
+                # the page numbers are assigned before downloading,
+                # so the naming doesn't depend on which download finishes first
+                tasks = []
+                for lease_index, page in enumerate(chapter_pages):
+                    page_index = count + lease_index
+                    page_name = get_page_name(
+                        series_name,
+                        chapter,
+                        page_index,
+                        volume_number,
+                        page.split(".")[-1],
+                    )
+                    tasks.append(
+                        PageTask(
+                            page_index,
+                            page,
+                            os.path.join(folder_path, page_name),
+                            chapter_id=chapter.chapter_id,
+                            lease=lease,
+                            lease_index=lease_index,
+                        )
+                    )
+
+                chapter_start = time.perf_counter()
+                tasks = page_downloader.download_pages(tasks, journal, writer)
+                number_of_api_hits += len(
+                    [task for task in tasks if task.status == "downloaded"]
+                )
+
+                for page_index, task in enumerate(tasks, start=1):
+                    print(f"\t\t\t\tPage [{page_index}/{len(tasks)}] - {task.url}")
+                    print(f"\t\t\t\t\tFile: {task.filename}")
+                    if task.status == "resumed":
+                        print("\t\t\t\t\tAlready downloaded")
+                        count += 1
+                    elif task.downloaded:
+                        print(
+                            f"\t\t\t\t\tDownloaded ({task.size} bytes in {task.latency:.2f}s)"
+                        )
+                        count += 1
+                    else:
+                        print(f"\t\t\t\t\tPage not downloaded: {task.error}")
+                        failed_on_page = True
+
+                print(
+                    "\t\t\tChapter: "
+                    + get_download_summary(tasks, time.perf_counter() - chapter_start)
+                )
+                volume_tasks.extend(tasks)
+
+    prefetcher.discard()
+    print(
+        "\n\t\tVolume: "
+        + get_download_summary(volume_tasks, time.perf_counter() - volume_start)
+    )
+    return volume_tasks, failed_on_page
+
+
+def get_cbz_comment(image_mode):
+    """
+    Returns the comment of the CBZs, records the source and the image mode
+    EX: Source: MangaDex, images: data-saver
+    """
+    return f"Source: {source}, images: {image_mode}"
+
+
+def save_volume_record(manga_id, series_name, volume, image_link, volume_tasks):
+    """
+    Saves the record of a downloaded volume, so repack.py can pack it again
+    from the page store. Pages resumed from an older run are added to the store first.
+    """
+    if page_store is None:
+        return
+    for task in volume_tasks:
+        if task.status == "resumed" and os.path.isfile(task.path):
+            page_store.put_file(task.key, task.path)
+    # the cover has no digest in its file name, repack checks it against this one
+    cover_data = page_store.read(get_page_key(image_link))
+    record = VolumeRecord.from_tasks(
+        manga_id,
+        series_name,
+        volume,
+        image_link,
+        get_page_key(image_link),
+        volume_tasks,
+        image_mode=image_mode,
+        cover_sha256=hashlib.sha256(cover_data).hexdigest() if cover_data else None,
+    )
+    record.save(volume_records_path)
+
+
+def stream_volume(
+    api, series_name, volume, volume_number, folder_path, cbz_path, prefetcher=None
+):
+    """
+    Downloads a volume straight into its CBZ, the pages never touch the disk on their own.
+    Returns the cover link and the page tasks, or None for both if the CBZ wasn't created
+    """
+    image_link, cover_data = download_cover(api, volume)
+    if cover_data is None:
+        print("\t\t\tSkipping volume...")
+        return None, None
+
+    writer = StreamingCBZWriter(
+        cbz_path, policy=packing_policy, comment=get_cbz_comment(image_mode)
+    )
+    writer.add(
+        0, get_cover_name(series_name, volume, volume_number, image_link), cover_data
+    )
+
+    volume_tasks, failed_on_page = download_volume_pages(
+        series_name,
+        volume,
+        volume_number,
+        folder_path,
+        writer=writer,
+        prefetcher=prefetcher,
+    )
+    if failed_on_page:
+        writer.abort()
+        print("\t\t\tNot all pages downloaded")
+        print("\t\t\tSkipping volume...")
+        return None, None
+
+    try:
+        writer.close()
+    except ValueError as e:
+        print(f"\t\t\t{e}")
+        print("\t\t\tSkipping volume...")
+        return None, None
+
+    print("\t\t\t\tCBZ created")
+    print(f"\t\t\t\t\t{writer.report.summary()}")
+    return image_link, volume_tasks
+
+
+def get_chapters_from_chapter_list(api, manga_id):
+    """
+    Gets every chapter of a series from /chapter, 100 chapters per page.
+    The first page gives the total, the other pages are requested concurrently.
+    """
+    global number_of_api_hits
+
+    manga_chapters = api.get_all_pages(
+        api.chapter_list,
+        translatedLanguage=[translated_language],
+        manga=manga_id,
+        limit=100,
+    )
+    number_of_api_hits += max(1, -(-len(manga_chapters) // 100))
+    print(
+        f"\t\tGot chapter feed with {len(manga_chapters)}/{manga_chapters.total} chapters"
+    )
+    return list(manga_chapters)
+
+
+def get_chapters_from_feed(api, manga_id):
+    """
+    Gets every chapter of a series from /manga/{id}/feed, 500 chapters per page,
+    already sorted by volume and chapter.
+    """
+    global number_of_api_hits
+
+    manga_chapters = api.get_all_pages(
+        api.manga_feed,
+        manga_id=manga_id,
+        translatedLanguage=[translated_language],
+        contentRating=["safe", "suggestive", "erotica", "pornographic"],
+        order={"volume": "asc", "chapter": "asc"},
+        limit=500,
+    )
+    number_of_api_hits += max(1, -(-len(manga_chapters) // 500))
+    print(
+        f"\t\tGot manga feed with {len(manga_chapters)}/{manga_chapters.total} chapters"
+    )
+    return list(manga_chapters)
+
+
+def plan_chapters_from_aggregate(aggregate):
+    """
+    Builds the chapters of a series from a /manga/{id}/aggregate response.
+    Only the chapter id, number and volume are known,
+    fetch_volume_chapters fills in the rest for the volumes being downloaded.
+    Unnumbered chapters are skipped, they can't be named.
+    """
+    chapters = []
+    volumes_data = aggregate.values() if isinstance(aggregate, dict) else aggregate
+    for volume_data in volumes_data:
+        chapters_data = volume_data["chapters"]
+        if isinstance(chapters_data, dict):
+            chapters_data = chapters_data.values()
+        for chapter_data in chapters_data:
+            try:
+                chapter_number = float(chapter_data["chapter"])
+            except (TypeError, ValueError):
+                print(f"\t\tSkipping unnumbered chapter: {chapter_data['id']}")
+                continue
+            chapter = Chapter()
+            chapter.chapter_id = chapter_data["id"]
+            chapter.chapter = chapter_number
+            chapter.volume = volume_data["volume"]
+            chapters.append(chapter)
+    return chapters
+
+
+def get_chapters_from_aggregate(api, manga_id):
+    """
+    Gets the volume -> chapter plan of a series with a single /aggregate request.
+    The aggregate lists one chapter per chapter number, so there are no duplicates.
+    """
+    global number_of_api_hits
+
+    aggregate = api.get_manga_volumes_and_chapters(
+        manga_id, translatedLanguage=[translated_language]
+    )
+    number_of_api_hits += 1
+    manga_chapters = plan_chapters_from_aggregate(aggregate)
+    print(f"\t\tGot aggregate with {len(manga_chapters)} chapters")
+    return manga_chapters
+
+
+def fetch_volume_chapters(api, volumes):
+    """
+    Replaces the planned chapters of the volumes with the full chapter details,
+    100 chapters per request. Volumes with a chapter that can't be found are dropped.
+    """
+    global number_of_api_hits
+
+    chapter_ids = [
+        chapter.chapter_id for volume in volumes for chapter in volume.chapters
+    ]
+    chapters_by_id = {}
+    for start in range(0, len(chapter_ids), 100):
+        ids = chapter_ids[start : start + 100]
+        for chapter in api.chapter_list(
+            ids=ids,
+            limit=len(ids),
+            contentRating=["safe", "suggestive", "erotica", "pornographic"],
+        ):
+            chapters_by_id[chapter.chapter_id] = chapter
+        number_of_api_hits += 1
+    print(f"\tGot details for {len(chapters_by_id)}/{len(chapter_ids)} chapters")
+
+    fetched_volumes = []
+    for volume in volumes:
+        missing = [
+            chapter
+            for chapter in volume.chapters
+            if chapter.chapter_id not in chapters_by_id
+        ]
+        if missing:
+            print(
+                f"\t\tRemoving volume {volume.volume_number}, "
+                f"chapter {missing[0].chapter} ({missing[0].chapter_id}) not found"
+            )
+            continue
+        chapters = []
+        for planned_chapter in volume.chapters:
+            chapter = chapters_by_id[planned_chapter.chapter_id]
+            chapter.volume = planned_chapter.volume
+            chapters.append(chapter)
+        volume.chapters = chapters
+        fetched_volumes.append(volume)
+    return fetched_volumes
+
+
+def find_series(api, search):
+    """
+    Resolves the search to a series, from the title index if the title is known,
+    otherwise by searching Mangadex and filtering the results by similarity score.
+    Returns the Manga or None
+    """
+    global number_of_api_hits, series_name
+
+    # Replace : with " - " in the search string
+    compare_title = search.replace(":", " - ")
+
+    if title_index is not None:
+        match = title_index.lookup(
+            compare_title, requried_similarity_score, original_language=language
+        )
+        if match:
+            manga_series, similarity_score = match
+            series_name = sanitize_series_name(compare_title)
+            print(f"\nSearching the title index:\n\tSearch: {compare_title}")
+            print(f"\t\tMatch: ({similarity_score} >= {requried_similarity_score})")
+            return manga_series
 
     # Search for the manga
     manga_series = api.get_manga_list(
         title=search, limit=limit, offset=offset, originalLanguage=[language]
     )
 
-    # Replace : with " - " in the search string
-    search = search.replace(":", " - ")
-
-    print(f"\nSearching Mangadex:\n\tSearch: {search}")
+    print(f"\nSearching Mangadex:\n\tSearch: {compare_title}")
 
     number_of_api_hits += 1
 
     if not manga_series:
         print("No manga feed found")
-        return
+        return None
     print("\t\tGot manga feed")
 
+    if title_index is not None:
+        title_index.add_series(manga_series)
+        title_index.save()
+
     print("\n\tFiltering series by similarity score...")
     manga_series = filter_series_by_similarity_score(
-        manga_series, search, requried_similarity_score
+        manga_series, compare_title, requried_similarity_score
     )
 
     if not manga_series:
         print("\tNo series found")
+        return None
+
+    return manga_series[0]
+
+
+def filter_volumes(volumes, only_these_volumes):
+    """
+    Keeps the volumes selected by only_these_volumes,
+    EX: [1, 2, 3], 1, "1,2,3", "1-3", "2", or "all" / [] / "" for every volume
+    """
+    if not only_these_volumes or only_these_volumes == "all":
+        return volumes
+
+    try:
+        selected = get_selected_volumes(only_these_volumes)
+    except ValueError:
+        print(f"\tInvalid volume selection: {only_these_volumes}")
+        return []
+
+    return [volume for volume in volumes if volume.volume_number in selected]
+
+
+def get_selected_volumes(only_these_volumes):
+    """
+    Returns the volume numbers of a volume selection, as floats
+    """
+    # EX: [1,2,3]
+    if isinstance(only_these_volumes, list):
+        selected = [float(x) for x in only_these_volumes]
+    # EX: 1 or 1.0
+    elif isinstance(only_these_volumes, (int, float)):
+        selected = [float(only_these_volumes)]
+    # EX: 1,2,3
+    elif re.search(r",", only_these_volumes):
+        # remove empty spaces
+        selected = [
+            float(x.strip()) for x in only_these_volumes.split(",") if x.strip()
+        ]
+    # EX: 1-3
+    elif re.search(r"-", only_these_volumes):
+        split_on_dash = only_these_volumes.split("-")
+
+        # get the lowest and highest values
+        lowest = int(split_on_dash[0])
+        highest = int(split_on_dash[1])
+
+        # fill in the missing values
+        selected = [float(x) for x in range(lowest, highest + 1)]
+    else:
+        selected = [float(only_these_volumes)]
+
+    return selected
+
+
+def main():
+    setup()
+
+    # Create the output path if it doesn't exist
+    if output_path and not os.path.exists(output_path):
+        try:
+            os.makedirs(output_path)
+        except OSError as e:
+            print(f"Error creating output path: {e}")
+            return
+
+    search = DEFAULT_SEARCH
+
+    # Get the search string from the user
+    if get_user_input:
+        search = get_input_from_user("Enter manga name", [])
+
+    # Get the manga feed
+    api = mangadex.Api()
+
+    manga_series = find_series(api, search)
+    if not manga_series:
         return
 
-    manga_series = manga_series[0]
+    pack_series(api, manga_series, series_name)
+
+
+def pack_series(api, manga_series, series_name, only_these_volumes=None):
+    """
+    Downloads and packs the volumes of a series into {output_path}/{series_name}.
+    When only_these_volumes is None, the user is asked which volumes to download.
+    Returns True if the series got to the download, False if it stopped before
+    """
+    volumes = plan_series(api, manga_series, only_these_volumes)
+    if not volumes:
+        return False
+
+    create_series_folder(series_name)
 
-    manga_chapters = []
+    packing_pipeline = PackingPipeline(
+        workers=pack_workers, use_processes=pack_with_processes, policy=packing_policy
+    )
+    download_times = {}
+
+    print("\nCreating volume folders...")
+    for volume in volumes:
+        pack_volume(
+            api, manga_series, series_name, volume, packing_pipeline, download_times
+        )
 
-    # manga_chapters = api.get_manga_volumes_and_chapters(manga_series.manga_id)
+    finish_packing(packing_pipeline, download_times)
+    return True
 
-    # # get rid of unassigned chapters
-    # if "none" in manga_chapters:
-    #     manga_chapters.pop("none")
 
-    # # sort by volume value
-    # manga_chapters = sorted(manga_chapters.values(), key=lambda x: float(x["volume"]))
+def plan_series(api, manga_series, only_these_volumes=None):
+    """
+    Finds the chapters and the covers of a series and groups them into the volumes
+    to download. When only_these_volumes is None, the user is asked which volumes.
+    Returns the volumes, or None if the series can't be packed
+    """
+    global number_of_api_hits
 
     print("\n\tSeries Link: " + manga_series.url)
 
     print("\n\tSearching for chapters:")
-
-    done = False
-    first = True
-    while not done:
-        if first:
-            manga_search = api.chapter_list(
-                translatedLanguage=["en"],
-                manga=manga_series.manga_id,
-                limit=100,
-            )
-            first = False
-        else:
-            manga_search = api.chapter_list(
-                translatedLanguage=["en"],
-                manga=manga_series.manga_id,
-                limit=100,
-                offset=len(manga_chapters),
-            )
-        number_of_api_hits += 1
-        if not manga_search:
-            done = True
-        else:
-            print("\t\tGot chapter feed with " + str(len(manga_search)) + " chapters")
-            manga_chapters.extend(manga_search)
-            time.sleep(sleep_time)
+    if chapter_discovery == "aggregate":
+        manga_chapters = get_chapters_from_aggregate(api, manga_series.manga_id)
+    elif chapter_discovery == "feed":
+        manga_chapters = get_chapters_from_feed(api, manga_series.manga_id)
+    else:
+        manga_chapters = get_chapters_from_chapter_list(api, manga_series.manga_id)
 
     print(f"\tTotal Chapters: {len(manga_chapters)}")
 
@@ -475,7 +1166,7 @@ def main():
             print(f"\tMissing volume(s): {', '.join(missing_volumes)}")
         else:
             print("\tNo missing volumes")
-        return
+        return None
 
     print("\tNo missing chapters or volumes")
     print("\tGrouping chapters by volume...")
@@ -512,68 +1203,17 @@ def main():
     print("\n\tTotal Volumes: " + str(len(volumes)))
 
     # Ask the user what volumes they want to download
-    only_these_volumes = get_input_from_user(
-        "\tSpecify volumes to download",
-        [],
-        '"1,2,3" or "1-3" or "all"',
-    )
-    if only_these_volumes == "all":
-        only_these_volumes = []
-
-    # Filter volumes by user input
-    if only_these_volumes:
-        # EX: [1,2,3]
-        if isinstance(only_these_volumes, list):
-            volumes = [
-                volume
-                for volume in volumes
-                if volume.volume_number in only_these_volumes
-            ]
-        # EX: 1 or 1.0
-        elif isinstance(only_these_volumes, int) or isinstance(
-            only_these_volumes, float
-        ):
-            volumes = [
-                volume
-                for volume in volumes
-                if volume.volume_number == only_these_volumes
-            ]
-        elif isinstance(only_these_volumes, str):
-            # EX: 1,2,3
-            if re.search(r",", only_these_volumes):
-                # remove empty spaces
-                split_on_comma = [x.strip() for x in only_these_volumes.split(",")]
-                volumes = [
-                    volume
-                    for volume in volumes
-                    if volume.volume_number in split_on_comma
-                ]
-            # EX: 1-3
-            elif re.search(r"-", only_these_volumes):
-                split_on_dash = only_these_volumes.split("-")
-
-                # get the lowest and highest values
-                lowest = int(split_on_dash[0])
-                highest = int(split_on_dash[1])
-
-                # fill in the missing values
-                split_on_dash = [x for x in range(lowest, highest + 1)]
-
-                volumes = [
-                    volume
-                    for volume in volumes
-                    if volume.volume_number in split_on_dash
-                ]
-            else:
-                volumes = [
-                    volume
-                    for volume in volumes
-                    if volume.volume_number == only_these_volumes
-                ]
+    if only_these_volumes is None:
+        only_these_volumes = get_input_from_user(
+            "\tSpecify volumes to download",
+            [],
+            '"1,2,3" or "1-3" or "all"',
+        )
+    volumes = filter_volumes(volumes, only_these_volumes)
 
     if not volumes:
         print("No volumes found after grouping chapters")
-        return
+        return None
 
     print("\tGot volumes")
 
@@ -617,7 +1257,7 @@ def main():
         print(
             f"\tERROR: Number of covers ({len(covers)}) does not match number of volumes ({len(volumes)})"
         )
-        return
+        return None
 
     cover_dict = {cover.volume: cover.cover_id for cover in covers}
 
@@ -628,6 +1268,15 @@ def main():
         else:
             print(f"Cover not found for volume {volume.volume_number}")
 
+    # the aggregate plan only has the chapter ids,
+    # get the full chapter details for the selected volumes only
+    if chapter_discovery == "aggregate":
+        print("\nGetting chapter details for the selected volumes...")
+        volumes = fetch_volume_chapters(api, volumes)
+        if not volumes:
+            print("\tNo volumes left to download")
+            return None
+
     print("\n\tVolumes:")
     for volume in volumes:
         print(f"\t\tVolume: {volume.volume_number}")
@@ -637,6 +1286,13 @@ def main():
         for chapter in volume.chapters:
             print(f"\t\t\t\t{get_chapter_info(chapter)}")
 
+    return volumes
+
+
+def create_series_folder(series_name):
+    """
+    Creates the folder of a series in the output_path, if it doesn't exist
+    """
     print("\nCreating series folder...")
     series_path = os.path.join(output_path, series_name)
     if not os.path.exists(series_path):
@@ -646,256 +1302,286 @@ def main():
     else:
         print("\tSeries folder already exists, using existing folder")
 
-    print("\nCreating volume folders...")
-    for volume in volumes:
-        converted_volume_number = (
-            int(volume.volume_number)
-            if volume.volume_number.is_integer()
-            else float(volume.volume_number)
-        )
-        folder_name = get_folder_name(series_name, converted_volume_number, source)
-        folder_path = os.path.join(output_path, series_name, folder_name)
-        cbz_path = f"{folder_path}.cbz"
-
-        if os.path.isfile(cbz_path):
-            print(f"\tSkipping volume: {folder_name}\n\t\talready exists")
-            continue
 
-        print(f"\tVolume: {volume.volume_number}")
-        print(f"\tCover: {volume.cover}")
+def pack_volume(
+    api,
+    manga_series,
+    series_name,
+    volume,
+    packing_pipeline,
+    download_times,
+    prefetcher=None,
+):
+    """
+    Downloads a volume, streams it into its CBZ or queues its folder in the packing_pipeline.
+    Returns False if the volume was skipped because of a failure
+    """
+    volume_start = time.perf_counter()
+    converted_volume_number = (
+        int(volume.volume_number)
+        if volume.volume_number.is_integer()
+        else float(volume.volume_number)
+    )
+    folder_name = get_folder_name(series_name, converted_volume_number, source)
+    folder_path = os.path.join(output_path, series_name, folder_name)
+    cbz_path = f"{folder_path}.cbz"
+
+    if os.path.isfile(cbz_path):
+        print(f"\tSkipping volume: {folder_name}\n\t\talready exists")
+        return True
+
+    print(f"\tVolume: {volume.volume_number}")
+    print(f"\tCover: {volume.cover}")
+
+    if stream_to_cbz:
+        print(f"\n\tStreaming volume into: {os.path.basename(cbz_path)}")
+        image_link, volume_tasks = stream_volume(
+            api,
+            series_name,
+            volume,
+            converted_volume_number,
+            folder_path,
+            cbz_path,
+            prefetcher=prefetcher,
+        )
+        if volume_tasks is not None:
+            save_volume_record(
+                manga_series.manga_id, series_name, volume, image_link, volume_tasks
+            )
+        return volume_tasks is not None
 
-        print(f"\n\tCreating volume folder: {folder_name}")
-        print(f"\t\tFolder path: {folder_path}")
-        if not os.path.exists(folder_path):
-            os.mkdir(folder_path)
-            if os.path.exists(folder_path):
-                print("\t\t\tFolder created")
-            else:
-                print("\t\t\tFolder not created, skipping volume...")
-                continue
+    print(f"\n\tCreating volume folder: {folder_name}")
+    print(f"\t\tFolder path: {folder_path}")
+    if not os.path.exists(folder_path):
+        os.mkdir(folder_path)
+        if os.path.exists(folder_path):
+            print("\t\t\tFolder created")
         else:
-            print("\t\t\tFolder already exists")
-
-            # if not empty, then delete it
-            if len(os.listdir(folder_path)) > 0:
-                print("\t\t\tDeleting folder along with contents...")
-                # remove the folder along with all of its contents
-                shutil.rmtree(folder_path)
-                if not os.path.exists(folder_path):
-                    print("\t\t\tFolder deleted")
-                    # create the folder again
-                    os.mkdir(folder_path)
-                    if os.path.exists(folder_path):
-                        print("\t\t\tFolder recreated")
-                    else:
-                        print("\t\tFolder not recreated")
-                        print("\t\t\tSkipping volume...")
-                        continue
+            print("\t\t\tFolder not created, skipping volume...")
+            return False
+    else:
+        print("\t\t\tFolder already exists")
+
+        journal = VolumeJournal.load(folder_path) if resume_downloads else None
+        # the pages of the other image mode can't be mixed in
+        if journal and journal.image_mode != image_mode:
+            print(f"\t\t\tDownloaded as {journal.image_mode} images, starting over")
+            journal = None
+
+        # if there's a journal, keep the verified pages and resume the download
+        if journal:
+            verified_pages = journal.verify()
+            remove_stray_files(folder_path, verified_pages)
+            print(f"\t\t\tResuming download, {len(verified_pages)} pages verified")
+        # if not empty, then delete it
+        elif len(os.listdir(folder_path)) > 0:
+            print("\t\t\tDeleting folder along with contents...")
+            # remove the folder along with all of its contents
+            shutil.rmtree(folder_path)
+            if not os.path.exists(folder_path):
+                print("\t\t\tFolder deleted")
+                # create the folder again
+                os.mkdir(folder_path)
+                if os.path.exists(folder_path):
+                    print("\t\t\tFolder recreated")
                 else:
-                    print("\t\tFolder not deleted")
-                    print("\t\tSkipping volume...")
-                    continue
+                    print("\t\tFolder not recreated")
+                    print("\t\t\tSkipping volume...")
+                    return False
             else:
-                print("\t\tFolder is empty")
-                print("\t\tUsing folder...")
+                print("\t\tFolder not deleted")
+                print("\t\tSkipping volume...")
+                return False
+        else:
+            print("\t\tFolder is empty")
+            print("\t\tUsing folder...")
 
-        if os.path.exists(folder_path):
-            print("\n\tGetting volume cover link and downloading...")
-            image_link = CoverArt.fetch_cover_image(
-                api.get_cover(cover_id=volume.cover)
-            )
-            number_of_api_hits += 2
-            cover_path = None
-            if image_link:
-                print(f"\t\tGetting cover: {image_link}")
-                # download the image into the folder using requests
-                # use generic User-Agent
-                try:
-                    r = requests.get(
-                        image_link,
-                        stream=True,
-                        timeout=10,
-                        headers={"User-Agent": "Mozilla/5.0"},
-                    )
-                except Exception as e:
-                    print(f"\t\tError downloading cover: {str(e)}")
-                    continue
-                if r.status_code == 200:
-                    print("\t\t\tCover downloaded")
-
-                    # save the image to the folder
-                    first_chapter_number = volume.chapters[0].chapter
-
-                    # format the chapter and volume numbers
-                    chapter_and_volume_numbers = format_chapter_and_volume_numbers(
-                        first_chapter_number,
-                        converted_volume_number,
-                    )
-                    # get the file extension
-                    _, image_link_extension = os.path.splitext(image_link)
-                    cover_name = f"{series_name} - {chapter_and_volume_numbers} - p000 [Cover] [{source}]{image_link_extension}"
-                    cover_path = os.path.join(folder_path, cover_name)
-                    with open(cover_path, "wb") as f:
-                        r.raw.decode_content = True
-                        shutil.copyfileobj(r.raw, f)
-                else:
-                    print("\t\t\tCover not downloaded")
-                    print("\t\t\tSkipping volume...")
-                    continue
+    if os.path.exists(folder_path):
+        journal = VolumeJournal.load(folder_path) or VolumeJournal(
+            folder_path, image_mode=image_mode
+        )
 
-            if not cover_path or not os.path.isfile(cover_path):
-                print("\t\t\tCover not found")
-                print("\t\t\tSkipping volume...")
-                continue
+        image_link, cover_data = download_cover(api, volume)
+        if cover_data is None:
+            print("\t\t\tSkipping volume...")
+            return False
 
-            # Download the chapters
-            print("\n\t\tGetting chapters...")
-            count = 1
-            failed_on_page = False
+        # save the image to the folder
+        cover_name = get_cover_name(
+            series_name, volume, converted_volume_number, image_link
+        )
+        cover_path = os.path.join(folder_path, cover_name)
+        with open(cover_path, "wb") as f:
+            f.write(cover_data)
+
+        volume_tasks, failed_on_page = download_volume_pages(
+            series_name,
+            volume,
+            converted_volume_number,
+            folder_path,
+            journal=journal,
+            prefetcher=prefetcher,
+        )
 
-            for chapter in volume.chapters:
-                if failed_on_page:
-                    break
+        # Verify that all the pages were downloaded
+        if failed_on_page:
+            print("\t\t\tNot all pages downloaded, keeping them for the next run")
+            print("\t\t\tSkipping volume...")
+            return False
 
-                if chapter.title:
-                    print(f"\t\t\tChapter: {chapter.chapter} - {chapter.title}")
-                else:
-                    print(f"\t\t\tChapter: {chapter.chapter}")
-
-                # Get the chapter
-                chapter_url = chapter.url
-                number_of_api_hits += 1
-
-                if chapter_url:
-                    # if there's a double slash after .org, then replace it with only one slash
-                    if re.search(r"\.org//", chapter_url):
-                        chapter_url = re.sub(r"\.org//", ".org/", chapter_url)
-
-                    print("\t\t\tChapter URL: " + chapter_url)
-
-                    # Get the chapter pages
-                    try:
-                        chapter_pages = Chapter.fetch_chapter_images(chapter)
-                    except Exception as e:
-                        print(f"\t\t\tError getting chapter pages: {str(e)}")
-                        # delete the folder
-                        shutil.rmtree(folder_path)
-                        break
-
-                    number_of_api_hits += 1
-
-                    if chapter_pages:
-                        print("\t\t\tPages:")
-
-                        # download each page into the folder
-                        # FORAMT: {series_name} - c{chapter_number} (v{volume_number}) - p{page_number} [{source}] [{title}].{extension}
-                        # EX: One Piece - c001 (v01) - p001 [MangaDex] [English] [Scanlation].jpg
-                        for page in chapter_pages:
-                            page_index = chapter_pages.index(page) + 1
-                            page_number = count
-                            chapter_number = chapter.chapter
-                            page_extension = page.split(".")[-1]
-
-                            if page_number < 10:
-                                page_number = f"00{page_number}"
-                            elif page_number < 100:
-                                page_number = f"0{page_number}"
-                            else:
-                                page_number = page_number
-
-                            chapter_number = format_chapter_and_volume_numbers(
-                                chapter_number,
-                                converted_volume_number,
-                            )
-
-                            page_name = f"{series_name} - {chapter_number} - p{page_number} [{source}]"
-
-                            if chapter.title:
-                                clean_title = re.sub(r'"', "", unidecode(chapter.title))
-                                # replace : with " - "
-                                clean_title = re.sub(r":", " - ", clean_title).strip()
-                                # remove /
-                                clean_title = re.sub(r"/", " - ", clean_title).strip()
-                                # remove any dual space
-                                clean_title = re.sub(
-                                    r"\s{2,}", " ", clean_title
-                                ).strip()
-                                page_name += f" [{clean_title}]"
-
-                            page_name += f".{page_extension}"
-
-                            print(
-                                f"\t\t\t\tPage [{int(page_index)}/{len(chapter_pages)}] - {page}"
-                            )
-                            page_path = os.path.join(folder_path, page_name)
-                            print(f"\t\t\t\t\tFile: {page_name}")
-
-                            # Download the page
-                            try:
-                                r = requests.get(
-                                    page,
-                                    stream=True,
-                                    timeout=10,
-                                    headers={"User-Agent": "Mozilla/5.0"},
-                                )
-                            except Exception as e:
-                                print("\t\t\t\t\tPage not downloaded" + str(e))
-                                failed_on_page = True
-                                continue
-
-                            number_of_api_hits += 1
-                            time.sleep(sleep_time)
-
-                            if r.status_code == 200:
-                                # Save the page to the folder
-                                with open(page_path, "wb") as f:
-                                    r.raw.decode_content = True
-                                    shutil.copyfileobj(r.raw, f)
-
-                                print("\t\t\t\t\tDownloaded")
-                                count += 1
-                            else:
-                                print("\t\t\t\t\tNot downloaded")
-
-            # Verify that all the pages were downloaded
-            if len(os.listdir(folder_path)) != count:
-                print("\t\t\tNot all pages downloaded")
-                print("\t\t\tSkipping volume...")
-                continue
+        remove_stray_files(
+            folder_path,
+            [cover_name] + [task.filename for task in volume_tasks],
+        )
+        if len(list_page_files(folder_path)) != len(volume_tasks) + 1:
+            print("\t\t\tNot all pages downloaded")
+            print("\t\t\tSkipping volume...")
+            return False
 
-            # Package the folder into a CBZ file
-            print("\n\t\t\tPacking folder into CBZ...")
-
-            # Create the CBZ file
-            with zipfile.ZipFile(
-                cbz_path,
-                "w",
-                compression=zipfile.ZIP_DEFLATED,
-            ) as cbz:
-                # Add all the files in the folder to the CBZ
-                file_list = os.listdir(folder_path)
-                file_list = [file for file in file_list if not file.startswith(".")]
-                file_list.sort()
-
-                for file in file_list:
-                    file_path = os.path.join(folder_path, file)
-                    cbz.write(file_path, file)
-
-            if os.path.isfile(cbz_path):
-                print("\t\t\t\tCBZ created")
-
-                # Delete the folder
-                print("\n\t\t\tDeleting folder...")
-                shutil.rmtree(folder_path)
-
-                if not os.path.exists(folder_path):
-                    print("\t\t\t\tFolder deleted")
-                else:
-                    print("\t\t\t\tFolder not deleted")
-            else:
-                print("\t\t\t\tCBZ not created")
-                print("\t\t\tSkipping volume...")
-                continue
+        save_volume_record(
+            manga_series.manga_id, series_name, volume, image_link, volume_tasks
+        )
+
+        # Package the folder into a CBZ file, while the next volume downloads
+        print("\n\t\t\tQueued folder for packing into CBZ...")
+        packing_pipeline.submit(
+            folder_name,
+            folder_path,
+            sorted(list_page_files(folder_path)),
+            cbz_path,
+            comment=get_cbz_comment(image_mode),
+        )
+        download_times[folder_name] = time.perf_counter() - volume_start
+        return True
+    return False
+
+
+def finish_packing(packing_pipeline, download_times):
+    """
+    Waits for the queued volumes to be packed and prints the time spent in each stage
+    """
+    if download_times:
+        print("\nPacking volumes...")
+    for folder_name, result in packing_pipeline.results():
+        print(f"\tVolume: {folder_name}")
+        if result.ok:
+            print("\t\tCBZ created and verified, folder deleted")
+            print(f"\t\t\t{result.report.summary()}")
+        else:
+            print(f"\t\tCBZ not created: {result.error}")
+            print("\t\tThe folder was kept, run again to retry")
+        print(
+            f"\t\tDownload: {download_times.get(folder_name, 0):.2f}s, "
+            f"Pack: {result.pack_seconds:.2f}s, Verify: {result.verify_seconds:.2f}s"
+        )
+    packing_pipeline.shutdown()
+
+
+def print_session_stats():
+    """
+    Prints the connection reuse statistics of the shared session pool
+    """
+    stats = URLRequest.session_pool.stats()
+    if not stats:
+        return
+    print("\nConnection pool:")
+    for host, host_stats in stats.items():
+        print(
+            f"\t{host}: {host_stats['requests']} requests, "
+            f"{host_stats['connections']} connections, "
+            f"{host_stats['reused']} reused"
+        )
+
+
+def print_rate_limit_stats():
+    """
+    Prints how long the shared rate limiter held back the requests of each host
+    """
+    stats = URLRequest.rate_limiter.stats()
+    if not stats:
+        return
+    print("\nRate limits:")
+    for bucket, bucket_stats in stats.items():
+        print(
+            f"\t{bucket}: {bucket_stats['acquired']} requests, "
+            f"waited {bucket_stats['waited']}s, "
+            f"{bucket_stats['pauses']} pauses"
+        )
+
+
+def print_retry_stats():
+    """
+    Prints the retry counters of the shared retry policy
+    """
+    stats = URLRequest.retry_policy.stats()
+    if not stats["retries"] and not stats["exhausted"]:
+        return
+    reasons = ", ".join(
+        f"{reason}: {count}" for reason, count in stats["reasons"].items()
+    )
+    print(
+        f"\nRetries: {stats['retries']} ({reasons}), "
+        f"{stats['exhausted']} requests gave up"
+    )
+
+
+def print_cache_stats():
+    """
+    Prints the hit and miss counters of the response cache
+    """
+    if URLRequest.cache is None:
+        return
+    stats = URLRequest.cache.stats()
+    print(
+        f"\nResponse cache: {stats['hits']} hits, {stats['revalidated']} revalidated, "
+        f"{stats['misses']} misses, {stats['evictions']} evicted, "
+        f"{stats['bytes'] / 1024 / 1024:.2f} MB on disk"
+    )
+
+
+def print_title_index_stats():
+    """
+    Prints the size and the hit counters of the title index
+    """
+    if title_index is None:
+        return
+    stats = title_index.stats()
+    print(
+        f"\nTitle index: {stats['series']} series, {stats['titles']} titles, "
+        f"{stats['hits']} hits, {stats['misses']} misses"
+    )
+
+
+def print_page_store_stats():
+    """
+    Prints the hit and miss counters of the page store
+    """
+    if page_store is None:
+        return
+    stats = page_store.stats()
+    print(
+        f"\nPage store: {stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['evictions']} evicted, "
+        f"{stats['bytes'] / 1024 / 1024:.2f} MB on disk"
+    )
+
+
+def print_node_stats():
+    """
+    Prints the latency, throughput and error rate of every image node
+    """
+    stats = node_health.stats()
+    if not stats:
+        return
+    print("\nImage nodes:")
+    for host, host_stats in stats.items():
+        print(
+            f"\t{host}: {host_stats['requests']} requests, "
+            f"{host_stats['error_rate']:.0%} errors, "
+            f"average latency {host_stats['average_latency']:.2f}s, "
+            f"{host_stats['throughput'] / 1024 / 1024:.2f} MB/s"
+            + (" (degraded)" if host_stats["degraded"] else "")
+        )
 
 
 def do_another_search():
@@ -905,9 +1591,219 @@ def do_another_search():
     return choice == "1"
 
 
+def load_job(job_path):
+    """
+    Loads a job file, EX:
+    {
+        "output_path": "/data/manga",
+        "language": "ja",
+        "translated_language": "en",
+        "volumes": "all",
+        "data_saver": false,
+        "page_workers_per_host": 8,
+        "pack_workers": 2,
+        "mapping": "series_mapping.json",
+        "series": [
+            {"title": "Gal Assistant", "volumes": "1-3"},
+            {"manga_id": "<id>", "name": "Gal Assistant"}
+        ]
+    }
+    Every key is optional, the module settings are used for the missing ones.
+    mapping is a mapping file written by batch_resolver.py
+    """
+    with open(job_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apply_job_settings(job):
+    """
+    Sets the module settings from a job, and turns off the user input.
+    Called before setup(), which creates the shared clients from them
+    """
+    global output_path, language, translated_language, pack_workers, get_user_input
+    global max_page_workers_per_host, data_saver
+
+    output_path = job.get("output_path", output_path)
+    language = job.get("language", language)
+    translated_language = job.get("translated_language", translated_language)
+    pack_workers = job.get("pack_workers", pack_workers)
+    max_page_workers_per_host = job.get(
+        "page_workers_per_host", max_page_workers_per_host
+    )
+    data_saver = job.get("data_saver", data_saver)
+    get_user_input = False
+
+
+def get_job_series(job):
+    """
+    Returns the series entries of a job, followed by the resolved series of its mapping file.
+    When the job has a shard ("index/count"), only every count-th series is kept,
+    so the same job can be split across machines
+    """
+    series = list(job.get("series", []))
+    if job.get("mapping"):
+        with open(job["mapping"], "r", encoding="utf-8") as f:
+            for resolution in json.load(f):
+                if resolution.get("manga_id"):
+                    series.append(
+                        {
+                            "manga_id": resolution["manga_id"],
+                            "name": resolution["search"],
+                        }
+                    )
+    if job.get("shard"):
+        index, count = [int(x) for x in job["shard"].split("/")]
+        series = series[index::count]
+    return series
+
+
+def resolve_job_series(api, entry):
+    """
+    Returns the Manga and the series name of a job entry, by manga_id or by title.
+    The Manga is None if the series wasn't found
+    """
+    global number_of_api_hits
+
+    if entry.get("manga_id"):
+        manga_series = api.view_manga_by_id(manga_id=entry["manga_id"])
+        number_of_api_hits += 1
+        if title_index is not None:
+            title_index.add_manga(manga_series)
+            title_index.save()
+        name = entry.get("name") or get_manga_titles(manga_series)[0]
+        return manga_series, sanitize_series_name(name) or manga_series.manga_id
+
+    manga_series = find_series(api, entry["title"])
+    name = entry.get("name") or entry["title"]
+    return manga_series, sanitize_series_name(name)
+
+
+def run_job(job):
+    """
+    Packs every series of a job without asking for input, in one process
+    so the sessions, the rate limiter and the caches are shared by all of them.
+    Returns the series that failed
+    """
+    apply_job_settings(job)
+    setup()
+    if output_path and not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    api = mangadex.Api()
+    series = get_job_series(job)
+    failed = []
+    for index, entry in enumerate(series, start=1):
+        label = entry.get("name") or entry.get("title") or entry.get("manga_id")
+        print(f"\n[{index}/{len(series)}] {label}")
+        try:
+            manga_series, name = resolve_job_series(api, entry)
+            if not manga_series or not pack_series(
+                api, manga_series, name, entry.get("volumes", job.get("volumes", "all"))
+            ):
+                failed.append(label)
+        except Exception as e:
+            print(f"\tERROR: {e}")
+            failed.append(label)
+
+    print(f"\nPacked {len(series) - len(failed)}/{len(series)} series")
+    for label in failed:
+        print(f"\tFailed: {label}")
+    return failed
+
+
+def get_job_parser():
+    """
+    Returns the parser of the job arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Packs MangaDex series into volume CBZs. "
+        "Without arguments, asks for the series to pack."
+    )
+    parser.add_argument("--job", help="A JSON job file, see load_job")
+    parser.add_argument(
+        "--title", action="append", default=[], help="A series title, can be repeated"
+    )
+    parser.add_argument(
+        "--manga-id", action="append", default=[], help="A series id, can be repeated"
+    )
+    parser.add_argument("--mapping", help="A mapping file from batch_resolver.py")
+    parser.add_argument("--volumes", help='EX: "1,2,3" or "1-3" or "all"')
+    parser.add_argument("--output")
+    parser.add_argument("--language")
+    parser.add_argument("--translated-language")
+    parser.add_argument("--page-workers-per-host", type=int)
+    parser.add_argument("--pack-workers", type=int)
+    parser.add_argument(
+        "--data-saver",
+        action="store_true",
+        default=None,
+        help="Download the compressed data-saver images instead of the originals",
+    )
+    parser.add_argument(
+        "--shard",
+        help='Only pack a share of the series, EX: "0/4" on the first of 4 machines',
+    )
+    return parser
+
+
+def get_job_from_args(args=None):
+    """
+    Returns the job given on the command line, or None to run interactively
+    """
+    if args is None:
+        args = get_job_parser().parse_args()
+
+    job = load_job(args.job) if args.job else {}
+    job["series"] = (
+        job.get("series", [])
+        + [{"title": title} for title in args.title]
+        + [{"manga_id": manga_id} for manga_id in args.manga_id]
+    )
+    # the command line overrides the job file
+    for key, value in [
+        ("mapping", args.mapping),
+        ("volumes", args.volumes),
+        ("output_path", args.output),
+        ("language", args.language),
+        ("translated_language", args.translated_language),
+        ("page_workers_per_host", args.page_workers_per_host),
+        ("pack_workers", args.pack_workers),
+        ("data_saver", args.data_saver),
+        ("shard", args.shard),
+    ]:
+        if value is not None:
+            job[key] = value
+
+    if not args.job and not job["series"] and not job.get("mapping"):
+        return None
+    return job
+
+
+def print_run_stats():
+    print_session_stats()
+    print_rate_limit_stats()
+    print_cache_stats()
+    print_title_index_stats()
+    print_page_store_stats()
+    print_node_stats()
+    print_retry_stats()
+
+
 if __name__ == "__main__":
+    args = get_job_parser().parse_args()
+    job = get_job_from_args(args)
+    if job is not None:
+        failed = run_job(job)
+        print_run_stats()
+        sys.exit(1 if failed else 0)
+
+    # the interactive searches take the data-saver flag too
+    if args.data_saver:
+        data_saver = True
+
     while True:
         main()
+        print_run_stats()
         if not do_another_search():
             print("Exiting...")
             break
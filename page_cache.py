@@ -0,0 +1,193 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+from urllib.parse import urlparse
+
+# Content addressed page store shared by every run and series
+
+# MangaDex page file names end with the sha256 of the image: x1-<sha256>.jpg
+DIGEST_PATTERN = re.compile(r"-([0-9a-f]{64})\.\w+$")
+
+
+def get_page_key(url):
+    """
+    Returns the store key of an image url: the sha256 in the MangaDex file name,
+    or the sha256 of the url path. The host is left out because
+    the same page is served by a different at-home node on every run.
+    """
+    path = urlparse(url).path
+    match = DIGEST_PATTERN.search(path)
+    if match:
+        return match.group(1)
+    # /data/<hash>/<file> and /data-saver/<hash>/<file> are different images
+    return hashlib.sha256(path.encode("utf-8")).hexdigest()
+
+
+def is_intact(sha256, expected_sha256):
+    """
+    Returns whether stored bytes with this sha256 are the image expected.
+    Without an expected sha256 (no digest in the file name) they can't be checked
+    """
+    return not expected_sha256 or sha256 == expected_sha256
+
+
+class PageStore:
+    """
+    Keeps the downloaded page (and cover) bytes on disk, one file per key,
+    so a volume can be packed again without downloading its pages.
+    When the store grows over max_bytes the least recently used files are deleted.
+    """
+
+    def __init__(self, path, max_bytes=2 * 1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        # measured on the first store, reading pages doesn't need it
+        self._size = None
+
+    def path_for(self, key):
+        # two level fan out keeps the folders small
+        return os.path.join(self.path, key[:2], key)
+
+    def _files(self):
+        for folder in os.scandir(self.path):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def lookup(self, key):
+        """
+        Returns the path of a stored page and marks it as used, None if it isn't stored
+        """
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def read(self, key):
+        """
+        Returns the bytes of a stored page, None if it isn't stored
+        """
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def copy_to(self, key, destination):
+        """
+        Places a stored page at destination, hard linked when possible.
+        Returns False if it isn't stored
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+        part_path = f"{destination}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                os.link(path, part_path)
+            except OSError:
+                shutil.copyfile(path, part_path)
+            os.replace(part_path, destination)
+        except OSError:
+            return False
+        return True
+
+    def put(self, key, data, replace=False):
+        """
+        Stores the bytes of a page, a stored page is only overwritten with replace
+        """
+        self._put(key, lambda part_path: _write_bytes(part_path, data), replace)
+
+    def put_file(self, key, source, replace=False):
+        """
+        Stores a downloaded page file, hard linked when possible.
+        A stored page is only overwritten with replace
+        """
+
+        def place(part_path):
+            try:
+                os.link(source, part_path)
+            except OSError:
+                shutil.copyfile(source, part_path)
+
+        self._put(key, place, replace)
+
+    def _put(self, key, place, replace=False):
+        path = self.path_for(key)
+        if os.path.isfile(path) and not replace:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f"{path}.{threading.get_ident()}.tmp"
+        place(part_path)
+        size = os.path.getsize(part_path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(file[1] for file in self._files())
+            if os.path.isfile(path):
+                self._size -= os.path.getsize(path)
+            os.replace(part_path, path)
+            self._size += size
+            self.stores += 1
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def discard(self, key):
+        """
+        Deletes a stored page, for the copies that don't match their key
+        """
+        path = self.path_for(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _evict(self):
+        # oldest use first, down to 90% of the cap so every store doesn't evict again
+        for path, size, _ in sorted(self._files(), key=lambda file: file[2]):
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "bytes": self._size or 0,
+            }
+
+
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
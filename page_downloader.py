@@ -0,0 +1,410 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from mangadex import URLRequest
+from urllib3.exceptions import HTTPError
+
+from at_home import NodeHealth
+from page_cache import DIGEST_PATTERN, get_page_key, is_intact
+from volume_journal import get_file_sha256
+
+# Concurrent page downloader used by the volume packer
+
+
+class PageTask:
+    """
+    A single page to download.
+    The index is the position of the page inside the volume,
+    it never depends on the order in which the downloads finish.
+    """
+
+    # renewals of the at-home lease allowed for a single page
+    max_renewals = 2
+    # moves of the lease to another node allowed for a single page
+    max_failovers = 2
+
+    def __init__(self, index, url, path, chapter_id=None, lease=None, lease_index=None):
+        self.index = index
+        self.url = url
+        self.path = path
+        self.chapter_id = chapter_id
+        # the at-home lease the url comes from and the position of the page in it
+        self.lease = lease
+        self.lease_index = lease_index
+        self.renewals = 0
+        self.failovers = 0
+        self.status = "pending"
+        self.size = 0
+        self.sha256 = None
+        self.data = None
+        self.latency = 0.0
+        self.retries = 0
+        self.error = None
+
+    @property
+    def host(self):
+        return urlparse(self.url).netloc
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    @property
+    def part_path(self):
+        # hidden, so a partial page is never counted or packed
+        return os.path.join(os.path.dirname(self.path), f".{self.filename}.part")
+
+    @property
+    def key(self):
+        return get_page_key(self.url)
+
+    @property
+    def expected_sha256(self):
+        # MangaDex page file names end with the sha256 of the image
+        match = DIGEST_PATTERN.search(urlparse(self.url).path)
+        return match.group(1) if match else None
+
+    @property
+    def downloaded(self):
+        return self.status in ("downloaded", "resumed", "cached")
+
+
+class PageDownloader:
+    """
+    Downloads pages with a bounded pool of worker threads.
+    At most max_workers_per_host downloads hit the same image host at once.
+    With a page_store, pages already in the store are taken from it
+    and every downloaded page is added to it.
+    With verify_digests, every page is checked against its Content-Length and
+    the sha256 in its file name, a page that doesn't match is downloaded again.
+    Every request is recorded in node_health, when a node fails or degrades
+    the lease of the chapter moves to another node or to the origin.
+    """
+
+    def __init__(
+        self,
+        max_workers_per_host=8,
+        max_workers=16,
+        timeout=10,
+        page_store=None,
+        verify_digests=True,
+        node_health=None,
+    ):
+        self.max_workers_per_host = max_workers_per_host
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.page_store = page_store
+        self.verify_digests = verify_digests
+        self.node_health = node_health or NodeHealth()
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._executor = None
+
+    def _slot_for(self, host):
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.max_workers_per_host
+                )
+            return self._host_slots[host]
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="page"
+                )
+            return self._executor
+
+    def download_page(self, task, in_memory=False):
+        """
+        Downloads a single page into task.path and records its size, checksum and latency.
+        The page is written to a hidden .part file and renamed once complete,
+        or kept in task.data when in_memory is set.
+        Transfers that break while reading the body, or that don't match
+        the expected size and checksum, are retried with the shared retry policy.
+        """
+        stored = None
+        if self.page_store is not None:
+            stored = self._load_from_store(task, in_memory)
+            if stored:
+                return task
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                generation = self._refresh_url(task)
+            except Exception as e:
+                task.status = "failed"
+                task.error = str(e)
+                break
+            # the host can change between attempts when the lease moves to another node
+            host = task.host
+            with self._slot_for(host):
+                try:
+                    r = URLRequest.request_raw(task.url, timeout=self.timeout)
+                except Exception as e:
+                    # no response to time, only the failure counts
+                    self.node_health.record(host, 0.0, 0, False)
+                    if self._fail_over(task, generation, host):
+                        continue
+                    task.status = "failed"
+                    task.error = str(e)
+                    break
+                read_start = read_end = None
+                try:
+                    # the at-home token expired or the node dropped the chapter
+                    if (
+                        r.status_code in (403, 404)
+                        and task.lease is not None
+                        and task.renewals < task.max_renewals
+                    ):
+                        task.renewals += 1
+                        task.lease.renew(generation)
+                        continue
+                    if r.status_code != 200:
+                        self.node_health.record(host, get_network_seconds(r), 0, False)
+                        if self._fail_over(task, generation, host):
+                            continue
+                        task.status = "failed"
+                        task.error = f"status code {r.status_code}"
+                        break
+                    sha256 = hashlib.sha256()
+                    size = 0
+                    read_start = time.perf_counter()
+                    with io.BytesIO() if in_memory else open(task.part_path, "wb") as f:
+                        for chunk in r.iter_content(chunk_size=64 * 1024):
+                            f.write(chunk)
+                            sha256.update(chunk)
+                            size += len(chunk)
+                        if in_memory:
+                            task.data = f.getvalue()
+                    read_end = time.perf_counter()
+                    if self.verify_digests:
+                        check_page(task, r, size, sha256.hexdigest())
+                    if not in_memory:
+                        os.replace(task.part_path, task.path)
+                    task.size = size
+                    task.sha256 = sha256.hexdigest()
+                    task.status = "downloaded"
+                    self.node_health.record(
+                        host, get_network_seconds(r, read_start, read_end), size, True
+                    )
+                    # move the next pages of the chapter away from a slow or failing node
+                    if task.lease is not None and self.node_health.is_degraded(host):
+                        task.lease.fail_over(generation, host)
+                    break
+                except Exception as e:
+                    self.node_health.record(
+                        host, get_network_seconds(r, read_start, read_end), 0, False
+                    )
+                    retry_policy = URLRequest.retry_policy
+                    if retry_policy is not None and retry_policy.should_retry(
+                        "GET", attempt, error=as_request_error(e)
+                    ):
+                        time.sleep(retry_policy.backoff(attempt))
+                        attempt += 1
+                        continue
+                    if self._fail_over(task, generation, host):
+                        continue
+                    task.status = "failed"
+                    task.error = str(e)
+                    task.data = None
+                    if not in_memory and os.path.isfile(task.part_path):
+                        os.remove(task.part_path)
+                    break
+                finally:
+                    r.close()
+        task.retries = attempt
+        task.latency = time.perf_counter() - start
+        if self.page_store is not None and task.status == "downloaded":
+            # a damaged copy in the store is replaced by the downloaded page
+            if in_memory:
+                self.page_store.put(task.key, task.data, replace=stored is False)
+            else:
+                self.page_store.put_file(task.key, task.path, replace=stored is False)
+        return task
+
+    def _fail_over(self, task, generation, host):
+        """
+        Moves the lease of a failed page to another node, returns False
+        if the page has no lease or already failed over too many times
+        """
+        if task.lease is None or task.failovers >= task.max_failovers:
+            return False
+        task.failovers += 1
+        task.lease.fail_over(generation, host)
+        return True
+
+    def _refresh_url(self, task):
+        """
+        Renews the at-home lease of the task if it expired and points the task
+        at the current url of its page. Returns the lease generation of the url
+        """
+        if task.lease is None:
+            return None
+        generation = task.lease.generation
+        if task.lease.expired:
+            generation = task.lease.renew(generation)
+        task.url = task.lease.url_for(task.lease_index)
+        return generation
+
+    def _load_from_store(self, task, in_memory):
+        """
+        Takes the page of the task from the store. Returns True if it was stored,
+        False if the stored copy was damaged and None if it isn't stored
+        """
+        if in_memory:
+            task.data = self.page_store.read(task.key)
+            if task.data is None:
+                return None
+            task.size = len(task.data)
+            task.sha256 = hashlib.sha256(task.data).hexdigest()
+        else:
+            if not self.page_store.copy_to(task.key, task.path):
+                return None
+            task.size = os.path.getsize(task.path)
+            task.sha256 = get_file_sha256(task.path)
+        if self.verify_digests and not is_intact(task.sha256, task.expected_sha256):
+            # a damaged copy in the store is deleted and downloaded again
+            self.page_store.discard(task.key)
+            task.data = None
+            task.size = 0
+            task.sha256 = None
+            return False
+        task.status = "cached"
+        return True
+
+    def download_pages(self, tasks, journal=None, writer=None):
+        """
+        Downloads all the tasks concurrently and returns them sorted by page index.
+        Tasks already complete in the journal with the same chapter and page are skipped,
+        every new page is recorded in it as soon as it lands.
+        With a writer the pages aren't saved to disk, their bytes are added to the writer.
+        """
+        executor = self._get_executor()
+        futures = []
+        for task in tasks:
+            if journal and is_resumable(task, journal):
+                entry = journal.pages[task.filename]
+                task.size = entry["size"]
+                task.sha256 = entry["sha256"]
+                task.status = "resumed"
+                continue
+            futures.append(
+                executor.submit(self._download_and_record, task, journal, writer)
+            )
+        for future in futures:
+            future.result()
+        return sorted(tasks, key=lambda task: task.index)
+
+    def _download_and_record(self, task, journal, writer):
+        self.download_page(task, in_memory=writer is not None)
+        if task.downloaded:
+            if writer is not None:
+                writer.add(task.index, task.filename, task.data)
+                task.data = None
+            elif journal:
+                journal.record(
+                    task.filename, task.chapter_id, task.url, task.size, task.sha256
+                )
+        return task
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def is_resumable(task, journal):
+    """
+    Returns whether the journal has the page of the task complete. A regrouped or
+    re-uploaded chapter reuses the file names for other pages, so the journal entry
+    has to be from the same chapter and have the same page key as the task
+    """
+    if not journal.is_complete(task.filename):
+        return False
+    entry = journal.pages[task.filename]
+    return (
+        entry["chapter_id"] == task.chapter_id
+        and get_page_key(entry["url"]) == task.key
+    )
+
+
+def get_network_seconds(response, read_start=None, read_end=None):
+    """
+    Returns the seconds a page spent on the network: until the response headers arrived
+    (response.elapsed, without the rate limit waits and retry sleeps of request_raw),
+    plus the body read from read_start to read_end, or to now if it was interrupted
+    """
+    seconds = response.elapsed.total_seconds()
+    if read_start is not None:
+        seconds += (read_end or time.perf_counter()) - read_start
+    return seconds
+
+
+class PageIntegrityError(Exception):
+    """
+    The downloaded page doesn't match its Content-Length or the sha256 in its file name
+    """
+
+
+def check_page(task, response, size, sha256):
+    """
+    Raises a PageIntegrityError if a downloaded page is truncated or corrupted
+    """
+    content_length = response.headers.get("Content-Length")
+    # the length of a compressed response is the length before decoding
+    if (
+        content_length
+        and content_length.isdigit()
+        and "Content-Encoding" not in response.headers
+        and int(content_length) != size
+    ):
+        raise PageIntegrityError(
+            f"Got {size} of {content_length} bytes from {task.url}"
+        )
+    expected = task.expected_sha256
+    if expected and sha256 != expected:
+        raise PageIntegrityError(f"sha256 mismatch for {task.url}")
+
+
+def as_request_error(error):
+    """
+    Reading a streamed body raises urllib3 errors and a bad page raises a
+    PageIntegrityError, map them to the requests exception the retry policy knows about
+    """
+    if isinstance(error, (HTTPError, PageIntegrityError)):
+        return requests.exceptions.ChunkedEncodingError(error)
+    return error
+
+
+def get_download_summary(tasks, elapsed):
+    """
+    Returns a one line summary with the bytes and latency of the downloaded tasks
+    """
+    downloaded = [task for task in tasks if task.status == "downloaded"]
+    total_bytes = sum(task.size for task in downloaded)
+    average_latency = (
+        sum(task.latency for task in downloaded) / len(downloaded) if downloaded else 0
+    )
+    speed = total_bytes / elapsed if elapsed else 0
+    retries = sum(task.retries for task in tasks)
+    renewals = sum(task.renewals for task in tasks)
+    failovers = sum(task.failovers for task in tasks)
+    resumed = len([task for task in tasks if task.status == "resumed"])
+    cached = len([task for task in tasks if task.status == "cached"])
+    return (
+        f"{len(downloaded)}/{len(tasks)} pages ({resumed} resumed, {cached} cached), "
+        f"{total_bytes / 1024 / 1024:.2f} MB "
+        f"in {elapsed:.2f}s ({speed / 1024 / 1024:.2f} MB/s), "
+        f"average latency {average_latency:.2f}s, {retries} retries, "
+        f"{renewals} lease renewals, {failovers} node failovers"
+    )
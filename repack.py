@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from mangadex import Chapter
+
+import mangadex_volume_packer as packer
+from cbz_packer import PackingPolicy, PackResult, StreamingCBZWriter
+from page_cache import PageStore, is_intact
+from volume_records import load_volume_records
+
+# Packs the recorded volumes again from the page store, without any network access.
+# The CBZs are named with the current naming functions of the volume packer,
+# so a naming change only needs a repack, not a new download.
+# EX: python repack.py --manga-id <id> --compress-level 9 --comic-info --force
+
+
+def get_comic_info(record, page_count):
+    """
+    Returns the ComicInfo.xml of a recorded volume
+    """
+    comic_info = ET.Element("ComicInfo")
+    ET.SubElement(comic_info, "Series").text = record.series_name
+    ET.SubElement(comic_info, "Volume").text = str(
+        packer.set_num_as_float_or_int(record.volume_number)
+    )
+    ET.SubElement(comic_info, "PageCount").text = str(page_count)
+    ET.SubElement(
+        comic_info, "Web"
+    ).text = f"https://mangadex.org/title/{record.manga_id}"
+    return ET.tostring(comic_info, encoding="utf-8", xml_declaration=True)
+
+
+def get_record_volume(record):
+    """
+    Rebuilds the Volume and Chapter objects the naming functions expect
+    """
+    volume = packer.Volume(record.volume_number, cover=record.cover_key)
+    for chapter_data in record.chapters:
+        chapter = Chapter()
+        chapter.chapter_id = chapter_data["chapter_id"]
+        chapter.chapter = chapter_data["chapter"]
+        chapter.title = chapter_data["title"]
+        chapter.volume = record.volume_number
+        volume.chapters.append(chapter)
+    return volume
+
+
+def read_stored(store, key, expected_sha256, label):
+    """
+    Returns the bytes of a recorded image from the page store,
+    raises a ValueError if it isn't stored or doesn't match its sha256
+    """
+    data = store.read(key)
+    if data is None:
+        raise ValueError(f"{label} ({key}) not in the page store")
+    if not is_intact(hashlib.sha256(data).hexdigest(), expected_sha256):
+        raise ValueError(f"{label} ({key}) is damaged in the page store")
+    return data
+
+
+def repack_volume(
+    record, output_path, store_path, compress_level=6, comic_info=False, force=False
+):
+    """
+    Packs a recorded volume from the page store into
+    {output_path}/{series_name}/{folder_name}.cbz. Runs inside the worker processes.
+    Every image is checked against its sha256, a missing or damaged one fails
+    the volume and an existing CBZ is left as it was.
+    Returns a PackResult, its cbz_path is None when the CBZ already existed
+    """
+    volume = get_record_volume(record)
+    volume_number = (
+        int(record.volume_number)
+        if float(record.volume_number).is_integer()
+        else float(record.volume_number)
+    )
+    folder_name = packer.get_folder_name(
+        record.series_name, volume_number, packer.source
+    )
+    series_path = os.path.join(output_path, record.series_name)
+    cbz_path = os.path.join(series_path, f"{folder_name}.cbz")
+
+    result = PackResult(cbz_path)
+    if os.path.isfile(cbz_path) and not force:
+        result.cbz_path = None
+        return result
+
+    start = time.perf_counter()
+    store = PageStore(store_path)
+    os.makedirs(series_path, exist_ok=True)
+    writer = StreamingCBZWriter(
+        cbz_path,
+        policy=PackingPolicy(compress_level=compress_level),
+        comment=packer.get_cbz_comment(record.image_mode),
+    )
+    try:
+        cover_data = read_stored(store, record.cover_key, record.cover_sha256, "Cover")
+        writer.add(
+            0,
+            packer.get_cover_name(
+                record.series_name, volume, volume_number, record.cover_link
+            ),
+            cover_data,
+        )
+
+        page_number = 1
+        for chapter, chapter_data in zip(volume.chapters, record.chapters):
+            for page in chapter_data["pages"]:
+                # older records only have the key, the sha256 in the page file name
+                data = read_stored(
+                    store,
+                    page["key"],
+                    page.get("sha256") or page["key"],
+                    f"Page {page_number}",
+                )
+                page_name = packer.get_page_name(
+                    record.series_name,
+                    chapter,
+                    page_number,
+                    volume_number,
+                    page["extension"],
+                )
+                writer.add(page_number, page_name, data)
+                page_number += 1
+
+        if comic_info:
+            writer.add(
+                page_number, "ComicInfo.xml", get_comic_info(record, page_number - 1)
+            )
+        writer.close()
+        result.report = writer.report
+    except Exception as e:
+        writer.abort()
+        result.error = str(e)
+    result.pack_seconds = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Packs the recorded volumes again from the page store, offline."
+    )
+    parser.add_argument(
+        "--manga-id",
+        action="append",
+        default=[],
+        help="Only repack this series, can be repeated. Defaults to every recorded series.",
+    )
+    parser.add_argument("--output", default=packer.output_path)
+    parser.add_argument("--records", default=packer.volume_records_path)
+    parser.add_argument("--store", default=packer.page_cache_path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--compress-level", type=int, default=packer.cbz_compress_level)
+    parser.add_argument(
+        "--comic-info", action="store_true", help="Add a ComicInfo.xml to every CBZ"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Replace the CBZs that already exist"
+    )
+    args = parser.parse_args()
+
+    records = load_volume_records(args.records, args.manga_id)
+    print(f"Repacking {len(records)} volumes with {args.workers} workers...")
+
+    start = time.perf_counter()
+    packed = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(
+                repack_volume,
+                record,
+                args.output,
+                args.store,
+                args.compress_level,
+                args.comic_info,
+                args.force,
+            ): record
+            for record in records
+        }
+        for future in as_completed(futures):
+            record = futures[future]
+            label = f"{record.series_name} v{record.volume_number}"
+            try:
+                result = future.result()
+            except Exception as e:
+                result = PackResult(None)
+                result.error = str(e)
+            if result.error:
+                failed += 1
+                print(f"\t{label}: CBZ not created: {result.error}")
+            elif result.cbz_path is None:
+                skipped += 1
+                print(f"\t{label}: already exists")
+            else:
+                packed += 1
+                print(f"\t{label}: {os.path.basename(result.cbz_path)}")
+                print(f"\t\t{result.report.summary()}")
+
+    print(
+        f"\nPacked {packed}, skipped {skipped}, failed {failed} "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import mangadex
+
+import mangadex_volume_packer as packer
+from at_home import LeasePrefetcher
+from cbz_packer import PackingPipeline
+
+# Packs the series of a job at the same time, in one process.
+# Every worker draws from the same rate limiter: the api.mangadex.org buckets are
+# the API budget, and the bucket shared by the image hosts is the image budget.
+# The volumes are handed out round robin across the series,
+# so a long series doesn't hold back the others.
+# EX: python series_scheduler.py --job job.json --series-workers 4 --page-workers 32
+
+
+class SeriesState:
+    """
+    A series in the scheduler: its job entry and, once planned,
+    its Manga and the volumes left to pack
+    """
+
+    def __init__(self, entry, default_volumes="all"):
+        self.entry = entry
+        self.label = entry.get("name") or entry.get("title") or entry.get("manga_id")
+        self.volume_selection = entry.get("volumes", default_volumes)
+        self.manga_series = None
+        self.series_name = None
+        self.volumes = deque()
+        self.planning = False
+        self.planned = False
+        self.running = 0
+        self.packed = 0
+        self.failed = 0
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.planned and not self.volumes and not self.running
+
+    @property
+    def ok(self):
+        return self.error is None and not self.failed
+
+
+class SeriesScheduler:
+    """
+    Packs many series with a pool of workers. A unit of work is the planning
+    of a series or one of its volumes. At most max_active_series series are worked on
+    at once, and every unit comes from the next active series in turn, so each of them
+    gets a worker before any gets a second one. The volumes of all the series
+    download through the shared page downloader and pack in a single pipeline.
+    """
+
+    def __init__(self, workers=3, max_active_series=None, default_volumes="all"):
+        self.workers = workers
+        self.max_active_series = max_active_series or workers
+        self.default_volumes = default_volumes
+        self.download_times = {}
+        self.packing_pipeline = None
+        self._pending = deque()
+        self._active = deque()
+        self._finished = []
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._prefetchers = []
+
+    def add(self, entry):
+        """
+        Queues a job entry, {"title"} or {"manga_id"}, with an optional "name" and "volumes"
+        """
+        with self._condition:
+            self._pending.append(SeriesState(entry, self.default_volumes))
+            self._condition.notify_all()
+
+    def _retire_finished(self):
+        for state in [state for state in self._active if state.finished]:
+            self._active.remove(state)
+            self._finished.append(state)
+
+    def _next_unit(self):
+        """
+        Returns the next (SeriesState, volume) to work on, the volume is None to plan
+        the series. Waits while every active series is busy, returns None when all are done
+        """
+        with self._condition:
+            while True:
+                self._retire_finished()
+                while self._pending and len(self._active) < self.max_active_series:
+                    self._active.append(self._pending.popleft())
+                for _ in range(len(self._active)):
+                    state = self._active[0]
+                    self._active.rotate(-1)
+                    if not state.planned and not state.planning:
+                        state.planning = True
+                        return state, None
+                    if state.planned and state.volumes:
+                        state.running += 1
+                        return state, state.volumes.popleft()
+                if not self._active and not self._pending:
+                    return None
+                self._condition.wait()
+
+    def _finish_unit(self, state, volume, ok):
+        with self._condition:
+            if volume is None:
+                state.planning = False
+                state.planned = True
+            else:
+                state.running -= 1
+                if ok:
+                    state.packed += 1
+                else:
+                    state.failed += 1
+            self._condition.notify_all()
+
+    def _get_prefetcher(self):
+        # one per worker, so a volume finishing doesn't drop the leases of another series
+        prefetcher = getattr(self._local, "prefetcher", None)
+        if prefetcher is None:
+            prefetcher = LeasePrefetcher(
+                lookahead=packer.lease_lookahead, data_saver=packer.data_saver
+            )
+            self._local.prefetcher = prefetcher
+            with self._condition:
+                self._prefetchers.append(prefetcher)
+        return prefetcher
+
+    def _plan(self, api, state):
+        try:
+            state.manga_series, state.series_name = packer.resolve_job_series(
+                api, state.entry
+            )
+            if not state.manga_series:
+                state.error = "series not found"
+                return
+            volumes = packer.plan_series(
+                api, state.manga_series, state.volume_selection
+            )
+            if not volumes:
+                state.error = "no volumes to pack"
+                return
+            packer.create_series_folder(state.series_name)
+            state.volumes.extend(volumes)
+        except Exception as e:
+            print(f"\tERROR: {state.label}: {e}")
+            state.error = str(e)
+
+    def _pack(self, api, state, volume):
+        try:
+            return packer.pack_volume(
+                api,
+                state.manga_series,
+                state.series_name,
+                volume,
+                self.packing_pipeline,
+                self.download_times,
+                prefetcher=self._get_prefetcher(),
+            )
+        except Exception as e:
+            print(f"\tERROR: {state.label} v{volume.volume_number}: {e}")
+            return False
+
+    def _work(self, api):
+        while True:
+            unit = self._next_unit()
+            if unit is None:
+                return
+            state, volume = unit
+            ok = True
+            if volume is None:
+                self._plan(api, state)
+            else:
+                ok = self._pack(api, state, volume)
+            self._finish_unit(state, volume, ok)
+
+    def run(self):
+        """
+        Packs every queued series and returns their SeriesState, in the order they finished
+        """
+        self.packing_pipeline = PackingPipeline(
+            workers=packer.pack_workers,
+            use_processes=packer.pack_with_processes,
+            policy=packer.packing_policy,
+        )
+        api = mangadex.Api()
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="series"
+        ) as executor:
+            for future in [
+                executor.submit(self._work, api) for _ in range(self.workers)
+            ]:
+                future.result()
+        for prefetcher in self._prefetchers:
+            prefetcher.close()
+        packer.finish_packing(self.packing_pipeline, self.download_times)
+        with self._condition:
+            self._retire_finished()
+            return list(self._finished)
+
+
+def main():
+    parser = packer.get_job_parser()
+    parser.description = (
+        "Packs the series of a job at the same time, "
+        "within one API budget and one image host budget."
+    )
+    parser.add_argument(
+        "--series-workers",
+        type=int,
+        help="The number of volumes (or series plans) worked on at once",
+    )
+    parser.add_argument(
+        "--max-active-series",
+        type=int,
+        help="The number of series worked on at once, defaults to --series-workers",
+    )
+    parser.add_argument(
+        "--page-workers",
+        type=int,
+        help="The number of pages downloaded at once, across every series",
+    )
+    parser.add_argument(
+        "--image-rate",
+        type=float,
+        help="The requests per second allowed for all the image hosts together",
+    )
+    args = parser.parse_args()
+
+    job = packer.get_job_from_args(args)
+    if job is None:
+        parser.error("no series given, use --job, --title, --manga-id or --mapping")
+    # the command line overrides the job file
+    for key in ["series_workers", "max_active_series", "page_workers", "image_rate"]:
+        if getattr(args, key) is not None:
+            job[key] = getattr(args, key)
+
+    packer.apply_job_settings(job)
+    packer.max_page_workers = job.get("page_workers", packer.max_page_workers)
+    packer.image_total_requests_per_second = job.get(
+        "image_rate", packer.image_total_requests_per_second
+    )
+    packer.setup()
+
+    scheduler = SeriesScheduler(
+        workers=job.get("series_workers", 3),
+        max_active_series=job.get("max_active_series"),
+        default_volumes=job.get("volumes", "all"),
+    )
+    series = packer.get_job_series(job)
+    for entry in series:
+        scheduler.add(entry)
+    print(f"Packing {len(series)} series with {scheduler.workers} workers...")
+
+    start = time.perf_counter()
+    states = scheduler.run()
+    failed = [state for state in states if not state.ok]
+
+    print(
+        f"\nPacked {len(states) - len(failed)}/{len(states)} series "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    for state in states:
+        print(f"\t{state.label}: {state.packed} volumes packed, {state.failed} failed")
+        if state.error:
+            print(f"\t\t{state.error}")
+    packer.print_run_stats()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
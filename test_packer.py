@@ -0,0 +1,982 @@
+"""
+Tests of the volume packer, the downloads run against a local page server
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import os
+import threading
+import zipfile
+import pytest
+from mangadex import Api, Chapter, Manga, RateLimiter, RetryPolicy, URLRequest
+
+import batch_resolver
+import mangadex_volume_packer as packer
+import series_scheduler
+from at_home import ChapterLease, LeasePrefetcher, NodeHealth
+from cbz_packer import PackingPipeline, StreamingCBZWriter
+from page_cache import PageStore
+from page_downloader import PageDownloader, PageTask
+from repack import repack_volume
+from title_index import TitleIndex
+from title_matcher import TitleMatcher, naive_score
+from volume_journal import VolumeJournal
+from volume_records import VolumeRecord
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """
+    Serves the pages at /{token}/data/{hash}/{file name},
+    a token not in valid_tokens gets a 403 like an expired at-home url.
+    A page in damaged is served once with its damage, "truncated" or "corrupted"
+    """
+
+    protocol_version = "HTTP/1.1"
+    pages = {}
+    requests = {}
+    valid_tokens = set()
+    damaged = {}
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        with self._lock:
+            self.requests[self.path] = self.requests.get(self.path, 0) + 1
+        token, _, page_path = self.path[1:].partition("/")
+        page_path = f"/{page_path}"
+        if token not in self.valid_tokens or page_path not in self.pages:
+            self.send_response(403 if token not in self.valid_tokens else 404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.pages[page_path]
+        with self._lock:
+            damage = self.damaged.pop(page_path, None)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        if damage == "truncated":
+            self.send_header("Connection", "close")
+            self.close_connection = True
+            body = body[: len(body) // 2]
+        elif damage == "corrupted":
+            body = os.urandom(len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_pages(count, size=16 * 1024):
+    """
+    Returns the paths of count random pages, named with their sha256 like the MangaDex pages
+    """
+    paths = []
+    for i in range(count):
+        data = os.urandom(size)
+        path = f"/data/hash/x{i + 1}-{hashlib.sha256(data).hexdigest()}.jpg"
+        PageHandler.pages[path] = data
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def page_server():
+    """
+    Starts a local page server and yields its base url
+    """
+    PageHandler.pages = {}
+    PageHandler.requests = {}
+    PageHandler.valid_tokens = {"t0"}
+    PageHandler.damaged = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def packer_settings(monkeypatch):
+    """
+    Restores the packer settings and shared clients a test changes,
+    setup() creates the clients without the on-disk caches
+    """
+    for name in [
+        "output_path",
+        "language",
+        "translated_language",
+        "pack_workers",
+        "pack_with_processes",
+        "get_user_input",
+        "series_name",
+        "max_page_workers_per_host",
+        "data_saver",
+        "image_mode",
+        "title_index",
+        "page_store",
+        "lease_prefetcher",
+        "node_health",
+        "page_downloader",
+    ]:
+        monkeypatch.setattr(packer, name, getattr(packer, name))
+    monkeypatch.setattr(packer, "api_ready", True)
+    monkeypatch.setattr(packer, "use_page_cache", False)
+    return packer
+
+
+def make_tasks(base_url, paths, folder_path, chapter_id="c1"):
+    return [
+        PageTask(
+            index,
+            f"{base_url}/t0{path}",
+            os.path.join(folder_path, f"p{index:03}.jpg"),
+            chapter_id=chapter_id,
+        )
+        for index, path in enumerate(paths, start=1)
+    ]
+
+
+class TestVolumeJournal:
+    """
+    Class for testing the resume of a volume download
+    """
+
+    def test_ResumeRefetchesCorruptedPage(self, page_server, tmp_path):
+        paths = make_pages(4)
+        downloader = PageDownloader(max_workers=4)
+        journal = VolumeJournal(str(tmp_path))
+        tasks = downloader.download_pages(
+            make_tasks(page_server, paths, str(tmp_path)), journal
+        )
+        assert all(task.status == "downloaded" for task in tasks)
+
+        # the second page is damaged while the packer isn't running
+        with open(tasks[1].path, "r+b") as f:
+            f.write(b"broken")
+
+        journal = VolumeJournal.load(str(tmp_path))
+        assert sorted(journal.verify()) == ["p001.jpg", "p003.jpg", "p004.jpg"]
+        tasks = downloader.download_pages(
+            make_tasks(page_server, paths, str(tmp_path)), journal
+        )
+        downloader.close()
+
+        assert [task.status for task in tasks] == [
+            "resumed",
+            "downloaded",
+            "resumed",
+            "resumed",
+        ]
+        assert [PageHandler.requests[f"/t0{path}"] for path in paths] == [1, 2, 1, 1]
+        with open(tasks[1].path, "rb") as f:
+            assert f.read() == PageHandler.pages[paths[1]]
+        assert journal.is_complete("p002.jpg")
+
+    def test_RegroupedChapterIsDownloadedAgain(self, page_server, tmp_path):
+        paths = make_pages(3)
+        downloader = PageDownloader(max_workers=3)
+        journal = VolumeJournal(str(tmp_path))
+        downloader.download_pages(
+            make_tasks(page_server, paths, str(tmp_path)), journal
+        )
+
+        # the same file names, from another chapter, then from a re-upload of the chapter
+        tasks = downloader.download_pages(
+            make_tasks(page_server, paths, str(tmp_path), chapter_id="c2"), journal
+        )
+        assert [task.status for task in tasks] == ["downloaded"] * 3
+        reuploaded = make_pages(3)
+        tasks = downloader.download_pages(
+            make_tasks(page_server, reuploaded, str(tmp_path), chapter_id="c2"),
+            journal,
+        )
+        downloader.close()
+
+        assert [task.status for task in tasks] == ["downloaded"] * 3
+        for task, path in zip(tasks, reuploaded):
+            with open(task.path, "rb") as f:
+                assert f.read() == PageHandler.pages[path]
+            assert journal.pages[task.filename]["url"] == task.url
+
+
+class TestPageIntegrity:
+    """
+    Class for testing the checks of the downloaded pages
+    """
+
+    @pytest.mark.parametrize("damage", ["truncated", "corrupted"])
+    def test_DamagedPageIsDownloadedAgain(
+        self, page_server, tmp_path, monkeypatch, damage
+    ):
+        monkeypatch.setattr(
+            URLRequest, "retry_policy", RetryPolicy(total=2, backoff_factor=0)
+        )
+        paths = make_pages(3)
+        PageHandler.damaged[paths[1]] = damage
+        store = PageStore(str(tmp_path / "store"))
+        downloader = PageDownloader(max_workers=3, page_store=store)
+        tasks = downloader.download_pages(make_tasks(page_server, paths, str(tmp_path)))
+        downloader.close()
+
+        assert [task.status for task in tasks] == ["downloaded"] * 3
+        assert [task.retries for task in tasks] == [0, 1, 0]
+        assert [PageHandler.requests[f"/t0{path}"] for path in paths] == [1, 2, 1]
+        for task, path in zip(tasks, paths):
+            with open(task.path, "rb") as f:
+                assert f.read() == PageHandler.pages[path]
+            assert store.read(task.key) == PageHandler.pages[path]
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+    @pytest.mark.parametrize("damage", ["truncated", "corrupted"])
+    def test_DamagedPageNeverReachesCBZ(
+        self, page_server, tmp_path, monkeypatch, damage
+    ):
+        monkeypatch.setattr(
+            URLRequest, "retry_policy", RetryPolicy(total=2, backoff_factor=0)
+        )
+        paths = make_pages(3)
+        PageHandler.damaged[paths[1]] = damage
+        cbz_path = str(tmp_path / "volume.cbz")
+        writer = StreamingCBZWriter(cbz_path, first_index=1)
+        downloader = PageDownloader(max_workers=3)
+        tasks = downloader.download_pages(
+            make_tasks(page_server, paths, str(tmp_path)), writer=writer
+        )
+        downloader.close()
+        writer.close()
+
+        assert [task.status for task in tasks] == ["downloaded"] * 3
+        assert tasks[1].retries == 1
+        with zipfile.ZipFile(cbz_path) as z:
+            for task, path in zip(tasks, paths):
+                assert z.read(task.filename) == PageHandler.pages[path]
+
+
+class TestPageStore:
+    """
+    Class for testing the page store shared by the downloads
+    """
+
+    def test_DamagedEntryIsReplaced(self, page_server, tmp_path):
+        paths = make_pages(2)
+        store = PageStore(str(tmp_path / "store"))
+        tasks = make_tasks(page_server, paths, str(tmp_path))
+        store.put(tasks[0].key, b"broken")
+
+        downloader = PageDownloader(max_workers=2, page_store=store)
+        tasks = downloader.download_pages(tasks)
+        assert [task.status for task in tasks] == ["downloaded", "downloaded"]
+        assert store.read(tasks[0].key) == PageHandler.pages[paths[0]]
+
+        os.mkdir(tmp_path / "again")
+        tasks = downloader.download_pages(
+            make_tasks(page_server, paths, str(tmp_path / "again"))
+        )
+        downloader.close()
+        assert [task.status for task in tasks] == ["cached", "cached"]
+        assert [PageHandler.requests[f"/t0{path}"] for path in paths] == [1, 1]
+
+
+class TestRepack:
+    """
+    Class for testing the offline repack of the recorded volumes
+    """
+
+    def make_record(self, store):
+        cover = os.urandom(1024)
+        store.put("cover", cover)
+        pages = []
+        for _ in range(3):
+            data = os.urandom(1024)
+            sha256 = hashlib.sha256(data).hexdigest()
+            store.put(sha256, data)
+            pages.append({"key": sha256, "extension": "jpg", "sha256": sha256})
+        chapters = [{"chapter_id": "c1", "chapter": "1", "title": None, "pages": pages}]
+        return VolumeRecord(
+            "m1",
+            "Series",
+            1.0,
+            cover_link="https://uploads.mangadex.org/covers/m1/cover.jpg",
+            cover_key="cover",
+            chapters=chapters,
+            cover_sha256=hashlib.sha256(cover).hexdigest(),
+        )
+
+    def test_Repack(self, tmp_path):
+        store = PageStore(str(tmp_path / "store"))
+        record = self.make_record(store)
+        result = repack_volume(record, str(tmp_path), store.path)
+
+        assert result.error is None
+        with zipfile.ZipFile(result.cbz_path) as z:
+            assert len(z.namelist()) == 4
+
+    def test_DamagedPageKeepsOldCBZ(self, tmp_path):
+        store = PageStore(str(tmp_path / "store"))
+        record = self.make_record(store)
+        result = repack_volume(record, str(tmp_path), store.path)
+        with open(result.cbz_path, "rb") as f:
+            old_cbz = f.read()
+
+        store.put(record.chapters[0]["pages"][1]["key"], b"broken", replace=True)
+        result = repack_volume(record, str(tmp_path), store.path, force=True)
+
+        assert "Page 2" in result.error and "damaged" in result.error
+        with open(result.cbz_path, "rb") as f:
+            assert f.read() == old_cbz
+        assert not os.path.isfile(f"{result.cbz_path}.part")
+
+    def test_DamagedCoverFails(self, tmp_path):
+        store = PageStore(str(tmp_path / "store"))
+        record = self.make_record(store)
+        store.put("cover", b"broken", replace=True)
+        result = repack_volume(record, str(tmp_path), store.path)
+
+        assert "Cover" in result.error
+        assert not os.path.isfile(result.cbz_path)
+
+
+class TestStreamingCBZWriter:
+    """
+    Class for testing the reorder buffer of the streaming CBZ writer
+    """
+
+    def test_OutOfOrderPagesKeepEntryOrder(self, tmp_path):
+        cbz_path = str(tmp_path / "volume.cbz")
+        writer = StreamingCBZWriter(cbz_path)
+        writer.add(2, "p002.jpg", b"2")
+        writer.add(3, "p003.jpg", b"3")
+        assert writer.written == 0 and writer.buffered == 2
+        writer.add(0, "p000.jpg", b"0")
+        writer.add(1, "p001.jpg", b"1")
+        assert writer.written == 4 and writer.buffered == 0
+        writer.close()
+
+        with zipfile.ZipFile(cbz_path) as z:
+            assert z.namelist() == ["p000.jpg", "p001.jpg", "p002.jpg", "p003.jpg"]
+            assert z.read("p002.jpg") == b"2"
+
+    def test_MissingPageFailsClose(self, tmp_path):
+        cbz_path = str(tmp_path / "volume.cbz")
+        writer = StreamingCBZWriter(cbz_path)
+        writer.add(0, "p000.jpg", b"0")
+        writer.add(2, "p002.jpg", b"2")
+        with pytest.raises(ValueError):
+            writer.close()
+        assert os.listdir(tmp_path) == []
+
+
+class TestChapterLease:
+    """
+    Class for testing the renewal of the at-home leases
+    """
+
+    def test_ExpiredLeaseRenewedOnceForAllPages(
+        self, page_server, tmp_path, monkeypatch
+    ):
+        paths = make_pages(8)
+        tokens = iter(["t0", "t1", "t2"])
+        fetches = []
+
+        def fetch_chapter_images(chapter, data_saver=False):
+            token = next(tokens)
+            fetches.append(token)
+            return [f"{page_server}/{token}{path}" for path in paths]
+
+        monkeypatch.setattr(Chapter, "fetch_chapter_images", fetch_chapter_images)
+        chapter = Chapter()
+        chapter.chapter_id = "c1"
+        lease = ChapterLease(chapter).acquire()
+
+        # the at-home token expires before any page is downloaded
+        PageHandler.valid_tokens = {"t1"}
+        tasks = [
+            PageTask(
+                index,
+                lease.url_for(index - 1),
+                os.path.join(str(tmp_path), f"p{index:03}.jpg"),
+                chapter_id="c1",
+                lease=lease,
+                lease_index=index - 1,
+            )
+            for index in range(1, len(paths) + 1)
+        ]
+        downloader = PageDownloader(max_workers_per_host=8, max_workers=8)
+        tasks = downloader.download_pages(tasks)
+        downloader.close()
+
+        assert all(task.status == "downloaded" for task in tasks)
+        assert fetches == ["t0", "t1"]
+        assert lease.renewals == 1 and lease.generation == 1
+        assert all(task.url.startswith(f"{page_server}/t1/") for task in tasks)
+
+
+class TestNodeHealth:
+    """
+    Class for testing the node timing of the page downloader
+    """
+
+    def test_RateLimitWaitsDontDegradeNode(self, page_server, tmp_path, monkeypatch):
+        paths = make_pages(5, size=100 * 1024)
+        # 2 requests per second on the host, the last pages wait on it for over a second
+        monkeypatch.setattr(
+            URLRequest,
+            "rate_limiter",
+            RateLimiter(rules=[], default_rate=2, default_capacity=1),
+        )
+        node_health = NodeHealth(min_samples=3, min_speed=1024 * 1024)
+        downloader = PageDownloader(max_workers=5, node_health=node_health)
+        tasks = downloader.download_pages(make_tasks(page_server, paths, str(tmp_path)))
+        downloader.close()
+
+        assert all(task.status == "downloaded" for task in tasks)
+        host = tasks[0].host
+        assert not node_health.is_degraded(host)
+        assert node_health.stats()[host]["average_latency"] < 0.3
+
+
+class TestJobSettings:
+    """
+    Class for testing the settings given on the command line or in a job file
+    """
+
+    def test_DataSaverFlag(self, packer_settings):
+        args = packer.get_job_parser().parse_args(["--manga-id", "m1", "--data-saver"])
+        job = packer.get_job_from_args(args)
+        assert job["data_saver"] is True
+
+        packer.apply_job_settings(job)
+        packer.setup()
+        assert packer.image_mode == "data-saver"
+        assert packer.lease_prefetcher.data_saver
+        assert packer.get_cbz_comment(packer.image_mode).endswith("data-saver")
+
+    def test_DataSaverFromJobFile(self, packer_settings, tmp_path):
+        job_path = tmp_path / "job.json"
+        job_path.write_text(json.dumps({"data_saver": True, "series": []}))
+        args = packer.get_job_parser().parse_args(["--job", str(job_path)])
+        job = packer.get_job_from_args(args)
+        assert job["data_saver"] is True
+
+        packer.apply_job_settings(job)
+        packer.setup()
+        assert packer.image_mode == "data-saver"
+        assert packer.lease_prefetcher.data_saver
+
+    def test_DefaultImages(self, packer_settings):
+        args = packer.get_job_parser().parse_args(["--manga-id", "m1"])
+        packer.apply_job_settings(packer.get_job_from_args(args))
+        packer.setup()
+        assert packer.image_mode == "data"
+        assert not packer.lease_prefetcher.data_saver
+
+
+# (manga_id, title, altTitles, originalLanguage) of the series the title tests search
+TITLES = [
+    ("m1", "Gal Assistant", ["Gyaru Assistant", "ギャルアシスタント"], "ja"),
+    ("m2", "Gal Assistants!", [], "ja"),
+    ("m3", "The Gal Assistant", [], "ko"),
+    ("m4", "Fate/Zero", ["Fate Zero", "フェイト/ゼロ"], "ja"),
+    ("m5", "Kaguya-sama: Love Is War", ["Kaguya-sama wa Kokurasetai"], "ja"),
+    ("m6", "Kaguya sama  Love is War!", [], "ja"),
+    ("m7", "Spy x Family", ["SPY×FAMILY"], "ja"),
+    ("m8", "Solo Leveling", ["Only I Level Up"], "ko"),
+    ("m9", "", ["Gal  Assistant"], "ja"),
+]
+
+QUERIES = [
+    "Gal Assistant",
+    "gal assistants",
+    "Fate Zero",
+    "Kaguya-sama - Love Is War",
+    "Spy x Family",
+    "Only I level up!",
+    "An Unknown Series",
+]
+
+
+def make_manga(manga_id, title, alt_titles, original_language="ja"):
+    manga = Manga()
+    manga.manga_id = manga_id
+    manga.title = {"en": title} if title else None
+    manga.altTitles = [{"en": alt_title} for alt_title in alt_titles]
+    manga.originalLanguage = original_language
+    return manga
+
+
+def make_series():
+    return [make_manga(*entry) for entry in TITLES]
+
+
+def get_naive_matches(series, query, required_score):
+    """
+    The matching of the per series similarity loop the packer had before
+    the TitleMatcher: {manga_id: best score of its titles}
+    """
+    matches = {}
+    for manga in series:
+        titles = [manga.title] + manga.altTitles if manga.title else manga.altTitles
+        scores = [
+            naive_score(next(iter(title.values())), query) for title in titles if title
+        ]
+        best = max(scores, default=0.0)
+        if best >= required_score:
+            matches[manga.manga_id] = best
+    return matches
+
+
+class TestTitleMatcher:
+    """
+    Class for testing the pruned title matcher against the naive similarity loop
+    """
+
+    @pytest.mark.parametrize("required_score", [0.9790, 0.85, 0.6])
+    @pytest.mark.parametrize("query", QUERIES)
+    def test_SameMatchesAsNaiveLoop(self, query, required_score):
+        series = make_series()
+        naive_matches = get_naive_matches(series, query, required_score)
+        matches = TitleMatcher(query, required_score).rank(series)
+
+        assert {manga.manga_id: score for manga, score, _ in matches} == (
+            pytest.approx(naive_matches)
+        )
+        scores = [score for _, score, _ in matches]
+        assert scores == sorted(scores, reverse=True)
+
+    @pytest.mark.parametrize("query", QUERIES)
+    def test_FilterSeriesBySimilarityScore(self, packer_settings, query):
+        series = make_series()
+        required_score = packer.requried_similarity_score
+        naive_matches = get_naive_matches(series, query, required_score)
+        filtered = packer.filter_series_by_similarity_score(
+            series, query, required_score
+        )
+
+        assert {manga.manga_id for manga in filtered} == set(naive_matches)
+        # the best match first, the search order breaks the ties
+        assert [manga.manga_id for manga in filtered] == sorted(
+            naive_matches, key=lambda manga_id: -naive_matches[manga_id]
+        )
+
+
+class TestTitleIndex:
+    """
+    Class for testing the lookups and the persistence of the title index
+    """
+
+    def make_index(self, tmp_path, **kwargs):
+        index = TitleIndex(str(tmp_path / "titles.json"), **kwargs)
+        index.add_series(make_series())
+        return index
+
+    def test_ExactHit(self, tmp_path):
+        index = self.make_index(tmp_path)
+        manga, score = index.lookup("Fate Zero", 0.9790)
+        assert manga.manga_id == "m4" and score == 1.0
+        manga, score = index.lookup("only i level up", 0.9790)
+        assert manga.manga_id == "m8" and manga.originalLanguage == "ko"
+        assert index.stats()["hits"] == 2
+
+    def test_NearMissBelowRequiredScore(self, tmp_path):
+        index = self.make_index(tmp_path)
+        assert index.lookup("Spy x Familly", 0.9790) is None
+        manga, score = index.lookup("Spy x Familly", 0.9)
+        assert manga.manga_id == "m7" and 0.9 <= score < 1.0
+        assert index.stats()["misses"] == 1
+
+    def test_TrigramThreshold(self, tmp_path):
+        # the title passes the required score, but shares too few trigrams to be scored
+        index = self.make_index(tmp_path, min_shared_trigrams=1.0)
+        assert index.lookup("Spy x Familly", 0.9) is None
+        assert index.lookup("Spy x Family", 0.9)[0].manga_id == "m7"
+
+    def test_EqualScoresAreAmbiguous(self, tmp_path):
+        # m1 has the title and m9 the alt title "Gal Assistant"
+        index = self.make_index(tmp_path)
+        assert index.lookup("Gal Assistant", 0.9790) is None
+        # the original language leaves only one of them
+        index.add_manga(make_manga("m9", "", ["Gal  Assistant"], "zh"))
+        manga, _ = index.lookup("Gal Assistant", 0.9790, original_language="ja")
+        assert manga.manga_id == "m1"
+
+    def test_SaveAndLoad(self, tmp_path):
+        index = self.make_index(tmp_path)
+        index.save()
+        loaded = TitleIndex(index.path)
+
+        assert loaded.stats()["series"] == len(TITLES)
+        assert loaded.stats()["titles"] == index.stats()["titles"]
+        manga, _ = loaded.lookup("Kaguya sama wa Kokurasetai", 0.9790)
+        assert manga.manga_id == "m5"
+        assert manga.title == {"en": "Kaguya-sama: Love Is War"}
+
+        # a renamed series is found by its new title only, once saved again
+        loaded.add_manga(make_manga("m4", "Fate Zero Remastered", []))
+        loaded.save()
+        loaded = TitleIndex(index.path)
+        assert loaded.lookup("Fate Zero", 0.9790) is None
+        assert loaded.lookup("Fate Zero Remastered", 0.9790)[0].manga_id == "m4"
+
+    def test_InvalidFileStartsEmpty(self, tmp_path):
+        (tmp_path / "titles.json").write_text("{")
+        index = TitleIndex(str(tmp_path / "titles.json"))
+        assert index.stats()["series"] == 0
+
+
+def get_manga_json(manga_id, title, alt_titles, original_language="ja"):
+    """
+    Returns the JSON MangaDex sends for a series
+    """
+    return {
+        "id": manga_id,
+        "type": "manga",
+        "attributes": {
+            "title": {"en": title} if title else {},
+            "altTitles": [{"en": alt_title} for alt_title in alt_titles],
+            "description": {},
+            "links": {},
+            "originalLanguage": original_language,
+            "lastVolume": None,
+            "lastChapter": None,
+            "publicationDemographic": None,
+            "status": "ongoing",
+            "year": None,
+            "contentRating": "safe",
+            "tags": [],
+            "createdAt": "2020-01-01T00:00:00+00:00",
+            "updatedAt": "2020-01-01T00:00:00+00:00",
+        },
+        "relationships": [],
+    }
+
+
+class TestBatchResolver:
+    """
+    Class for testing the batch resolver, the searches don't leave the process
+    """
+
+    @pytest.fixture
+    def searches(self, monkeypatch, packer_settings, tmp_path):
+        searches = []
+
+        def request_url(url, method, timeout=5, params=None, headers=None):
+            searches.append(params)
+            data = [get_manga_json(*entry) for entry in TITLES]
+            return {"data": data, "limit": 100, "offset": 0, "total": len(data)}
+
+        monkeypatch.setattr(URLRequest, "request_url", request_url)
+        packer.title_index = TitleIndex(str(tmp_path / "titles.json"))
+        return searches
+
+    def test_ReadTitles(self, tmp_path):
+        titles_path = tmp_path / "titles.txt"
+        titles_path.write_text(
+            "Gal Assistant\n"
+            "# a comment\n"
+            "\n"
+            "  gal assistant!  \n"
+            "Kaguya-sama: Love Is War\n"
+            "Kaguya-sama - Love Is War\n",
+            encoding="utf-8",
+        )
+        assert batch_resolver.read_titles(str(titles_path)) == [
+            "Gal Assistant",
+            "Kaguya-sama: Love Is War",
+        ]
+
+    def test_ResolveFromSearchThenIndex(self, searches):
+        resolution = batch_resolver.resolve_title(Api(), "Spy x Family", 0.9790, "ja")
+        assert resolution["manga_id"] == "m7"
+        assert resolution["source"] == "search"
+        assert resolution["title"] == "Spy x Family"
+        assert len(searches) == 1
+        assert searches[0]["title"] == "Spy x Family"
+        assert searches[0]["originalLanguage[]"] == ["ja"]
+
+        # the search response went into the title index
+        resolution = batch_resolver.resolve_title(Api(), "SPY×FAMILY", 0.9790, "ja")
+        assert resolution["manga_id"] == "m7"
+        assert resolution["source"] == "index"
+        assert len(searches) == 1
+
+    def test_NoMatch(self, searches):
+        resolution = batch_resolver.resolve_title(
+            Api(), "An Unknown Series", 0.9790, "ja"
+        )
+        assert resolution["manga_id"] is None
+        assert resolution["source"] == "search"
+        assert resolution["candidates"] == 0
+
+    def test_MappingReadByJob(self, searches, tmp_path):
+        resolutions = [
+            batch_resolver.resolve_title(Api(), title, 0.9790, "ja")
+            for title in ["Fate Zero", "An Unknown Series", "Only I Level Up"]
+        ]
+        mapping_path = str(tmp_path / "mapping" / "series_mapping.json")
+        batch_resolver.write_mapping(mapping_path, resolutions)
+
+        assert packer.get_job_series({"mapping": mapping_path}) == [
+            {"manga_id": "m4", "name": "Fate Zero"},
+            {"manga_id": "m8", "name": "Only I Level Up"},
+        ]
+        assert packer.get_job_series({"mapping": mapping_path, "shard": "1/2"}) == [
+            {"manga_id": "m8", "name": "Only I Level Up"}
+        ]
+
+
+class TestSeriesName:
+    """
+    Class for testing the series names used for the folders and CBZs
+    """
+
+    @pytest.mark.parametrize(
+        "name, expected",
+        [
+            ("Gal Assistant", "Gal Assistant"),
+            ("Kaguya-sama: Love Is War", "Kaguya-sama -  Love Is War"),
+            ("Fate/Zero", "Fate-Zero"),
+            ("AC\\DC", "AC-DC"),
+            ('Who? Is *that* <girl> | "her"', "Who Is that girl  her"),
+            ("Dr. Stone...", "Dr. Stone"),
+        ],
+    )
+    def test_SanitizeSeriesName(self, name, expected):
+        assert packer.sanitize_series_name(name) == expected
+
+    def test_MangaIdEntryFolder(self, packer_settings, tmp_path):
+        class FakeApi:
+            def view_manga_by_id(self, manga_id):
+                return make_manga(manga_id, 'Fate/Zero: "Act" <1>?', [])
+
+        packer.output_path = str(tmp_path)
+        manga, name = packer.resolve_job_series(FakeApi(), {"manga_id": "m4"})
+        assert name == "Fate-Zero -  Act 1"
+
+        packer.create_series_folder(name)
+        folder_name = packer.get_folder_name(name, 1, packer.source)
+        os.mkdir(os.path.join(tmp_path, name, folder_name))
+        assert os.listdir(tmp_path) == [name]
+        assert os.listdir(tmp_path / name) == [folder_name]
+
+        # a name made only of invalid characters falls back to the manga id
+        FakeApi.view_manga_by_id = lambda self, manga_id: make_manga(
+            manga_id, "???", []
+        )
+        assert packer.resolve_job_series(FakeApi(), {"manga_id": "m4"})[1] == "m4"
+
+
+class TestSeriesScheduler:
+    """
+    Class for testing the scheduling of the volumes of several series, with stub series
+    """
+
+    @pytest.fixture
+    def packed(self, monkeypatch, packer_settings, tmp_path):
+        """
+        Stubs the planning and the download of the series, every volume is packed
+        from a one page folder. Returns the (series, volume, thread, prefetcher) packed
+        """
+        volume_counts = {"A": 3, "B": 2, "C": 1, "D": 0}
+        packed = []
+        lock = threading.Lock()
+
+        def resolve_job_series(api, entry):
+            return make_manga(entry["name"], entry["name"], []), entry["name"]
+
+        def plan_series(api, manga_series, only_these_volumes=None):
+            count = volume_counts[manga_series.manga_id]
+            return [packer.Volume(float(number)) for number in range(1, count + 1)]
+
+        def pack_volume(
+            api,
+            manga_series,
+            series_name,
+            volume,
+            packing_pipeline,
+            download_times,
+            prefetcher=None,
+        ):
+            folder_name = f"{series_name} v{int(volume.volume_number)}"
+            folder_path = tmp_path / folder_name
+            os.mkdir(folder_path)
+            (folder_path / "p001.jpg").write_bytes(os.urandom(64))
+            with lock:
+                packed.append(
+                    (
+                        series_name,
+                        volume.volume_number,
+                        threading.get_ident(),
+                        prefetcher,
+                    )
+                )
+                download_times[folder_name] = 0.0
+            packing_pipeline.submit(
+                folder_name, str(folder_path), ["p001.jpg"], f"{folder_path}.cbz"
+            )
+            return True
+
+        monkeypatch.setattr(packer, "resolve_job_series", resolve_job_series)
+        monkeypatch.setattr(packer, "plan_series", plan_series)
+        monkeypatch.setattr(packer, "create_series_folder", lambda series_name: None)
+        monkeypatch.setattr(packer, "pack_volume", pack_volume)
+        monkeypatch.setattr(packer, "pack_with_processes", False)
+        return packed
+
+    def test_VolumesInterleave(self, packed, tmp_path):
+        scheduler = series_scheduler.SeriesScheduler(workers=1, max_active_series=3)
+        for name in ["A", "B", "C", "D"]:
+            scheduler.add({"name": name})
+        states = scheduler.run()
+
+        # every active series gets a volume before any gets another one,
+        # D only starts once C is done and has nothing to pack
+        assert [(name, int(number)) for name, number, _, _ in packed] == [
+            ("A", 1),
+            ("B", 1),
+            ("C", 1),
+            ("A", 2),
+            ("B", 2),
+            ("A", 3),
+        ]
+        assert {state.label: state.packed for state in states} == {
+            "A": 3,
+            "B": 2,
+            "C": 1,
+            "D": 0,
+        }
+        assert [state.ok for state in states if state.label == "D"] == [False]
+
+    def test_PrefetchersAndPipeline(self, packed, tmp_path, monkeypatch):
+        shutdowns = []
+        shutdown = PackingPipeline.shutdown
+
+        def count_shutdown(pipeline):
+            shutdowns.append(pipeline)
+            shutdown(pipeline)
+
+        monkeypatch.setattr(PackingPipeline, "shutdown", count_shutdown)
+        closed = []
+        close = LeasePrefetcher.close
+
+        def count_close(prefetcher):
+            closed.append(prefetcher)
+            close(prefetcher)
+
+        monkeypatch.setattr(LeasePrefetcher, "close", count_close)
+        scheduler = series_scheduler.SeriesScheduler(workers=3)
+        for name in ["A", "B", "C"]:
+            scheduler.add({"name": name})
+        states = scheduler.run()
+
+        assert all(state.ok for state in states)
+        # one prefetcher per worker thread, all of them closed
+        prefetchers = {}
+        for _, _, thread, prefetcher in packed:
+            assert prefetchers.setdefault(thread, prefetcher) is prefetcher
+        assert len(set(map(id, prefetchers.values()))) == len(prefetchers)
+        assert sorted(map(id, closed)) == sorted(map(id, prefetchers.values()))
+        # every queued volume was packed before the single shutdown
+        assert shutdowns == [scheduler.packing_pipeline]
+        assert sorted(
+            name for name in os.listdir(tmp_path) if name.endswith(".cbz")
+        ) == [
+            "A v1.cbz",
+            "A v2.cbz",
+            "A v3.cbz",
+            "B v1.cbz",
+            "B v2.cbz",
+            "C v1.cbz",
+        ]
+
+
+# a /manga/{id}/aggregate response, the chapters without a volume are under "none"
+AGGREGATE = {
+    "none": {
+        "volume": "none",
+        "count": 2,
+        "chapters": {
+            "10.5": {"chapter": "10.5", "id": "c10.5", "others": [], "count": 1},
+            "none": {"chapter": "none", "id": "oneshot", "others": [], "count": 1},
+        },
+    },
+    "1": {
+        "volume": "1",
+        "count": 2,
+        "chapters": {
+            "1": {"chapter": "1", "id": "c1", "others": ["c1-other"], "count": 2},
+            "2": {"chapter": "2", "id": "c2", "others": [], "count": 1},
+        },
+    },
+    "2": {
+        "volume": "2",
+        "count": 2,
+        "chapters": {
+            "3": {"chapter": "3", "id": "c3", "others": [], "count": 1},
+            "4": {"chapter": "4", "id": "c4", "others": [], "count": 1},
+        },
+    },
+    # a volume with a single chapter comes as a list
+    "3": {
+        "volume": "3",
+        "count": 1,
+        "chapters": [{"chapter": "5", "id": "c5", "others": [], "count": 1}],
+    },
+}
+
+
+class TestAggregatePlan:
+    """
+    Class for testing the volume planning from the aggregate endpoint
+    """
+
+    def get_volumes(self):
+        chapters = packer.plan_chapters_from_aggregate(AGGREGATE)
+        return packer.group_chapters_by_volume(packer.convert_volume_to_float(chapters))
+
+    def test_GroupByVolume(self):
+        volumes = self.get_volumes()
+
+        # the unnumbered oneshot can't be named and is skipped,
+        # the chapters without a volume end up in volume 0
+        assert [
+            (volume.volume_number, [chapter.chapter_id for chapter in volume.chapters])
+            for volume in volumes
+        ] == [
+            (0.0, ["c10.5"]),
+            (1.0, ["c1", "c2"]),
+            (2.0, ["c3", "c4"]),
+            (3.0, ["c5"]),
+        ]
+        assert [chapter.chapter for chapter in volumes[1].chapters] == [1.0, 2.0]
+        assert volumes[0].chapters[0].chapter == 10.5
+
+    def test_FetchVolumeChapters(self):
+        requests = []
+
+        class FakeApi:
+            def chapter_list(self, ids, limit, contentRating):
+                requests.append(ids)
+                chapters = []
+                # c4 was deleted since the aggregate
+                for chapter_id in ids:
+                    if chapter_id == "c4":
+                        continue
+                    chapter = Chapter()
+                    chapter.chapter_id = chapter_id
+                    chapter.title = f"Title {chapter_id}"
+                    chapter.volume = None
+                    chapters.append(chapter)
+                return chapters
+
+        volumes = packer.fetch_volume_chapters(FakeApi(), self.get_volumes()[1:])
+
+        assert requests == [["c1", "c2", "c3", "c4", "c5"]]
+        assert [volume.volume_number for volume in volumes] == [1.0, 3.0]
+        assert [chapter.title for chapter in volumes[0].chapters] == [
+            "Title c1",
+            "Title c2",
+        ]
+        # the details keep the volume of the plan
+        assert [chapter.volume for chapter in volumes[1].chapters] == [3.0]
@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+from collections import Counter
+
+from mangadex import Manga
+
+from title_matcher import TitleMatcher, normalize_title
+
+# Local index of the series seen in the search responses,
+# resolves the known titles without searching MangaDex again
+
+
+def get_trigrams(title):
+    """
+    Returns the trigrams of a normalized title, padded so short titles have some
+    """
+    padded = f"  {title} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    The titles and altTitles of every series seen, by manga id, kept in a JSON file.
+    The normalized titles are indexed by trigram, a lookup only scores the series
+    sharing enough trigrams with the query.
+    """
+
+    def __init__(self, path, min_shared_trigrams=0.5):
+        self.path = path
+        # the share of the query trigrams a title needs to be scored
+        self.min_shared_trigrams = min_shared_trigrams
+        self.hits = 0
+        self.misses = 0
+        # {manga_id: {"title", "altTitles", "originalLanguage"}}
+        self._mangas = {}
+        # {normalized title: {manga_id}}
+        self._titles = {}
+        # {trigram: {normalized title}}
+        self._trigrams = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                mangas = json.load(f)["mangas"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"\tInvalid title index, starting a new one: {e}")
+            return
+        for manga_id, entry in mangas.items():
+            self._index(manga_id, entry)
+
+    def _index(self, manga_id, entry):
+        self._mangas[manga_id] = entry
+        for title in self.get_titles(manga_id):
+            if title not in self._titles:
+                self._titles[title] = set()
+                for trigram in get_trigrams(title):
+                    self._trigrams.setdefault(trigram, set()).add(title)
+            self._titles[title].add(manga_id)
+
+    def get_titles(self, manga_id):
+        """
+        Returns the normalized titles of an indexed series
+        """
+        entry = self._mangas[manga_id]
+        titles = [entry["title"]] + entry["altTitles"]
+        return [
+            normalize_title(next(iter(title.values()))) for title in titles if title
+        ]
+
+    def add_manga(self, manga):
+        """
+        Indexes the titles of a Manga, or updates them
+        """
+        entry = {
+            "title": manga.title,
+            "altTitles": manga.altTitles,
+            "originalLanguage": manga.originalLanguage,
+        }
+        with self._lock:
+            if self._mangas.get(manga.manga_id) == entry:
+                return
+            if manga.manga_id in self._mangas:
+                self._remove(manga.manga_id)
+            self._index(manga.manga_id, entry)
+            self._dirty = True
+
+    def add_series(self, series):
+        """
+        Indexes every Manga of a search response
+        """
+        for manga in series:
+            self.add_manga(manga)
+
+    def _remove(self, manga_id):
+        for title in self.get_titles(manga_id):
+            manga_ids = self._titles.get(title)
+            if manga_ids is None:
+                continue
+            manga_ids.discard(manga_id)
+            if not manga_ids:
+                del self._titles[title]
+                for trigram in get_trigrams(title):
+                    self._trigrams[trigram].discard(title)
+        del self._mangas[manga_id]
+
+    def get_manga(self, manga_id):
+        """
+        Returns a Manga with the indexed titles of a series
+        """
+        entry = self._mangas[manga_id]
+        manga = Manga()
+        manga.manga_id = manga_id
+        manga.title = entry["title"]
+        manga.altTitles = entry["altTitles"]
+        manga.originalLanguage = entry["originalLanguage"]
+        return manga
+
+    def _candidates(self, query):
+        if query in self._titles:
+            return [query]
+        trigrams = get_trigrams(query)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        required = len(trigrams) * self.min_shared_trigrams
+        return [title for title, count in shared.items() if count >= required]
+
+    def lookup(self, query, required_score, original_language=None):
+        """
+        Returns the (Manga, score) of the series best matching the query,
+        or None when no indexed title is similar enough or the best score is shared
+        by several series, those are left to the search
+        """
+        matcher = TitleMatcher(query, required_score)
+        scores = {}
+        with self._lock:
+            for title in self._candidates(matcher.query):
+                score = matcher.score(title)
+                if not score:
+                    continue
+                for manga_id in self._titles[title]:
+                    language = self._mangas[manga_id]["originalLanguage"]
+                    if original_language and language != original_language:
+                        continue
+                    scores[manga_id] = max(scores.get(manga_id, 0.0), score)
+
+            best_score = max(scores.values(), default=0.0)
+            best = [
+                manga_id for manga_id, score in scores.items() if score == best_score
+            ]
+            if len(best) != 1:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self.get_manga(best[0]), best_score
+
+    def save(self):
+        """
+        Writes the index atomically (temp file + rename), if it changed
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"mangas": self._mangas}, f)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+
+    def stats(self):
+        return {
+            "series": len(self._mangas),
+            "titles": len(self._titles),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,150 @@
+import random
+import string
+import time
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import regex as re
+
+# Fuzzy title matching used to pick a series from the search results
+
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+
+@lru_cache(maxsize=65536)
+def normalize_title(title):
+    """
+    Removes the punctuation and the duplicate spaces of a title and lowercases it.
+    Cached, the same titles come back in every search
+    """
+    title = title.translate(PUNCTUATION_TABLE).strip()
+    return re.sub(" +", " ", title).lower()
+
+
+def get_manga_titles(manga):
+    """
+    Returns the title values of a manga, the main title first then the altTitles
+    """
+    titles = [manga.title] + manga.altTitles if manga.title else manga.altTitles
+    return [next(iter(title.values())) for title in titles if title]
+
+
+class TitleMatcher:
+    """
+    Scores titles against a query with SequenceMatcher.ratio().
+    The query is normalized once, and every candidate is checked against
+    cheap upper bounds of the ratio (the lengths, real_quick_ratio, quick_ratio)
+    before computing the full ratio, most candidates never get that far.
+    Scores below required_score are reported as 0.
+    """
+
+    def __init__(self, query, required_score):
+        self.query = normalize_title(query)
+        self.required_score = required_score
+        # SequenceMatcher caches what it knows about the second sequence
+        self._matcher = SequenceMatcher(None)
+        self._matcher.set_seq2(self.query)
+        self.compared = 0
+        self.pruned = 0
+
+    def score(self, title):
+        candidate = normalize_title(title)
+        if not candidate or not self.query:
+            return 0.0
+        self.compared += 1
+
+        # ratio() is at most 2 * shortest / (sum of the lengths)
+        length_bound = (
+            2.0
+            * min(len(candidate), len(self.query))
+            / (len(candidate) + len(self.query))
+        )
+        if length_bound < self.required_score:
+            self.pruned += 1
+            return 0.0
+
+        self._matcher.set_seq1(candidate)
+        if (
+            self._matcher.real_quick_ratio() < self.required_score
+            or self._matcher.quick_ratio() < self.required_score
+        ):
+            self.pruned += 1
+            return 0.0
+
+        score = self._matcher.ratio()
+        return score if score >= self.required_score else 0.0
+
+    def rank(self, series):
+        """
+        Returns the (manga, score, title) of every manga with a title
+        matching the query, best score first
+        """
+        matches = []
+        for manga in series:
+            best = max(
+                ((self.score(title), title) for title in get_manga_titles(manga)),
+                default=(0.0, None),
+                key=lambda match: match[0],
+            )
+            if best[0] > 0:
+                matches.append((manga, best[0], best[1]))
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+
+def naive_score(title, query):
+    """
+    The scoring the packer used before, for the benchmark
+    """
+    title = re.sub(
+        " +", " ", title.translate(str.maketrans("", "", string.punctuation)).strip()
+    )
+    query = re.sub(
+        " +", " ", query.translate(str.maketrans("", "", string.punctuation)).strip()
+    )
+    if title == "" or query == "":
+        return 0.0
+    return SequenceMatcher(None, title.lower(), query.lower()).ratio()
+
+
+def run_benchmark(candidates=5000, titles_per_candidate=4, required_score=0.9790):
+    """
+    Times the naive scoring against the TitleMatcher over random candidate titles
+    """
+    random.seed(0)
+    words = [
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9)))
+        for _ in range(2000)
+    ]
+    titles = [
+        " ".join(random.choices(words, k=random.randint(1, 8))).title() + "!"
+        for _ in range(candidates * titles_per_candidate)
+    ]
+    query = titles[len(titles) // 2]
+
+    start = time.perf_counter()
+    naive_matches = [
+        title for title in titles if naive_score(title, query) >= required_score
+    ]
+    naive_seconds = time.perf_counter() - start
+
+    normalize_title.cache_clear()
+    matcher = TitleMatcher(query, required_score)
+    start = time.perf_counter()
+    matches = [title for title in titles if matcher.score(title) > 0]
+    cold_seconds = time.perf_counter() - start
+
+    matcher = TitleMatcher(query, required_score)
+    start = time.perf_counter()
+    [title for title in titles if matcher.score(title) > 0]
+    warm_seconds = time.perf_counter() - start
+
+    print(f"{len(titles)} titles, query: {query}")
+    print(f"\tNaive: {naive_seconds:.3f}s, {len(naive_matches)} matches")
+    print(
+        f"\tTitleMatcher: {cold_seconds:.3f}s, {warm_seconds:.3f}s with cached titles, "
+        f"{len(matches)} matches, {matcher.pruned}/{matcher.compared} pruned"
+    )
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+
+# Download journal used to resume interrupted volume downloads
+
+
+def get_file_sha256(file_path, chunk_size=1024 * 1024):
+    """
+    Returns the sha256 hex digest of a file
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class VolumeJournal:
+    """
+    Manifest of the pages downloaded into a volume folder.
+    Every entry stores the chapter id, page url, file name, size, checksum and status.
+    image_mode records which images were downloaded, "data" or "data-saver".
+    The journal is rewritten atomically (temp file + rename) each time a page lands,
+    so a crash never leaves it half written.
+    """
+
+    FILENAME = ".journal.json"
+
+    def __init__(self, folder_path, image_mode="data"):
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, self.FILENAME)
+        self.image_mode = image_mode
+        self.pages = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, folder_path):
+        """
+        Loads the journal of a folder, returns None if there isn't a valid one
+        """
+        journal = cls(folder_path)
+        if not os.path.isfile(journal.path):
+            return None
+        try:
+            with open(journal.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            journal.pages = data["pages"]
+            journal.image_mode = data.get("image_mode", "data")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"\t\t\tInvalid journal: {e}")
+            return None
+        return journal
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"image_mode": self.image_mode, "pages": self.pages}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def record(self, filename, chapter_id, url, size, sha256, status="complete"):
+        """
+        Adds or replaces the entry of a page and saves the journal
+        """
+        with self._lock:
+            self.pages[filename] = {
+                "chapter_id": chapter_id,
+                "url": url,
+                "filename": filename,
+                "size": size,
+                "sha256": sha256,
+                "status": status,
+            }
+            self._save()
+
+    def is_complete(self, filename):
+        entry = self.pages.get(filename)
+        return bool(entry) and entry["status"] == "complete"
+
+    def verify(self):
+        """
+        Checks every complete page against its size and checksum,
+        drops the entries of missing or corrupted files and returns the verified file names
+        """
+        verified = []
+        with self._lock:
+            for filename, entry in list(self.pages.items()):
+                file_path = os.path.join(self.folder_path, filename)
+                if (
+                    entry["status"] == "complete"
+                    and os.path.isfile(file_path)
+                    and os.path.getsize(file_path) == entry["size"]
+                    and get_file_sha256(file_path) == entry["sha256"]
+                ):
+                    verified.append(filename)
+                else:
+                    self.pages.pop(filename)
+            self._save()
+        return verified
@@ -0,0 +1,157 @@
+import json
+import os
+
+# Records of the downloaded volumes, used to pack them again from the page store
+
+
+class VolumeRecord:
+    """
+    Everything needed to pack a volume again without the network:
+    the series, the chapters with the page store keys of their pages, and the cover.
+    """
+
+    def __init__(
+        self,
+        manga_id,
+        series_name,
+        volume_number,
+        cover_link=None,
+        cover_key=None,
+        chapters=None,
+        image_mode="data",
+        cover_sha256=None,
+    ):
+        self.manga_id = manga_id
+        self.series_name = series_name
+        self.volume_number = volume_number
+        self.cover_link = cover_link
+        self.cover_key = cover_key
+        self.cover_sha256 = cover_sha256
+        # [{"chapter_id", "chapter", "title", "pages": [{"key", "extension", "sha256"}]}]
+        self.chapters = chapters or []
+        # "data" or "data-saver", the images the pages were downloaded as
+        self.image_mode = image_mode
+
+    @classmethod
+    def from_tasks(
+        cls,
+        manga_id,
+        series_name,
+        volume,
+        cover_link,
+        cover_key,
+        volume_tasks,
+        image_mode="data",
+        cover_sha256=None,
+    ):
+        """
+        Builds the record of a volume from its downloaded page tasks
+        """
+        chapters = []
+        for chapter in volume.chapters:
+            tasks = sorted(
+                [
+                    task
+                    for task in volume_tasks
+                    if task.chapter_id == chapter.chapter_id
+                ],
+                key=lambda task: task.index,
+            )
+            chapters.append(
+                {
+                    "chapter_id": chapter.chapter_id,
+                    "chapter": chapter.chapter,
+                    "title": chapter.title,
+                    "pages": [
+                        {
+                            "key": task.key,
+                            "extension": task.url.split(".")[-1],
+                            "sha256": task.sha256,
+                        }
+                        for task in tasks
+                    ],
+                }
+            )
+        return cls(
+            manga_id,
+            series_name,
+            volume.volume_number,
+            cover_link=cover_link,
+            cover_key=cover_key,
+            chapters=chapters,
+            image_mode=image_mode,
+            cover_sha256=cover_sha256,
+        )
+
+    @property
+    def page_count(self):
+        return sum(len(chapter["pages"]) for chapter in self.chapters)
+
+    def to_dict(self):
+        return {
+            "manga_id": self.manga_id,
+            "series_name": self.series_name,
+            "volume_number": self.volume_number,
+            "cover_link": self.cover_link,
+            "cover_key": self.cover_key,
+            "cover_sha256": self.cover_sha256,
+            "chapters": self.chapters,
+            "image_mode": self.image_mode,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["manga_id"],
+            data["series_name"],
+            data["volume_number"],
+            cover_link=data.get("cover_link"),
+            cover_key=data.get("cover_key"),
+            chapters=data["chapters"],
+            image_mode=data.get("image_mode", "data"),
+            cover_sha256=data.get("cover_sha256"),
+        )
+
+    def save(self, records_path):
+        """
+        Writes the record atomically (temp file + rename) and returns its path
+        """
+        path = get_record_path(records_path, self.manga_id, self.volume_number)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(temp_path, path)
+        return path
+
+
+def get_record_path(records_path, manga_id, volume_number):
+    """
+    Returns the path of the record of a volume: {records_path}/{manga_id}/v{volume_number}.json
+    """
+    return os.path.join(records_path, manga_id, f"v{volume_number}.json")
+
+
+def load_volume_records(records_path, manga_ids=None):
+    """
+    Loads the records of the given series, or of every series when manga_ids is empty.
+    Invalid records are skipped
+    """
+    records = []
+    if not os.path.isdir(records_path):
+        return records
+    for manga_id in sorted(os.listdir(records_path)):
+        if manga_ids and manga_id not in manga_ids:
+            continue
+        series_path = os.path.join(records_path, manga_id)
+        if not os.path.isdir(series_path):
+            continue
+        for file in sorted(os.listdir(series_path)):
+            if not file.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(series_path, file), "r", encoding="utf-8") as f:
+                    records.append(VolumeRecord.from_dict(json.load(f)))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"\tInvalid volume record {file}: {e}")
+    return records